@@ -2,11 +2,22 @@
 Anifetch package initialization module.
 """
 
-from .core import run_anifetch
-from .cli import parse_args
+import sys
+
+from . import timing  # noqa: F401, starts the clock of --profile as early as possible
 
 
 def main():
+    # a running `anifetch --daemon` can play the animation before anything heavy gets imported.
+    if "--daemon" not in sys.argv[1:]:
+        from .client import run_client
+
+        if run_client(sys.argv[1:]):
+            return
+
+    from .core import run_anifetch
+    from .cli import parse_args
+
     args = parse_args()
 
     run_anifetch(args)
@@ -4,53 +4,41 @@
 
 # Original code from https://github.com/mmlb/ansi2txt
 
+"""
+Anifetch ansi2txt module for removing escape sequences from text.
+
+This removes what ansi2txt removes: CSI sequences (ESC [, parameters and one final character),
+OSC sequences starting with a digit (up to BEL, or up to ESC and one more character), charset
+selection (ESC % and one character), any other ESC with the character after it, and a \\r right
+before a \\n. A lone \\r is kept. It's a single regex substitution, the character at a time
+scanner it replaces is kept as the reference in tools/ansi_strip_check.py.
+"""
+
+import re
+
+# one escape sequence, as ansi2txt reads it. A sequence cut off by the end of the text is removed too.
+ESCAPE_SEQUENCE = (
+    r"\x1b(?:"
+    r"\[[0-9;?]*[\s\S]?"  # CSI
+    r"|\][0-9][^\x07\x1b]*(?:\x07|\x1b[\s\S]?)?"  # OSC
+    r"|[\]%][\s\S]?"  # charset selection, or an OSC that doesn't start with a digit
+    r"|[\s\S]?"
+    r")"
+)
+
+_STRIP_RE = re.compile(ESCAPE_SEQUENCE + r"|\r(?=\n)")
+_SGR_RE = re.compile(r"\x1b\[[0-9;]*m")
+
 
 def ansi2txt(text: str) -> str:
-    EOF = ""
-    pos = 0
-    output = []
-
-    def getchar():
-        nonlocal pos
-        if pos >= len(text):
-            return EOF
-        ch = text[pos]
-        pos += 1
-        return ch
-
-    ch = None
-
-    while ch != EOF:
-        ch = getchar()
-
-        while ch == "\r":
-            ch = getchar()
-            if ch != "\n":
-                output.append("\r")
-
-        if ch == "\x1b":
-            ch = getchar()
-
-            if ch == "[":
-                ch = getchar()
-                while ch == ";" or ("0" <= ch <= "9") or ch == "?":
-                    ch = getchar()
-
-            elif ch == "]":
-                ch = getchar()
-                if ch != EOF and "0" <= ch <= "9":
-                    while True:
-                        ch = getchar()
-                        if ch == EOF or ord(ch) == 7:
-                            break
-                        elif ch == "\x1b":
-                            ch = getchar()
-                            break
-
-            elif ch == "%":
-                ch = getchar()
-
-        elif ch != EOF:
-            output.append(ch)
-
-    return "".join(output)
+    """The text without escape sequences and without the \\r of \\r\\n line endings."""
+    if "\x1b" not in text and "\r" not in text:
+        return text
+    return _STRIP_RE.sub("", text)
+
+
+def strip_sgr(text: str) -> str:
+    """The text without its colour and style (SGR) sequences, everything else is kept."""
+    if "\x1b" not in text:
+        return text
+    return _SGR_RE.sub("", text)
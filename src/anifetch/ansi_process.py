@@ -1,7 +1,8 @@
 from typing import Literal
 import re
+from .ansi2txt import strip_sgr
 from .utils import printable_len
-import wcwidth
+from .width import char_width
 
 
 _ANSI_RE = re.compile(r"(?:\x1B\[|\x9B)[\d;]*[A-Za-z]")
@@ -34,7 +35,7 @@ def _col_to_char(line: str, col: int) -> int:
         if m:
             i = m.end()  # ANSI sequences are invisible aka: skip, don't count
         else:
-            w = wcwidth.wcwidth(line[i])
+            w = char_width(line[i])
             c += max(w, 0)  # wcwidth returns -1 for non-printable
             i += 1
     return i
@@ -67,8 +68,7 @@ class Token:
 
 
 def strip_ansi_colors(lines: list[str]) -> list[str]:
-    ANSI_COLOR_RE = re.compile(r"\x1B\[[0-9;]*m")
-    return [ANSI_COLOR_RE.sub("", line) for line in lines]
+    return [strip_sgr(line) for line in lines]
 
 
 def tokenize_lines(lines: list[str]):
@@ -140,87 +140,307 @@ def tokenize_lines(lines: list[str]):
     return line_tokens_all
 
 
-def expand_ansi_movement_seq(lines: list[str]):
-    line_tokens_all = tokenize_lines(lines)
+def _expand_tokens_reference(line_tokens: list[Token]) -> str:
+    """
+    The original string splicing engine. Rescans the line from the start for every token, so it's
+    quadratic on long lines, but it defines the output: CellLine has to match it byte for byte.
+    Used for the lines without cursor movements and the ones CellLine can't model exactly, see _fits_cell_model.
+    """
+    line = ""
+    cur_col = 0  # visual terminal column
+    cur_char = 0  # string index into `line`
+    saved_col = 0  # for \x1b[s / \x1b[u
+
+    for token in line_tokens:
+        if token.type == "text":
+            text: str = token.value  # type: ignore[assignment]
+            vis_len = printable_len(text)
+
+            if cur_char > len(line):
+                line += " " * (cur_char - len(line))
+
+            tail_char = _col_to_char(line, cur_col + vis_len)
+
+            # Collect the SGR state active at tail_char so that border
+            # characters in the tail keep their original colour even when
+            # the inserted text ends with \x1b[0m.
+            state = _active_ansi_state(line, tail_char)
+
+            line = line[:cur_char] + text + state + line[tail_char:]
+            cur_col += vis_len
+            cur_char += len(text) + len(state)
+
+        elif token.type == "go_right":
+            wanted_col = cur_col + token.value  # type: ignore[operator]
+            needed = max(wanted_col - printable_len(line), 0)
+            line += " " * needed
+            cur_col = wanted_col
+            cur_char = _col_to_char(line, cur_col)
+
+        elif token.type == "go_left":
+            wanted_col = cur_col - token.value  # type: ignore[operator]
+            if wanted_col < 0:
+                needed = -wanted_col
+                line = " " * needed + line
+                cur_col = 0
+                cur_char = 0
+            else:
+                cur_col = wanted_col
+                cur_char = _col_to_char(line, cur_col)
 
-    result: list[str] = []
+        elif token.type == "go_to_column":
+            # escape seq is 1-based, convert to 0-based
+            wanted_col = token.value - 1  # type: ignore[operator]
+            needed = max(wanted_col - printable_len(line), 0)
+            if needed:
+                line += " " * needed
+            cur_col = wanted_col
+            cur_char = _col_to_char(line, cur_col)
 
-    for line_tokens in line_tokens_all:
-        line = ""
-        cur_col = 0  # visual terminal column
-        cur_char = 0  # string index into `line`
-        saved_col = 0  # for \x1b[s / \x1b[u
+        elif token.type == "sgr":
+            raw: str = token.value  # type: ignore[assignment]
+            line = line[:cur_char] + raw + line[cur_char:]
+            cur_char += len(raw)
 
-        for token in line_tokens:
-            if token.type == "text":
-                text: str = token.value  # type: ignore[assignment]
-                vis_len = printable_len(text)
+        elif token.type == "save_cursor":
+            saved_col = cur_col
 
-                if cur_char > len(line):
-                    line += " " * (cur_char - len(line))
+        elif token.type == "restore_cursor":
+            cur_col = saved_col
+            cur_char = _col_to_char(line, cur_col)
 
-                tail_char = _col_to_char(line, cur_col + vis_len)
+        elif token.type == "erase_line":
+            amount = token.value
+            if amount == 0:
+                line = line[:cur_char]
+            elif amount == 1:
+                line = " " * cur_char + line[cur_char:]
+            elif amount == 2:
+                line = ""
+                cur_col = 0
+                cur_char = 0
 
-                # Collect the SGR state active at tail_char so that border
-                # characters in the tail keep their original colour even when
-                # the inserted text ends with \x1b[0m.
-                state = _active_ansi_state(line, tail_char)
+    return line
 
-                line = line[:cur_char] + text + state + line[tail_char:]
-                cur_col += vis_len
-                cur_char += len(text) + len(state)
 
-            elif token.type == "go_right":
-                wanted_col = cur_col + token.value  # type: ignore[operator]
-                needed = max(wanted_col - printable_len(line), 0)
-                line += " " * needed
-                cur_col = wanted_col
-                cur_char = _col_to_char(line, cur_col)
+# escape sequences _col_to_char skips, a plain printable ascii run, or any other single character
+_CHUNK_RE = re.compile(r"((?:\x1B\[|\x9B)[\d;]*[A-Za-z])|([\x20-\x7e]+)|(.)", re.DOTALL)
+_SGR_RE = re.compile(r"(?:\x1B\[|\x9B)[\d;]*m")
+_ESC_SEQ_RE = re.compile(r"\x1B\[[\d;]*[A-Za-z]")
 
-            elif token.type == "go_left":
-                wanted_col = cur_col - token.value  # type: ignore[operator]
-                if wanted_col < 0:
-                    needed = -wanted_col
-                    line = " " * needed + line
-                    cur_col = 0
-                    cur_char = 0
-                else:
-                    cur_col = wanted_col
-                    cur_char = _col_to_char(line, cur_col)
-
-            elif token.type == "go_to_column":
-                # escape seq is 1-based, convert to 0-based
-                wanted_col = token.value - 1  # type: ignore[operator]
-                needed = max(wanted_col - printable_len(line), 0)
-                if needed:
-                    line += " " * needed
-                cur_col = wanted_col
-                cur_char = _col_to_char(line, cur_col)
 
-            elif token.type == "sgr":
-                raw: str = token.value  # type: ignore[assignment]
-                line = line[:cur_char] + raw + line[cur_char:]
-                cur_char += len(raw)
+def _fits_cell_model(line: str) -> bool:
+    """
+    Whether CellLine gives the same output as the reference engine for this line.
+    That's the case when printable_len and _col_to_char agree on the width of everything the line can
+    contain: every ESC starts a sequence _col_to_char skips (no \\x1b[?25l and the like), there are no
+    C1 control sequences, and no zero width joiners or VS16 selectors, which wcswidth measures as a sequence.
+    """
+    if "\x9b" in line or "\u200d" in line or "\ufe0f" in line:
+        return False
+    return line.count("\x1b") == len(_ESC_SEQ_RE.findall(line))
 
-            elif token.type == "save_cursor":
-                saved_col = cur_col
 
-            elif token.type == "restore_cursor":
-                cur_col = saved_col
-                cur_char = _col_to_char(line, cur_col)
+def _split_cells(text: str, pending: str) -> tuple[list[str], str]:
+    """
+    Splits text into one string per terminal column. A cell holds its character plus the zero width
+    things (escape sequences, combining marks...) that come before it, the column a wide character
+    spills into is an empty cell. pending is zero width text to put before the first character.
+    Returns the cells and the zero width text left after the last character.
+    """
+    cells: list[str] = []
+    for m in _CHUNK_RE.finditer(text):
+        escape, ascii_run, other = m.groups()
+        if escape:
+            pending += escape
+        elif ascii_run:
+            cells.append(pending + ascii_run[0])
+            cells.extend(ascii_run[1:])
+            pending = ""
+        else:
+            width = char_width(other)
+            if width <= 0:
+                pending += other
+            else:
+                cells.append(pending + other)
+                pending = ""
+                if width == 2:
+                    cells.append("")
+    return cells, pending
 
-            elif token.type == "erase_line":
-                amount = token.value
-                if amount == 0:
-                    line = line[:cur_char]
-                elif amount == 1:
-                    line = " " * cur_char + line[cur_char:]
-                elif amount == 2:
-                    line = ""
-                    cur_col = 0
-                    cur_char = 0
 
-        result.append(line)
+class CellLine:
+    """
+    A line being drawn by cursor movements, kept as one string per terminal column (see _split_cells)
+    plus the zero width text after the last column. Looking up a column is an index instead of a rescan
+    of the line, so every token costs about as much as the text it writes.
+
+    The cursor is tracked like the reference engine does: a column, and a position in the string, stored
+    as (cell, offset into that cell's zero width prefix). The two can disagree, e.g. after writing text
+    that ends in escape sequences, and that is reproduced on purpose.
 
-    # print("\n".join(result))
+    The SGR sequences before every cell are kept as a list of prefixes that is extended when it's looked
+    up and cut back where the cells change, so finding the colours in effect at the tail of a write
+    doesn't rescan the line.
+    """
+
+    def __init__(self):
+        self.cells: list[str] = []
+        self.trail = ""
+        self.cur_col = 0
+        self.cur = (0, 0)
+        self.saved_col = 0
+        # _sgr_prefix[i] is every SGR sequence in cells[:i], joined. Only valid for the cells in front of a change.
+        self._sgr_prefix: list[str] = [""]
+
+    def _changed_from(self, cell: int):
+        """Forgets the SGR prefixes that depend on cell or the cells after it."""
+        del self._sgr_prefix[cell + 1 :]
+
+    def _sgr_before(self, cell: int) -> str:
+        """Every SGR sequence in the cells before cell, joined."""
+        prefix = self._sgr_prefix
+        for i in range(len(prefix) - 1, cell):
+            text = self.cells[i]
+            # a single character can't hold an escape sequence
+            prefix.append(
+                prefix[-1] + "".join(_SGR_RE.findall(text))
+                if len(text) > 1
+                else prefix[-1]
+            )
+        return prefix[cell]
+
+    def position(self, col: int) -> tuple[int, int]:
+        """Where the reference engine's _col_to_char lands for col: right after the character that reaches it."""
+        n = len(self.cells)
+        if col <= 0:
+            return (0, 0)
+        if col > n:
+            return (n, len(self.trail))
+        if col < n and self.cells[col] == "":  # second half of a wide character
+            col += 1
+        return (col, 0)
+
+    def _before(self, pos: tuple[int, int]) -> str:
+        """The zero width text of pos's cell before pos."""
+        cell, offset = pos
+        if cell < len(self.cells):
+            return self.cells[cell][:offset]
+        return self.trail[:offset]
+
+    def _pad_to(self, col: int):
+        """Appends spaces (after the trailing zero width text, like the reference engine) until the line is col wide."""
+        needed = col - len(self.cells)
+        if needed > 0:
+            # only cells are added, the prefixes of the ones there already stay the same
+            self.cells.append(self.trail + " ")
+            self.cells.extend(" " * (needed - 1))
+            self.trail = ""
+
+    def write(self, text: str):
+        cells, pending = _split_cells(text, self._before(self.cur))
+        tail_cell, tail_offset = self.position(self.cur_col + len(cells))
+
+        # every SGR sequence before the tail is repeated after the text, so the tail keeps its colours.
+        pending += self._sgr_before(tail_cell)
+        if tail_cell == len(self.cells):
+            pending += "".join(_SGR_RE.findall(self.trail, 0, tail_offset))
+
+        cur_cell = self.cur[0]
+        self._changed_from(cur_cell)
+        if cur_cell <= tail_cell:
+            # the text replaces the cells up to the tail, usually as many as it has
+            if tail_cell < len(self.cells):
+                self.cells[tail_cell] = pending + self.cells[tail_cell]
+            else:
+                self.trail = pending + self.trail[tail_offset:]
+            self.cells[cur_cell:tail_cell] = cells
+        else:
+            # the tail starts before the cursor, then the text between them gets repeated, like in the reference engine.
+            rest = self.cells[tail_cell:]
+            if rest:
+                rest[0] = pending + rest[0]
+            else:
+                self.trail = pending + self.trail[tail_offset:]
+            self.cells[cur_cell:] = cells + rest
+        self.cur = (cur_cell + len(cells), len(pending))
+        self.cur_col += len(cells)
+
+    def go_to(self, col: int):
+        self._pad_to(col)
+        self.cur_col = col
+        self.cur = self.position(col)
+
+    def go_left(self, amount: int):
+        col = self.cur_col - amount
+        if col < 0:
+            self._changed_from(0)
+            self.cells[:0] = " " * -col
+            self.cur_col = 0
+            self.cur = (0, 0)
+        else:
+            self.cur_col = col
+            self.cur = self.position(col)
+
+    def erase(self, mode: int):
+        cell, offset = self.cur
+        self._changed_from(0 if mode else cell)
+        if mode == 0:
+            self.trail = self._before(self.cur)
+            del self.cells[cell:]
+        elif mode == 1:
+            # the reference engine blanks string positions, not columns
+            cur_char = len("".join(self.cells[:cell])) + offset
+            if cell < len(self.cells):
+                rest = [self.cells[cell][offset:]] + self.cells[cell + 1 :]
+            else:
+                rest = []
+                self.trail = self.trail[offset:]
+            self.cells[:] = [" "] * cur_char + rest
+            self.cur = (cur_char, 0)
+        elif mode == 2:
+            self.cells.clear()
+            self.trail = ""
+            self.cur_col = 0
+            self.cur = (0, 0)
+
+    def apply(self, token: Token):
+        if token.type == "text":
+            self.write(token.value)  # type: ignore[arg-type]
+        elif token.type == "go_right":
+            self.go_to(self.cur_col + token.value)  # type: ignore[operator]
+        elif token.type == "go_left":
+            self.go_left(token.value)  # type: ignore[arg-type]
+        elif token.type == "go_to_column":
+            self.go_to(token.value - 1)  # type: ignore[operator]
+        elif token.type == "save_cursor":
+            self.saved_col = self.cur_col
+        elif token.type == "restore_cursor":
+            self.cur_col = self.saved_col
+            self.cur = self.position(self.saved_col)
+        elif token.type == "erase_line":
+            self.erase(token.value)  # type: ignore[arg-type]
+
+    def render(self) -> str:
+        return "".join(self.cells) + self.trail
+
+
+def expand_ansi_movement_seq(lines: list[str], reference: bool = False) -> list[str]:
+    """
+    Applies the horizontal cursor movements (\\r, CUF/CUB/CHA, save/restore, erase in line) in each line,
+    so that the lines can be printed next to the animation. reference forces the reference engine.
+
+    Lines of only text and colours are a single pass for the reference engine, CellLine only pays off
+    once a line moves the cursor.
+    """
+    result: list[str] = []
+    for line, line_tokens in zip(lines, tokenize_lines(lines)):
+        moves = any(token.type not in ("text", "sgr") for token in line_tokens)
+        if reference or not moves or not _fits_cell_model(line):
+            result.append(_expand_tokens_reference(line_tokens))
+            continue
+        cell_line = CellLine()
+        for token in line_tokens:
+            cell_line.apply(token)
+        result.append(cell_line.render())
     return result
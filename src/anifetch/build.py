@@ -0,0 +1,377 @@
+"""
+Anifetch build module for rendering animations into the cache with ffmpeg and chafa.
+Only imported when something has to be rendered, a cache hit doesn't need any of it.
+"""
+
+import errno
+import os
+import pathlib
+import shutil
+import subprocess
+import sys
+import time
+from collections.abc import Mapping
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+
+from .cache import (
+    BUILD_INFO_NAME,
+    CHECKPOINT_NAME,
+    DECODED_FRAMES_DIR,
+    cache_lock,
+    checkpoint_frame,
+    get_build_path,
+    get_cache_path,
+    get_decoded_path,
+    get_dir_size,
+    load_frames,
+    publish_cache,
+    read_checkpoint,
+    read_manifest,
+    touch_cache,
+    write_build_info,
+    write_frame_pack,
+    write_manifest,
+)
+from .timing import span
+from .utils import (
+    CHAFA_COLORS,
+    check_codec_of_file,
+    extract_audio_from_file,
+    get_ext_from_codec,
+    get_file_fingerprint,
+    get_media_dimensions,
+    make_decode_args,
+    print_verbose,
+    probe_transparency,
+    split_to_frames,
+    threaded_chafa_frame_gen,
+)
+
+
+def decode_frames(
+    args,
+    VIDEO_DIR: pathlib.Path,
+    filename: pathlib.Path,
+    IS_IMAGE: bool,
+    IS_TRANSPARENT: bool,
+):
+    """Extracts the frames of the media into VIDEO_DIR with ffmpeg. Images are just copied."""
+    VIDEO_DIR.mkdir(exist_ok=True)
+
+    stdout = None if args.verbose else subprocess.DEVNULL
+    stderr = None if args.verbose else subprocess.PIPE
+
+    if IS_IMAGE:
+        shutil.copy(
+            args.filename, VIDEO_DIR / f"{0:05d}.{filename.suffix}"
+        )  # just a file named 00000.{suffix}
+    else:  # video or gif
+        try:
+            with span("ffmpeg split"):
+                result_ffmpeg = split_to_frames(
+                    args, VIDEO_DIR, IS_TRANSPARENT, stdout, stderr
+                )
+        except FileNotFoundError as e:
+            if e.errno == errno.ENOENT:
+                print(
+                    "The command Ffmpeg was not found. You probably forgot to install it. You can install it by going to here: https://ffmpeg.org/download.html\n If you installed Ffmpeg but it still doesn't work, check your PATH."
+                )
+                raise SystemExit
+            else:
+                raise
+        else:
+            if result_ffmpeg.returncode != 0:
+                print(f"[ERROR] ffmpeg failed: {result_ffmpeg.stderr}")
+                sys.exit(1)
+
+
+@contextmanager
+def decoded_frames(
+    args,
+    BASE_PATH: pathlib.Path,
+    filename: pathlib.Path,
+    IS_IMAGE: bool,
+    IS_TRANSPARENT: bool | None,
+    should_print_verbose: bool,
+):
+    """
+    Yields the directory with the decoded frames of the media, running ffmpeg first if they aren't cached yet.
+    The frames are kept for later renders of the same media with other chafa settings, they can't be evicted while the context is open.
+    """
+    DECODED_PATH = get_decoded_path(BASE_PATH)
+    DECODED_PATH.mkdir(exist_ok=True)
+    # probed here rather than on startup, a cache hit never gets this far
+    IS_TRANSPARENT = probe_transparency(filename, IS_TRANSPARENT)
+    decode_dict = make_decode_args(args, IS_TRANSPARENT)
+    decode_hash = decode_dict["hash"]
+
+    while True:
+        with cache_lock(DECODED_PATH, decode_hash, shared=True):
+            if read_manifest(DECODED_PATH, decode_hash) is not None:
+                touch_cache(DECODED_PATH, decode_hash)
+                yield get_cache_path(DECODED_PATH, decode_hash) / DECODED_FRAMES_DIR
+                return
+
+        with cache_lock(DECODED_PATH, decode_hash):
+            # Another anifetch may have decoded it while we were waiting for the lock.
+            if read_manifest(DECODED_PATH, decode_hash) is not None:
+                continue
+            print_verbose(should_print_verbose, "Decoding frames with ffmpeg")
+            BUILD_PATH = get_build_path(DECODED_PATH, decode_hash)
+            if BUILD_PATH.exists():
+                shutil.rmtree(BUILD_PATH)
+            os.mkdir(BUILD_PATH)
+            decode_frames(
+                args,
+                BUILD_PATH / DECODED_FRAMES_DIR,
+                filename,
+                IS_IMAGE,
+                IS_TRANSPARENT,
+            )
+            decode_dict["created"] = time.time()
+            decode_dict["size"] = get_dir_size(BUILD_PATH)
+            write_manifest(BUILD_PATH, decode_dict)
+            publish_cache(DECODED_PATH, decode_hash)
+
+
+def build_cache(
+    args,
+    cleaned_dict: dict,
+    BASE_PATH: pathlib.Path,
+    filename: pathlib.Path,
+    IS_IMAGE: bool,
+    IS_TRANSPARENT: bool | None,
+    should_print_verbose: bool,
+    executor: ThreadPoolExecutor | None = None,
+    video_dir: pathlib.Path | None = None,
+) -> Mapping[int, str]:
+    """
+    Renders the animation into a staging directory and publishes it as the cache entry of cleaned_dict["hash"] with a rename.
+    The caller must hold the exclusive cache_lock of that entry. Returns the rendered frames.
+    If an executor is given the chafa jobs are run on it instead of a private one, so several builds can share the cores.
+    The frames are decoded through the decode stage cache, unless video_dir with already decoded frames is given.
+    """
+    if video_dir is None:
+        with decoded_frames(
+            args, BASE_PATH, filename, IS_IMAGE, IS_TRANSPARENT, should_print_verbose
+        ) as decoded_dir:
+            return build_cache(
+                args,
+                cleaned_dict,
+                BASE_PATH,
+                filename,
+                IS_IMAGE,
+                IS_TRANSPARENT,
+                should_print_verbose,
+                executor=executor,
+                video_dir=decoded_dir,
+            )
+
+    CACHE_PATH = get_cache_path(BASE_PATH, cleaned_dict["hash"])
+    BUILD_PATH = get_build_path(BASE_PATH, cleaned_dict["hash"])
+    VIDEO_DIR: pathlib.Path = video_dir
+    OUTPUT_DIR: pathlib.Path = BUILD_PATH / "output"
+
+    WIDTH = args.width
+
+    # automatically calculate height if not given
+    if "--height" not in sys.argv and "-H" not in sys.argv:
+        try:
+            with span("ffprobe dimensions"):
+                vid_w, vid_h = get_media_dimensions(args.filename)
+        except RuntimeError as e:
+            print(f"[ERROR] {e}")
+            sys.exit(1)
+
+        ratio = vid_h / vid_w
+        HEIGHT = round(args.width * ratio)
+    else:
+        HEIGHT = args.height
+
+    print_verbose(should_print_verbose, "SHOULD RENDER WITH CHAFA")
+
+    # make sure height and width are at least 1
+    WIDTH = max(WIDTH, 1)
+    HEIGHT = max(HEIGHT, 1)
+
+    chafa_args: str = args.chafa_arguments.strip()
+    chafa_args += (
+        " --format symbols"  # Fixes https://github.com/Notenlish/anifetch/issues/1
+    )
+    # colours asked for in --chafa-arguments win over --color-depth
+    if args.color_depth in CHAFA_COLORS and not any(
+        arg == "-c" or arg.startswith("--colors") for arg in chafa_args.split()
+    ):
+        chafa_args += f" --colors {CHAFA_COLORS[args.color_depth]}"
+
+    # continue an interrupted render of the same source at the same size, if there is one.
+    build_info = {
+        "source": list(get_file_fingerprint(args.filename)),
+        "width": WIDTH,
+        "height": HEIGHT,
+        "chafa_args": chafa_args,
+    }
+    done_frames = read_checkpoint(BUILD_PATH, build_info)
+    if done_frames is None:
+        if BUILD_PATH.exists():
+            shutil.rmtree(BUILD_PATH)
+        os.mkdir(BUILD_PATH)
+        os.mkdir(OUTPUT_DIR)
+        write_build_info(BUILD_PATH, build_info)
+        done_frames = {}
+    else:
+        print_verbose(
+            should_print_verbose,
+            f"Resuming an interrupted render, {len(done_frames)} frames are already done.",
+        )
+
+    print_verbose(should_print_verbose, args.sound_flag_given)
+
+    # the audio is written into the staging directory, but the saved path has to point to where it ends up once published.
+    if args.sound_flag_given:
+        if args.sound:  # sound file given
+            print_verbose(should_print_verbose, "Sound file to use:", args.sound)
+            source = pathlib.Path(args.sound)
+            audio_name = f"output_audio{source.suffix}"
+            shutil.copy(source, BUILD_PATH / audio_name)
+        else:
+            print_verbose(
+                args.verbose,
+                "No sound file specified, will attempt to extract it from video.",
+            )
+            with span("ffprobe codec"):
+                codec = check_codec_of_file(args.filename)
+            try:
+                ext = get_ext_from_codec(codec)
+            except ValueError as e:
+                print(f"[ERROR] {e}")
+                sys.exit(1)
+            with span("ffmpeg audio"):
+                audio_file = extract_audio_from_file(BUILD_PATH, args.filename, ext)
+            if audio_file is None:
+                print(f"[ERROR] Couldn't extract the audio of {args.filename}.")
+                sys.exit(1)
+            print_verbose(should_print_verbose, "Extracted audio file.")
+            audio_name = audio_file.name
+
+        args.sound_saved_path = str(CACHE_PATH / audio_name)
+        cleaned_dict["sound_saved_path"] = args.sound_saved_path
+
+        print_verbose(should_print_verbose, args.sound_saved_path)
+
+    # get the frames
+    frames: dict[int, str] = {}
+    animation_files = os.listdir(VIDEO_DIR)
+    animation_files.sort()
+    futures: dict[Future, str] = {}
+    max_workers: int = max(1, (os.cpu_count() or 2) - 1)
+    max_workers = 1
+
+    # characters chafa printed and what's left of them, for the frames rendered now
+    chafa_size = minimized_size = 0
+    own_executor = executor is None
+    if executor is None:
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        with (
+            span("chafa frames"),
+            open(BUILD_PATH / CHECKPOINT_NAME, "a", encoding="utf-8") as log,
+        ):
+            for i, f in enumerate(animation_files):
+                frame_name = pathlib.Path(f).with_suffix(".txt").name
+                if frame_name in done_frames:
+                    frames[i] = done_frames[frame_name]
+                    continue
+                future = executor.submit(
+                    threaded_chafa_frame_gen,
+                    i,
+                    f,
+                    VIDEO_DIR,
+                    OUTPUT_DIR,
+                    WIDTH,
+                    HEIGHT,
+                    chafa_args,
+                )
+                futures[future] = frame_name
+                # if wanted aspect ratio doesnt match source, chafa makes width as high as it can, and adjusts height accordingly.
+                # AKA: even if I specify 40x20, chafa might give me 40x11 or something like that.
+            for future in as_completed(futures):
+                _i, _frame, _chafa_size = future.result()
+                frames[_i] = _frame
+                checkpoint_frame(log, futures[future], _frame)
+                chafa_size += _chafa_size
+                minimized_size += len(_frame)
+    finally:
+        # when interrupted, don't wait for the frames that haven't started yet.
+        for future in futures:
+            future.cancel()
+        if own_executor:
+            executor.shutdown()
+
+    if chafa_size:
+        print_verbose(
+            should_print_verbose,
+            f"Dropped redundant colour sequences: {chafa_size} -> {minimized_size} characters "
+            f"({(1 - minimized_size / chafa_size) * 100:.1f}% smaller) over {len(futures)} frames.",
+        )
+
+    # no need to keep the checkpoint.
+    os.remove(BUILD_PATH / BUILD_INFO_NAME)
+    os.remove(BUILD_PATH / CHECKPOINT_NAME)
+    frames = dict(sorted(frames.items()))
+    with span("write cache"):
+        # the pack replaces the frame files, which were only needed to resume the render.
+        write_frame_pack(BUILD_PATH, frames)
+        shutil.rmtree(OUTPUT_DIR)
+
+        # the manifest is written last, an entry without one is never treated as a cache hit.
+        cleaned_dict["created"] = time.time()
+        cleaned_dict["size"] = get_dir_size(BUILD_PATH)
+        write_manifest(BUILD_PATH, cleaned_dict)
+        publish_cache(BASE_PATH, cleaned_dict["hash"])
+    # play from the mapped pack too, so this process shares the frames with the ones that start later.
+    return load_frames(CACHE_PATH) or frames
+
+
+def build_caches(
+    jobs: list[tuple],
+    BASE_PATH: pathlib.Path,
+    filename: pathlib.Path,
+    IS_IMAGE: bool,
+    IS_TRANSPARENT: bool | None,
+    should_print_verbose: bool,
+    executor: ThreadPoolExecutor,
+) -> list[Mapping[int, str]]:
+    """
+    Renders several cache entries of the same media that only differ in chafa settings (e.g. widths) from a single ffmpeg decode.
+    jobs is a list of (args, cleaned_dict), the caller must hold the exclusive cache_lock of every entry.
+    The entries are rendered at the same time, their chafa jobs share the executor. Returns the frames of each job, in order.
+    """
+    with (
+        decoded_frames(
+            jobs[0][0],
+            BASE_PATH,
+            filename,
+            IS_IMAGE,
+            IS_TRANSPARENT,
+            should_print_verbose,
+        ) as VIDEO_DIR,
+        ThreadPoolExecutor(max_workers=len(jobs)) as job_executor,
+    ):
+        futures = [
+            job_executor.submit(
+                build_cache,
+                job_args,
+                cleaned_dict,
+                BASE_PATH,
+                filename,
+                IS_IMAGE,
+                IS_TRANSPARENT,
+                should_print_verbose,
+                executor=executor,
+                video_dir=VIDEO_DIR,
+            )
+            for job_args, cleaned_dict in jobs
+        ]
+        return [future.result() for future in futures]
@@ -0,0 +1,498 @@
+"""
+Anifetch cache module for looking up, listing and deleting rendered animations.
+
+The cache has two stages. Rendered animations live in `<data path>/<hash>/`, the frames
+ffmpeg decodes are cached the same way under `<data path>/decoded/<hash>/`, keyed only on
+what affects decoding, so renders that differ in chafa settings share them. Every function
+here takes the base path of the stage it works on.
+
+Every entry carries its own `manifest.json` holding the arguments it was made with. The
+manifest is the index: looking up a configuration is a single file read, and a cache hit
+doesn't write anything.
+
+Several anifetch processes can share the data path (e.g. many terminals opening at
+login), so entries are rendered into `<hash>.partial/` and published with a rename
+while holding the entry's advisory lock. Readers take the same lock in shared mode.
+A render that gets interrupted leaves its staging directory behind with a checkpoint
+of the frames it finished, the next render of the entry continues from there.
+
+The mtime of a manifest is the last time its entry was used, which is what the
+size/entry limits evict by (least recently used first).
+
+The rendered frames of an entry are packed into a single `frames.pack` file that is
+mapped read-only into every process playing it, so any number of terminals share one
+copy of the frames through the page cache. Entries from before the pack keep their
+`output/` directory of frame files, those are read into memory like before.
+"""
+
+import json
+import mmap
+import os
+import re
+import shutil
+import struct
+import time
+import zlib
+from collections.abc import Mapping
+from contextlib import contextmanager
+from pathlib import Path
+
+from .timing import span
+
+MANIFEST_NAME = "manifest.json"
+BUILD_INFO_NAME = "build.json"  # what a staging directory is being rendered with
+CHECKPOINT_NAME = "frames.log"  # a "<frame file> <crc32>" line per finished frame
+LEGACY_INDEX_NAME = "caches.json"  # single json list used before per entry manifests
+LOCKS_DIR_NAME = ".locks"
+BUILD_SUFFIX = ".partial"
+TRASH_SUFFIX = ".trash"
+DECODED_DIR_NAME = "decoded"
+DECODED_FRAMES_DIR = "frames"
+FRAMES_PACK_NAME = "frames.pack"
+# magic and frame count, followed by frame count + 1 offsets and then the utf-8 frames
+PACK_HEADER = struct.Struct("<4sI")
+PACK_MAGIC = b"AFP1"
+ACCESS_TIME_RESOLUTION = (
+    60  # seconds, a cache hit only touches the manifest if it is older than this
+)
+
+HASH_RE = re.compile(r"[0-9a-f]{64}")
+
+# manifest keys that differ between entries rendered with the same arguments
+ENTRY_KEYS = ("hash", "created", "size", "sound_saved_path", "last_access")
+
+
+def get_cache_path(base_path: Path, cache_hash: str) -> Path:
+    return base_path / cache_hash
+
+
+def get_decoded_path(base_path: Path) -> Path:
+    """Base path of the decode stage cache."""
+    return base_path / DECODED_DIR_NAME
+
+
+def get_build_path(base_path: Path, cache_hash: str) -> Path:
+    """Staging directory an entry is rendered into before it gets published."""
+    return base_path / f"{cache_hash}{BUILD_SUFFIX}"
+
+
+def _lock_file(fd: int, shared: bool, blocking: bool) -> bool:
+    if os.name == "nt":
+        import msvcrt
+
+        # msvcrt has no shared locks, and windows doesn't let anyone delete files that are open anyway.
+        if shared:
+            return True
+        while True:
+            try:
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+                return True
+            except OSError:
+                if not blocking:
+                    return False
+                time.sleep(0.05)
+    else:
+        import fcntl
+
+        flags = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+        if not blocking:
+            flags |= fcntl.LOCK_NB
+        try:
+            fcntl.flock(fd, flags)
+        except BlockingIOError:
+            return False
+        return True
+
+
+def get_lock_path(base_path: Path, cache_hash: str) -> Path:
+    return base_path / LOCKS_DIR_NAME / f"{cache_hash}.lock"
+
+
+@contextmanager
+def cache_lock(
+    base_path: Path, cache_hash: str, shared: bool = False, blocking: bool = True
+):
+    """
+    Advisory lock for one cache entry.
+    Exclusive for rendering/publishing/deleting the entry, shared for reading its frames.
+    Yields whether the lock was acquired, which is always True when blocking.
+    """
+    lock_path = get_lock_path(base_path, cache_hash)
+    lock_path.parent.mkdir(exist_ok=True)
+    while True:
+        fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        acquired = _lock_file(fd, shared, blocking)
+        # --cache-gc removes the lock files of deleted entries, if ours got unlinked while we were waiting, lock the new one.
+        try:
+            if not acquired or os.fstat(fd).st_ino == os.stat(lock_path).st_ino:
+                break
+        except FileNotFoundError:
+            pass
+        os.close(fd)
+    try:
+        yield acquired
+    finally:
+        os.close(fd)  # closing the file releases the lock
+
+
+def _remove_dir(path: Path):
+    """Moves the directory out of the way with a rename first, so nobody sees a half deleted entry."""
+    trash = path.with_name(f"{path.name}{TRASH_SUFFIX}-{os.getpid()}")
+    os.rename(path, trash)
+    shutil.rmtree(trash, ignore_errors=True)
+
+
+def publish_cache(base_path: Path, cache_hash: str):
+    """Moves a finished staging directory into place. Must be called with the entry's exclusive lock held."""
+    cache_path = get_cache_path(base_path, cache_hash)
+    if cache_path.exists():  # --force-render
+        _remove_dir(cache_path)
+    os.rename(get_build_path(base_path, cache_hash), cache_path)
+
+
+def write_build_info(build_path: Path, build_info: dict):
+    with open(build_path / BUILD_INFO_NAME, "w", encoding="utf-8") as f:
+        json.dump(build_info, f)
+
+
+def frame_checksum(frame: str) -> str:
+    return f"{zlib.crc32(frame.encode('utf-8')):08x}"
+
+
+def checkpoint_frame(log, frame_name: str, frame: str):
+    """Records a finished frame in the opened checkpoint log, once its file is written."""
+    log.write(f"{frame_name} {frame_checksum(frame)}\n")
+    log.flush()
+
+
+def read_checkpoint(build_path: Path, build_info: dict) -> dict[str, str] | None:
+    """
+    Returns the frames an interrupted render of the entry already finished, {frame file name: frame}.
+    Frames whose file doesn't match its checksum are left out so they get rendered again.
+    Returns None if there's nothing to resume, e.g. the render was started with another source file or size.
+    """
+    try:
+        with open(build_path / BUILD_INFO_NAME, encoding="utf-8") as f:
+            if json.load(f) != build_info:
+                return None
+    except (FileNotFoundError, NotADirectoryError, json.JSONDecodeError):
+        return None
+
+    try:
+        with open(build_path / CHECKPOINT_NAME, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+    except FileNotFoundError:
+        lines = []
+
+    frames: dict[str, str] = {}
+    for line in lines:
+        frame_name, _, checksum = line.partition(" ")
+        try:
+            with open(build_path / "output" / frame_name, encoding="utf-8") as f:
+                frame = f.read()
+        except (FileNotFoundError, IsADirectoryError, UnicodeDecodeError):
+            continue
+        if frame_checksum(frame) == checksum:
+            frames[frame_name] = frame
+    return frames
+
+
+class FrameStore(Mapping[int, str]):
+    """
+    Read-only {frame index: frame} view of a frames pack. A frame is only decoded when it's
+    drawn, the encoded frames stay in the mapping, which the kernel shares between processes.
+    """
+
+    def __init__(self, buffer, offsets: tuple[int, ...]):
+        self._buffer = buffer
+        self._offsets = offsets
+
+    def __getitem__(self, index: int) -> str:
+        if not 0 <= index < len(self):
+            raise KeyError(index)
+        start, end = self._offsets[index], self._offsets[index + 1]
+        return self._buffer[start:end].decode("utf-8")
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __iter__(self):
+        return iter(range(len(self)))
+
+
+def write_frame_pack(cache_path: Path, frames: dict[int, str]):
+    encoded = [frames[i].encode("utf-8") for i in sorted(frames)]
+    offsets = [PACK_HEADER.size + 8 * (len(encoded) + 1)]
+    for frame in encoded:
+        offsets.append(offsets[-1] + len(frame))
+    with open(cache_path / FRAMES_PACK_NAME, "wb") as f:
+        f.write(PACK_HEADER.pack(PACK_MAGIC, len(encoded)))
+        f.write(struct.pack(f"<{len(offsets)}Q", *offsets))
+        f.writelines(encoded)
+
+
+def open_frame_pack(cache_path: Path) -> FrameStore | None:
+    """Maps the frames pack of a cache entry. Returns None if there's no (valid) pack."""
+    try:
+        with open(cache_path / FRAMES_PACK_NAME, "rb") as f:
+            if os.name == "nt":
+                # a mapped file can't be deleted on Windows, that would block --clear/--delete while playing
+                buffer = f.read()
+            else:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (
+        FileNotFoundError,
+        NotADirectoryError,
+        ValueError,
+    ):  # ValueError: empty file
+        return None
+
+    if len(buffer) < PACK_HEADER.size:
+        return None
+    magic, count = PACK_HEADER.unpack_from(buffer)
+    offsets_size = 8 * (count + 1)
+    if (
+        magic != PACK_MAGIC
+        or count == 0
+        or len(buffer) < PACK_HEADER.size + offsets_size
+    ):
+        return None
+    offsets = struct.unpack_from(f"<{count + 1}Q", buffer, PACK_HEADER.size)
+    if offsets[-1] != len(buffer):
+        return None
+    return FrameStore(buffer, offsets)
+
+
+def load_frames(cache_path: Path) -> Mapping[int, str]:
+    """Returns the rendered frames of a cache entry, {frame index: frame}. Empty if the output is missing."""
+    with span("load frames"):
+        store = open_frame_pack(cache_path)
+        if store is not None:
+            return store
+
+        output_dir = cache_path / "output"
+        try:
+            frame_names = sorted(os.listdir(output_dir))
+        except FileNotFoundError:
+            return {}
+        frames: dict[int, str] = {}
+        for i, frame_name in enumerate(frame_names):
+            with open(output_dir / frame_name, "r", encoding="utf-8") as f:
+                frames[i] = f.read()
+        return frames
+
+
+def read_manifest(base_path: Path, cache_hash: str) -> dict | None:
+    """Returns the manifest of the cache entry, or None if there's no (valid) entry for this hash."""
+    with span("read manifest"):
+        try:
+            with open(
+                get_cache_path(base_path, cache_hash) / MANIFEST_NAME, encoding="utf-8"
+            ) as f:
+                manifest = json.load(f)
+        except (FileNotFoundError, NotADirectoryError, json.JSONDecodeError):
+            return None
+        if manifest.get("hash") != cache_hash:
+            return None
+        return manifest
+
+
+def write_manifest(cache_path: Path, manifest: dict):
+    """Writes the manifest through a temporary file so readers never see a half written one."""
+    tmp = cache_path / f".{MANIFEST_NAME}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, cache_path / MANIFEST_NAME)
+
+
+def touch_cache(base_path: Path, cache_hash: str):
+    """Records that the entry has been used, for LRU eviction. Only the manifest's mtime changes."""
+    manifest_path = get_cache_path(base_path, cache_hash) / MANIFEST_NAME
+    try:
+        if time.time() - manifest_path.stat().st_mtime > ACCESS_TIME_RESOLUTION:
+            os.utime(manifest_path)
+    except OSError:
+        pass  # read only data dir, or the entry just got deleted
+
+
+def get_dir_size(path: Path) -> int:
+    """Total size in bytes of the files under path."""
+    total = 0
+    for root, _dirs, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except FileNotFoundError:
+                pass
+    return total
+
+
+def list_caches(base_path: Path) -> list[dict]:
+    """
+    Returns the manifests of all cache entries, oldest first. The order is what --cache-list numbers and --delete uses.
+    Each manifest gets a "last_access" key with its entry's last use time.
+    """
+    manifests: list[dict] = []
+    with os.scandir(base_path) as it:
+        for entry in it:
+            if not HASH_RE.fullmatch(entry.name) or not entry.is_dir():
+                continue
+            manifest = read_manifest(base_path, entry.name)
+            if manifest is None:
+                continue
+            try:
+                manifest["last_access"] = os.stat(
+                    Path(entry.path) / MANIFEST_NAME
+                ).st_mtime
+            except FileNotFoundError:
+                continue
+            manifests.append(manifest)
+    manifests.sort(key=lambda m: (m.get("created", 0), m["hash"]))
+    return manifests
+
+
+def find_variants(base_path: Path, cache_args: dict, key: str) -> dict:
+    """Returns {value of key: hash} of the entries rendered with the same arguments as cache_args, apart from key."""
+    ignored = (key, *ENTRY_KEYS)
+    wanted = {k: v for k, v in cache_args.items() if k not in ignored}
+    variants = {}
+    for manifest in list_caches(base_path):
+        if {k: v for k, v in manifest.items() if k not in ignored} == wanted:
+            variants[manifest.get(key)] = manifest["hash"]
+    return variants
+
+
+def delete_cache(base_path: Path, cache_hash: str, blocking: bool = True) -> bool:
+    """Deletes a cache entry. Returns whether it got deleted, False if it didn't exist (or was in use when not blocking)."""
+    cache_dir = get_cache_path(base_path, cache_hash)
+    with cache_lock(base_path, cache_hash, blocking=blocking) as acquired:
+        if not acquired or not cache_dir.exists():
+            return False
+        _remove_dir(cache_dir)
+    return True
+
+
+def evict_caches(
+    base_path: Path,
+    max_size: int | None,
+    max_entries: int | None,
+    keep: tuple[str, ...] = (),
+) -> list[tuple[Path, dict]]:
+    """
+    Deletes the least recently used entries until the cache fits in max_size bytes and max_entries entries.
+    One budget covers both stages: max_size counts the rendered animations in base_path and the decoded frames
+    in its decode stage cache, max_entries only counts the rendered animations.
+    Entries in keep and entries another anifetch is using right now are skipped.
+    Returns (base path, manifest) of the deleted entries.
+    """
+    if max_size is None and max_entries is None:
+        return []
+
+    caches: list[tuple[Path, dict]] = []
+    for stage_path in (base_path, get_decoded_path(base_path)):
+        try:
+            stage_caches = list_caches(stage_path)
+        except FileNotFoundError:  # nothing decoded yet
+            continue
+        for cache in stage_caches:
+            if "size" not in cache:  # rendered before sizes were recorded
+                cache["size"] = get_dir_size(get_cache_path(stage_path, cache["hash"]))
+            caches.append((stage_path, cache))
+
+    total_size = sum(cache["size"] for _, cache in caches)
+    total_entries = sum(1 for stage_path, _ in caches if stage_path == base_path)
+
+    evicted: list[tuple[Path, dict]] = []
+    for stage_path, cache in sorted(caches, key=lambda c: c[1]["last_access"]):
+        over_size = max_size is not None and total_size > max_size
+        over_entries = max_entries is not None and total_entries > max_entries
+        if not over_size and not over_entries:
+            break
+        is_animation = stage_path == base_path
+        if is_animation and cache["hash"] in keep:
+            continue
+        if not is_animation and not over_size:
+            continue  # decoded frames only count towards the size
+        if delete_cache(stage_path, cache["hash"], blocking=False):
+            total_size -= cache["size"]
+            total_entries -= is_animation
+            evicted.append((stage_path, cache))
+    return evicted
+
+
+def collect_garbage(base_path: Path) -> list[Path]:
+    """
+    Removes whatever in the data path doesn't belong to an indexed entry: hash directories without a manifest,
+    staging directories of interrupted renders, leftovers of interrupted deletes and lock files of deleted entries.
+    Returns the removed paths.
+    """
+    removed: list[Path] = []
+    with os.scandir(base_path) as it:
+        entries = [Path(entry.path) for entry in it if entry.is_dir()]
+
+    for path in entries:
+        name = path.name
+        if HASH_RE.fullmatch(name):
+            if read_manifest(base_path, name) is not None:
+                continue
+            cache_hash = name
+        elif name.endswith(BUILD_SUFFIX) and HASH_RE.fullmatch(
+            name[: -len(BUILD_SUFFIX)]
+        ):
+            cache_hash = name[: -len(BUILD_SUFFIX)]
+        elif TRASH_SUFFIX + "-" in name:
+            shutil.rmtree(path, ignore_errors=True)
+            removed.append(path)
+            continue
+        else:
+            continue  # assets etc.
+
+        # a render may be in progress, only remove it if nobody holds the lock.
+        with cache_lock(base_path, cache_hash, blocking=False) as acquired:
+            if acquired and read_manifest(base_path, name) is None:
+                _remove_dir(path)
+                removed.append(path)
+
+    locks_dir = base_path / LOCKS_DIR_NAME
+    if locks_dir.exists():
+        for lock_path in locks_dir.glob("*.lock"):
+            cache_hash = lock_path.stem
+            with cache_lock(base_path, cache_hash, blocking=False) as acquired:
+                if not acquired:
+                    continue
+                if (
+                    get_cache_path(base_path, cache_hash).exists()
+                    or get_build_path(base_path, cache_hash).exists()
+                ):
+                    continue
+                lock_path.unlink(missing_ok=True)
+                removed.append(lock_path)
+    return removed
+
+
+def migrate_legacy_index(base_path: Path):
+    """Converts the old caches.json list into per entry manifests, then removes it."""
+    legacy_path = base_path / LEGACY_INDEX_NAME
+    if not legacy_path.exists():
+        return
+    try:
+        with open(legacy_path, "r") as f:
+            legacy_caches: list[dict] = json.load(f)
+    except json.JSONDecodeError:
+        legacy_caches = []
+
+    for cache_args in legacy_caches:
+        cache_hash = cache_args.get("hash")
+        if not cache_hash:
+            continue
+        cache_path = get_cache_path(base_path, cache_hash)
+        if not cache_path.is_dir() or (cache_path / MANIFEST_NAME).exists():
+            continue
+        manifest = dict(cache_args)
+        # keep the old listing order
+        manifest["created"] = cache_path.stat().st_mtime
+        write_manifest(cache_path, manifest)
+
+    legacy_path.unlink(
+        missing_ok=True
+    )  # another anifetch may have migrated it at the same time
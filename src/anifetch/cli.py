@@ -3,7 +3,17 @@ Anifetch CLI module for parsing command line arguments.
 """
 
 import argparse
-from .utils import get_version_of_anifetch
+from .utils import get_version_of_anifetch, parse_int_list, parse_size
+
+
+class VersionAction(argparse.Action):
+    """Like action="version", but only looks the version up when --version is given. Reading package metadata is slow."""
+
+    def __init__(self, option_strings, dest, **kwargs):
+        super().__init__(option_strings, dest, nargs=0, **kwargs)
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        parser.exit(message=f"{parser.prog} {get_version_of_anifetch()}\n")
 
 
 parser = argparse.ArgumentParser(
@@ -58,6 +68,7 @@ parser.add_argument(
     "--playback-rate",
     default=10,
     help="Default is 10. Ignored when a sound is playing so that desync doesn't happen. Sets the playback rate of the animation. Not to be confused with the 'framerate' option. This basically sets for how long the script will wait before rendering new frame, while the framerate option affects how many frames are generated via ffmpeg.",
+    type=float,
 )
 parser.add_argument(
     "-s",
@@ -86,6 +97,12 @@ parser.add_argument(
     default="--symbols ascii --fg-only",
     help="Specify the arguments to give to chafa. Default is \"--symbols ascii --fg-only\". For more information, use 'chafa --help'",
 )
+parser.add_argument(
+    "--color-depth",
+    default="auto",
+    choices=["auto", "truecolor", "256", "16"],
+    help="The colours the animation is rendered with. Fewer colours make the frames smaller, on disk and in what's written to the terminal every frame, e.g. over SSH. truecolor keeps the colours chafa picks by itself. It's part of the cache, so switching renders the animation again. Default: auto, what COLORTERM and TERM say the terminal supports.",
+)
 parser.add_argument(
     "--cleanup",
     default=False,
@@ -110,6 +127,11 @@ parser.add_argument(
     help="Do not exit anifetch when a user presses a key. Use Ctrl + C to exit if enabled.",
     action="store_false",
 )
+parser.add_argument(
+    "--fixed-width",
+    help="Keep playing the animation at --width when the terminal gets too narrow for it. By default anifetch switches to a narrower render (rendering it in the background if it isn't cached yet).",
+    action="store_true",
+)
 
 parser.add_argument(
     "--no-input-restore",
@@ -152,8 +174,9 @@ parser.add_argument(
 )
 parser.add_argument(
     "--version",
-    action="version",
-    version="%(prog)s {version}".format(version=get_version_of_anifetch()),
+    action=VersionAction,
+    default=argparse.SUPPRESS,
+    help="show program's version number and exit",
 )
 parser.add_argument(
     "--cache-list",
@@ -175,6 +198,45 @@ parser.add_argument(
     action="store_true",
     help="Clear all saved cache configurations.",
 )
+parser.add_argument(
+    "--cache-max-size",
+    required=False,
+    type=parse_size,
+    default=None,
+    help="Limit the total size of the cache (e.g. 500M, 2G), rendered animations and decoded video frames together. Least recently used caches are deleted when a new animation is cached. Default is no limit.",
+)
+parser.add_argument(
+    "--cache-max-entries",
+    required=False,
+    type=int,
+    default=None,
+    help="Limit how many rendered animations are kept in the cache, decoded video frames don't count. Least recently used caches are deleted when a new animation is cached. Default is no limit.",
+)
+parser.add_argument(
+    "--cache-gc",
+    required=False,
+    action="store_true",
+    help="Remove leftover cache files that don't belong to any cached animation (interrupted renders etc.). Also applies --cache-max-size/--cache-max-entries if given.",
+)
+parser.add_argument(
+    "--prebuild",
+    required=False,
+    nargs="+",
+    metavar="PATH",
+    help="Render the given files (or every video/gif/image in the given directories) into the cache without playing them. Uses every width in --widths, and all the other rendering arguments as given.",
+)
+parser.add_argument(
+    "--daemon",
+    action="store_true",
+    help="Run in the background and keep animations and the fetch output in memory. anifetch runs in other terminals then get their animation from it and start almost instantly. Unix only.",
+)
+parser.add_argument(
+    "--widths",
+    required=False,
+    type=parse_int_list,
+    default=None,
+    help="Comma separated widths to render with --prebuild, e.g. '30,40,60'. Default is the value of --width.",
+)
 
 parser.add_argument(
     "-b",
@@ -184,6 +246,48 @@ parser.add_argument(
     action="store_true",
 )
 
+parser.add_argument(
+    "--benchmark-playback",
+    nargs="?",
+    const=300,
+    default=None,
+    type=int,
+    metavar="FRAMES",
+    help="For testing. Plays FRAMES frames (300 if not given) as fast as possible without a terminal, with the rich renderer and with the precomposed frames the daemon client plays, and prints the frames per second and the CPU time per frame of each.",
+)
+
+parser.add_argument(
+    "--benchmark-sink",
+    default="null",
+    choices=["null", "pty"],
+    help="Where --benchmark-playback plays into: the null device, or a pseudo-terminal so the tty driver is part of the measurement. Default: null.",
+)
+
+parser.add_argument(
+    "--profile",
+    nargs="?",
+    const="-",
+    default=None,
+    metavar="FILE",
+    help="Write how long each stage of the run took (probing the media, ffmpeg, chafa, the cache, fastfetch/neofetch, drawing...) and the time to the first frame as JSON to FILE, or to stderr after the animation ends if no FILE is given. Works with --benchmark too.",
+)
+
+parser.add_argument(
+    "--stats",
+    nargs="?",
+    const="-",
+    default=None,
+    metavar="FILE",
+    help="Measure whether playback keeps up: how long drawing frames takes, how late they are drawn, how many are skipped and how many bytes get written. A summary with percentiles goes to stderr when anifetch exits, or the full stats as JSON to FILE.",
+)
+
+parser.add_argument(
+    "--trace",
+    default=None,
+    metavar="FILE",
+    help="Write a timeline of the run as a Chrome trace to FILE (open it in chrome://tracing or ui.perfetto.dev): ffmpeg, every chafa job, cache reads, fetch refreshes, drawing and flushing every frame and the writes to the terminal, per thread.",
+)
+
 parser.add_argument(
     "-c",
     "--config",
@@ -198,5 +302,5 @@ parser.add_argument(
 )
 
 
-def parse_args():
-    return parser.parse_args()
+def parse_args(argv: list[str] | None = None):
+    return parser.parse_args(argv)
@@ -0,0 +1,178 @@
+"""
+Anifetch client module for playing animations served by a running `anifetch --daemon`.
+
+This runs before anything else gets imported, so it only uses light standard library modules
+(see writer.py for the thread writing the frames). The daemon sends the playback already composed for this terminal:
+an intro (the fetch output), then every frame as the escape sequences that draw it, then
+what to leave on screen afterwards. The client only has to keep the time and write bytes.
+"""
+
+import json
+import os
+import signal
+import socket
+import struct
+import sys
+import time
+
+from .pacing import FramePacer
+from .writer import FrameWriter
+
+ALT_SCREEN_ON = "\x1b[?1049h\x1b[?25l"  # also hides the cursor
+ALT_SCREEN_OFF = "\x1b[?25h\x1b[?1049l"
+
+BLOB_HEADER = struct.Struct("!I")
+
+
+def get_socket_path() -> str:
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return os.path.join(runtime_dir, "anifetch.sock")
+    return os.path.join(
+        os.environ.get("TMPDIR", "/tmp"), f"anifetch-{os.getuid()}.sock"
+    )
+
+
+def send_blob(sock: socket.socket, data: bytes):
+    sock.sendall(BLOB_HEADER.pack(len(data)) + data)
+
+
+def recv_blob(stream) -> bytes:
+    header = stream.read(BLOB_HEADER.size)
+    if len(header) < BLOB_HEADER.size:
+        raise ConnectionError("The anifetch daemon closed the connection.")
+    (size,) = BLOB_HEADER.unpack(header)
+    data = stream.read(size)
+    if len(data) < size:
+        raise ConnectionError("The anifetch daemon closed the connection.")
+    return data
+
+
+def request_playback(argv: list[str]):
+    """
+    Asks the daemon for the playback of argv composed for the current terminal size.
+    Returns (header, intro, stream), or None if there's no daemon or it can't serve this (then anifetch runs standalone).
+    """
+    if os.name == "nt" or not hasattr(socket, "AF_UNIX"):
+        return None
+    path = get_socket_path()
+    try:
+        if os.stat(path).st_uid != os.getuid():
+            return None  # not our daemon
+        size = os.get_terminal_size()
+    except OSError:
+        return None
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+        request = {
+            "argv": argv,
+            "cwd": os.getcwd(),
+            "columns": size.columns,
+            "lines": size.lines,
+            # for --color-depth auto
+            "env": {name: os.environ.get(name, "") for name in ("COLORTERM", "TERM")},
+        }
+        sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        stream = sock.makefile("rb")
+        header = json.loads(stream.readline() or b"{}")
+        if not header.get("ok"):
+            sock.close()
+            return None
+        intro = recv_blob(stream)
+    except (OSError, ValueError):
+        sock.close()
+        return None
+    return header, intro, stream
+
+
+def _read_rest(stream, frames: list[bytes], count: int) -> bytes:
+    """Reads the frames that haven't arrived yet and returns what comes after them."""
+    while len(frames) < count:
+        frames.append(recv_blob(stream))
+    return recv_blob(stream)
+
+
+def run_client(argv: list[str]) -> bool:
+    """Plays the animation through the daemon. Returns False if anifetch has to run standalone instead."""
+    response = request_playback(argv)
+    if response is None:
+        return False
+    header, intro, stream = response
+
+    resized = False
+
+    def on_resize(_signum, _frame):
+        nonlocal resized
+        resized = True
+
+    if hasattr(signal, "SIGWINCH"):
+        signal.signal(signal.SIGWINCH, on_resize)
+
+    key_reader = None
+    if header["key_exit"]:
+        from .keyreader import KeyReader
+
+        key_reader = KeyReader()
+
+    last_key = None
+    frames: list[bytes] = []
+    final = b""
+    pacer = FramePacer(header["framerate"])
+    # writes from its own thread, so a stalled terminal doesn't stop key polling
+    writer = FrameWriter(sys.stdout.buffer, on_frame_written=pacer.record_write)
+    writer.write(ALT_SCREEN_ON.encode() + intro)
+    try:
+        loop_count = 0
+        while loop_count < header["loop"] or header["loop"] == -1:
+            start_time = time.time()
+            i = 0
+            while i < header["frames"]:
+                if resized:
+                    # compose again for the new size, keep playing from the same frame.
+                    resized = False
+                    response = request_playback(argv)
+                    if response is not None:
+                        stream.close()
+                        header, intro, stream = response
+                        frames = []
+                        writer.write(intro)
+                while len(frames) <= i:  # the frames arrive while the first ones play
+                    frames.append(recv_blob(stream))
+
+                sleep_duration = i / header["framerate"] - (time.time() - start_time)
+                if sleep_duration > 0:
+                    time.sleep(sleep_duration)
+
+                if key_reader is not None:
+                    last_key = key_reader.poll()
+                    if last_key is not None:
+                        raise KeyboardInterrupt
+
+                writer.write_frame(frames[i])
+                # on a slow link writing takes longer than a frame lasts, frames get dropped to stay on schedule
+                i = pacer.next_frame(i, time.time() - start_time)
+            loop_count += 1
+        final = _read_rest(stream, frames, header["frames"])
+    except KeyboardInterrupt:
+        try:
+            final = _read_rest(stream, frames, header["frames"])
+        except (OSError, ConnectionError):
+            pass
+    except (OSError, ConnectionError):
+        pass  # daemon went away mid playback
+    finally:
+        stream.close()
+        if key_reader is not None:
+            key_reader.stop()
+        writer.write(ALT_SCREEN_OFF.encode())
+        if not header["cleanup"]:
+            writer.write(final)
+        writer.close()
+
+    if last_key and header["restore_input"]:
+        from .keyreader import restore_pressed_key
+
+        restore_pressed_key(last_key)
+    return True
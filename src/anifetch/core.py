@@ -3,59 +3,90 @@ Anifetch core module for running the animation.
 """
 
 from .ansi_process import expand_ansi_movement_seq
+from .keyreader import restore_pressed_key
 
-# from .ansi_process2 import expand_ansi_movement_seq2
-import json
-import os
 import pathlib
-import shutil
-import subprocess
-import errno
 import sys
 import time
+from collections.abc import Mapping
+from importlib import import_module
+from threading import Thread
 from .utils import (
-    check_codec_of_file,
-    extract_audio_from_file,
-    get_ext_from_codec,
     get_data_path,
     default_asset_presence_check,
-    get_media_dimensions,
+    import_asset,
     get_neofetch_status,
     print_verbose,
     normal_print,
+    format_size,
     check_sound_flag_given,
-    clean_cache_args,
-    check_args_hash_same,
-    find_corresponding_cache,
-    hash_of_cache_args,
-    get_caches_json,
-    save_caches_json,
+    make_cache_args,
     args_checker,
-    threaded_chafa_frame_gen,
     get_fetch_output,
     make_template_from_fetch_lines,
+    center_template_to_animation,
     clear_screen_soft,
-    check_is_video,
-    check_is_image,
-    check_video_transparency,
-    check_image_transparency,
-    split_to_frames,
+    detect_media_type,
+    resolve_color_depth,
 )
+from .cache import (
+    cache_lock,
+    get_decoded_path,
+    read_manifest,
+    load_frames,
+    list_caches,
+    delete_cache,
+    touch_cache,
+    evict_caches,
+    collect_garbage,
+    migrate_legacy_index,
+)
+from .timing import mark, span, write_profile, write_trace
 from typing import Literal
-from concurrent.futures import ThreadPoolExecutor, Future
 
 GAP = 2
 PAD_LEFT = 4
 LEFT = PAD_LEFT
 
 
+def resolve_filename(name: str, ASSET_PATH: pathlib.Path) -> pathlib.Path:
+    """Returns the media file to play, names of files in the assets directory work too. Exits if there's no such file."""
+    filename = pathlib.Path(name)
+
+    # If the filename is relative, check if it exists in the assets directory.
+    if not filename.exists():
+        candidate = ASSET_PATH / filename
+        if candidate.exists():
+            filename = candidate
+            # print("EXISTS IN THE ASSET PATH", "candidate:", candidate)
+        else:
+            print(
+                f"[ERROR] File not found: {name}\nMake sure the file exists or that it is in the correct directory.",
+                file=sys.stderr,
+            )
+            sys.exit(1)
+
+    if not filename.is_file():
+        print("[ERROR] Filename is not a file. Please give an file.")
+        sys.exit(1)
+    return filename
+
+
 def run_anifetch(args):
     st = time.time()
+    mark("run_anifetch")  # everything before it is importing
 
-    should_print: bool = not args.benchmark
+    should_print: bool = not args.benchmark and not args.benchmark_playback
     should_print_verbose: bool = args.verbose
 
-    allowed_alternatives = ["cache_list", "clear", "delete"]
+    allowed_alternatives = [
+        "cache_list",
+        "clear",
+        "delete",
+        "cache_gc",
+        "prebuild",
+        "daemon",
+    ]
     try:
         args_checker(allowed_alternatives, args)
     except ValueError as e:
@@ -64,33 +95,48 @@ def run_anifetch(args):
 
     args.sound_flag_given = check_sound_flag_given(sys.argv)
     args.chroma_flag_given = args.chroma is not None
+    resolve_color_depth(args)
 
     neofetch_status: Literal["neofetch", "uninstalled", "wrapper"] = "uninstalled"
     if args.neofetch:
         neofetch_status = get_neofetch_status()
 
-    BASE_PATH = get_data_path()
+    with span("data directory"):
+        BASE_PATH = get_data_path()
+
+        ASSET_PATH = BASE_PATH / "assets"
+        (ASSET_PATH).mkdir(parents=True, exist_ok=True)
 
-    ASSET_PATH = BASE_PATH / "assets"
-    (ASSET_PATH).mkdir(parents=True, exist_ok=True)
+        default_asset_presence_check(ASSET_PATH)
 
-    default_asset_presence_check(ASSET_PATH)
+        DECODED_PATH = get_decoded_path(BASE_PATH)
+        DECODED_PATH.mkdir(exist_ok=True)
 
-    CACHE_LIST_PATH = BASE_PATH / "caches.json"
+        migrate_legacy_index(BASE_PATH)
 
     if args.cache_list:
-        all_caches = get_caches_json(CACHE_LIST_PATH)
+        all_caches = list_caches(BASE_PATH)
         if not all_caches:
             normal_print(should_print, "No cached configurations found.")
         else:
             normal_print(should_print, "Available caches:")
             for i, cache in enumerate(all_caches, 1):
                 line = f"[{i}] video: {cache.get('filename', '?')} | width: {cache.get('width')} | chroma: {cache.get('chroma')}"
+                line += f" | colors: {cache.get('color_depth', 'truecolor')}"
+                if "size" in cache:
+                    line += f" | size: {format_size(cache['size'])}"
                 normal_print(should_print, line)
+        decoded = list_caches(DECODED_PATH)
+        if decoded:
+            decoded_size = sum(cache.get("size", 0) for cache in decoded)
+            normal_print(
+                should_print,
+                f"Decoded frames of {len(decoded)} video(s) are cached too, size: {format_size(decoded_size)}",
+            )
         sys.exit(0)
 
     if args.delete:
-        all_caches = get_caches_json(CACHE_LIST_PATH)
+        all_caches = list_caches(BASE_PATH)
         to_delete = sorted(set(args.delete), reverse=True)
         max_index = len(all_caches)
 
@@ -100,72 +146,67 @@ def run_anifetch(args):
                 print(f"[ERROR] No cache found with number {index}")
                 continue
 
-            cache = all_caches[real_index]
-            hash_to_delete = cache["hash"]
+            hash_to_delete = all_caches[real_index]["hash"]
             cache_dir = BASE_PATH / hash_to_delete
 
-            if cache_dir.exists():
-                shutil.rmtree(cache_dir)
+            if delete_cache(BASE_PATH, hash_to_delete):
                 normal_print(should_print, f"Deleted cache directory: {cache_dir}")
             else:
                 normal_print(
                     should_print,
                     f"[WARNING] Cache directory {cache_dir} already missing.",
                 )
-
-            # Supprimer du cache JSON
-            del all_caches[real_index]
-            max_index -= 1  # car on modifie la liste au fur et à mesure
-
-        save_caches_json(CACHE_LIST_PATH, all_caches)
         sys.exit(0)
 
     if args.clear:
-        all_caches = get_caches_json(CACHE_LIST_PATH)
-        for cache in all_caches:
-            hash_id = cache.get("hash")
-            if hash_id:
-                cache_dir = BASE_PATH / hash_id
-                if cache_dir.exists():
-                    shutil.rmtree(cache_dir)
-                    normal_print(should_print, f"Deleted cache directory: {cache_dir}")
-        save_caches_json(CACHE_LIST_PATH, [])
+        for cache in list_caches(BASE_PATH):
+            if delete_cache(BASE_PATH, cache["hash"]):
+                normal_print(
+                    should_print,
+                    f"Deleted cache directory: {BASE_PATH / cache['hash']}",
+                )
+        for cache in list_caches(DECODED_PATH):
+            delete_cache(DECODED_PATH, cache["hash"])
         normal_print(should_print, "All cache entries have been cleared.")
         sys.exit(0)
 
-    filename = pathlib.Path(args.filename)
+    if args.prebuild:
+        from .prebuild import run_prebuild
 
-    # If the filename is relative, check if it exists in the assets directory.
-    if not filename.exists():
-        candidate = ASSET_PATH / filename
-        if candidate.exists():
-            filename = candidate
-            # print("EXISTS IN THE ASSET PATH", "candidate:", candidate)
-        else:
-            print(
-                f"[ERROR] File not found: {args.filename}\nMake sure the file exists or that it is in the correct directory.",
-                file=sys.stderr,
-            )
-            sys.exit(1)
+        failed = run_prebuild(args, BASE_PATH, ASSET_PATH)
+        sys.exit(1 if failed else 0)
 
-    if not filename.is_file():
-        print("[ERROR] Filename is not a file. Please give an file.")
-        sys.exit(1)
+    if args.daemon:
+        from .daemon import run_daemon
 
-    IS_IMAGE = False
-    IS_GIF = False
-    IS_VIDEO = False
-    IS_TRANSPARENT = False
-    if filename.suffix == ".gif":
-        IS_GIF = True
-        IS_TRANSPARENT = True
-    else:
-        IS_VIDEO = check_is_video(filename)
-        if IS_VIDEO:
-            IS_TRANSPARENT = check_video_transparency(filename)
-    if not IS_GIF and not IS_VIDEO:
-        IS_IMAGE = check_is_image(filename)
-        IS_TRANSPARENT = check_image_transparency(filename)
+        run_daemon(BASE_PATH, ASSET_PATH)
+        sys.exit(0)
+
+    if args.cache_gc:
+        for path in collect_garbage(BASE_PATH) + collect_garbage(DECODED_PATH):
+            normal_print(should_print, f"Removed orphaned cache file: {path}")
+        for path, cache in evict_caches(
+            BASE_PATH, args.cache_max_size, args.cache_max_entries
+        ):
+            if path == DECODED_PATH:
+                normal_print(
+                    should_print,
+                    f"Evicted decoded frames: {cache.get('filename', '?')}",
+                )
+            else:
+                normal_print(
+                    should_print,
+                    f"Evicted cache: {cache.get('filename', '?')} | width: {cache.get('width')}",
+                )
+        sys.exit(0)
+
+    filename = resolve_filename(args.filename, ASSET_PATH)
+
+    # hit or miss is decided by the manifest, only a render needs ffprobe to tell whether the video is transparent
+    with span("probe media"):
+        IS_IMAGE, IS_GIF, IS_VIDEO, IS_TRANSPARENT = detect_media_type(
+            filename, probe=False
+        )
 
     if (not IS_GIF) and (not IS_IMAGE) and (not IS_VIDEO):
         print("[ERROR] File is neither a gif, image or video.")
@@ -173,43 +214,15 @@ def run_anifetch(args):
 
     # TODO: make sure image mode also works as well. currently it raises a runtime Error
 
-    newpath = ASSET_PATH / filename.name
-
-    try:
-        shutil.copy(filename, newpath)
-    except shutil.SameFileError:
-        pass
+    with span("import asset"):
+        newpath = import_asset(filename, ASSET_PATH)
     args.filename = str(newpath)
 
-    args_dict = {key: value for key, value in args._get_kwargs()}
-    cleaned_dict = clean_cache_args(args_dict)
-    cleaned_dict["hash"] = hash_of_cache_args(cleaned_dict)
+    with span("cache key"):
+        cleaned_dict = make_cache_args(args)
 
     CACHE_PATH = BASE_PATH / cleaned_dict["hash"]
 
-    VIDEO_DIR: pathlib.Path = CACHE_PATH / "video"
-    OUTPUT_DIR: pathlib.Path = CACHE_PATH / "output"
-
-    CACHE_PATH.mkdir(parents=True, exist_ok=True)
-    (VIDEO_DIR).mkdir(exist_ok=True)
-    (OUTPUT_DIR).mkdir(exist_ok=True)
-
-    if args.sound_flag_given:
-        if args.sound:
-            pass
-        else:
-            codec = check_codec_of_file(args.filename)
-            try:
-                ext = get_ext_from_codec(codec)
-            except ValueError as e:
-                print(f"[ERROR] {e}")
-                sys.exit(1)
-
-            # sound and sound_flag_given will be used for hash calculation.
-            # sound_saved_path is a value that must be kept in the 'cleaned' variable but it shouldnt be used in calculating hash, that's what sound and sound_flag_given are for.
-            args.sound_saved_path = str(CACHE_PATH / f"output_audio.{ext}")
-            cleaned_dict["sound_saved_path"] = args.sound_saved_path
-
     if args.chroma and args.chroma.startswith("#"):
         print("[ERROR] Use '0x' prefix for chroma color, not '#'.", file=sys.stderr)
         sys.exit(1)
@@ -218,229 +231,115 @@ def run_anifetch(args):
     should_update = args.force_render  # True if --force-render
     print_verbose(should_print_verbose, should_update)
 
-    if not should_update:
-        try:
-            all_caches = get_caches_json(CACHE_LIST_PATH)
-
-            for cache_args in all_caches:
-                if check_args_hash_same(cache_args, cleaned_dict):
-                    break
-            else:
-                normal_print(
-                    should_print,
-                    "Couldn't find a corresponding cache. Will cache the animation.",
-                )
-                should_update = True
+    # put cached frames here
+    frames: Mapping[int, str] = {}  # {frame_id : frame}
 
-        except FileNotFoundError:
+    manifest = None
+    if not should_update:
+        # the shared lock keeps --delete/--clear or a re-render in another terminal from pulling the frames out from under us.
+        with (
+            span("cache lookup"),
+            cache_lock(BASE_PATH, cleaned_dict["hash"], shared=True),
+        ):
+            manifest = read_manifest(BASE_PATH, cleaned_dict["hash"])
+            if manifest is not None:
+                frames = load_frames(CACHE_PATH)
+
+        if manifest is None:
+            normal_print(
+                should_print,
+                "Couldn't find a corresponding cache. Will cache the animation.",
+            )
+            should_update = True
+        elif not frames:
+            normal_print(
+                should_print,
+                "[WARNING] Cache folder found but output is missing. Will regenerate.",
+            )
             should_update = True
 
-    if not (CACHE_PATH / "output").exists() and not should_update:
-        normal_print(
-            should_print,
-            "[WARNING] Cache folder found but output is missing. Will regenerate.",
-        )
-        should_update = True
-
+    # cache is invalid, re-render
     if should_update:
-        normal_print(should_print, "Caching...")
+        with cache_lock(BASE_PATH, cleaned_dict["hash"]):
+            # Another anifetch may have rendered the same animation while we were waiting for the lock.
+            if not args.force_render:
+                manifest = read_manifest(BASE_PATH, cleaned_dict["hash"])
+                if manifest is not None:
+                    frames = load_frames(CACHE_PATH)
+
+            if not frames:
+                from .build import build_cache
+
+                normal_print(should_print, "Caching...")
+                with span("build cache"):
+                    frames = build_cache(
+                        args,
+                        cleaned_dict,
+                        BASE_PATH,
+                        filename,
+                        IS_IMAGE,
+                        IS_TRANSPARENT,
+                        should_print_verbose,
+                    )
+                manifest = cleaned_dict
+
+        with span("cache eviction"):
+            evicted = evict_caches(
+                BASE_PATH,
+                args.cache_max_size,
+                args.cache_max_entries,
+                keep=(cleaned_dict["hash"],),
+            )
+        for path, cache in evicted:
+            print_verbose(should_print_verbose, "Evicted cache:", path / cache["hash"])
+    else:
+        touch_cache(BASE_PATH, cleaned_dict["hash"])
 
-    WIDTH = args.width
+    if args.sound_flag_given and manifest is not None:
+        args.sound_saved_path = manifest["sound_saved_path"]
+    else:
+        args.sound_saved_path = ""
 
-    # automatically calculate height if not given
-    if should_update and ("--height" not in sys.argv and "-H" not in sys.argv):
-        try:
-            vid_w, vid_h = get_media_dimensions(ASSET_PATH / args.filename)
-        except RuntimeError as e:
-            print(f"[ERROR] {e}")
-            sys.exit(1)
+    WIDTH = args.width
+    HEIGHT = len(frames[0].splitlines())
 
-        ratio = vid_h / vid_w
-        HEIGHT = round(args.width * ratio)
-    else:
-        HEIGHT = args.height
+    if not args.benchmark:
+        # rich takes longer to import than all of the rest, let it load while fastfetch/neofetch runs.
+        Thread(
+            target=import_module, args=(".renderer", __package__), daemon=True
+        ).start()
 
     # Get the fetch output(neofetch/fastfetch)
-    fetch_lines: list[str] = get_fetch_output(
-        not args.neofetch, neofetch_status, args.force, args.config
-    )
+    with span("fetch"):
+        fetch_lines: list[str] = get_fetch_output(
+            not args.neofetch, neofetch_status, args.force, args.config
+        )
     # fetch_output = strip_ansi_colors(fetch_output)  # if I strip ansi colors the output is nearly the same as fastfetch
     # s = time.perf_counter()
-    fetch_lines = expand_ansi_movement_seq(fetch_lines)
+    with span("expand fetch output"):
+        fetch_lines = expand_ansi_movement_seq(fetch_lines)
     # e = time.perf_counter()
     # print(e-s)
     # raise SystemExit
 
     len_fetch = len(fetch_lines)
-
-    # put cached frames here
-    frames: dict[int, str] = {}  # {frame_id : frame}
+    raw_fetch_lines = fetch_lines
 
     len_chafa = None
-
-    # cache is invalid, re-render
-    if should_update:
-        print_verbose(should_print_verbose, "SHOULD RENDER WITH CHAFA")
-
-        # deletes the old cache
-        if CACHE_PATH.exists():
-            shutil.rmtree(CACHE_PATH)
-
-        os.mkdir(CACHE_PATH)
-        (VIDEO_DIR).mkdir(exist_ok=True)
-
-        stdout = None if args.verbose else subprocess.DEVNULL
-        stderr = None if args.verbose else subprocess.PIPE
-
-        if IS_IMAGE:
-            shutil.copy(
-                args.filename, VIDEO_DIR / f"{0:05d}.{filename.suffix}"
-            )  # just a file named 00000.{suffix}
-        else:  # video or gif
-            try:
-                result_ffmpeg = split_to_frames(
-                    args, CACHE_PATH, IS_TRANSPARENT, stdout, stderr
-                )
-            except FileNotFoundError as e:
-                if e.errno == errno.ENOENT:
-                    print(
-                        "The command Ffmpeg was not found. You probably forgot to install it. You can install it by going to here: https://ffmpeg.org/download.html\n If you installed Ffmpeg but it still doesn't work, check your PATH."
-                    )
-                    raise SystemExit
-                else:
-                    raise
-            else:
-                if result_ffmpeg.returncode != 0:
-                    print(f"[ERROR] ffmpeg failed: {result_ffmpeg.stderr}")
-                    sys.exit(1)
-
-        print_verbose(should_print_verbose, args.sound_flag_given)
-
-        if args.sound_flag_given:
-            if args.sound:  # sound file given
-                print_verbose(should_print_verbose, "Sound file to use:", args.sound)
-                source = pathlib.Path(args.sound)
-                dest = CACHE_PATH / source.with_name(f"output_audio{source.suffix}")
-                shutil.copy(source, dest)
-                args.sound_saved_path = str(dest)
-            else:
-                print_verbose(
-                    args.verbose,
-                    "No sound file specified, will attempt to extract it from video.",
-                )
-                codec = check_codec_of_file(args.filename)
-                ext = get_ext_from_codec(codec)
-                audio_file = extract_audio_from_file(CACHE_PATH, args.filename, ext)
-                print_verbose(should_print_verbose, "Extracted audio file.")
-
-                args.sound_saved_path = str(audio_file)
-
-            cleaned_dict["sound_saved_path"] = args.sound_saved_path
-
-            print_verbose(should_print_verbose, args.sound_saved_path)
-
-        # If the new anim frames is shorter than the old one, then in /output there will be both new and old frames.
-        # Empty the directory to fix this.
-        os.mkdir(OUTPUT_DIR)
-
-        print_verbose(should_print_verbose, "Emptied the output folder.")
-
-        # make sure height and width are at least 1
-        WIDTH = max(WIDTH, 1)
-        HEIGHT = max(HEIGHT, 1)
-
-        # WHY IS THE FRAMES NOT PROPERLY FINISHED AND HANDLED???
-
-        # get the frames
-        animation_files = os.listdir(VIDEO_DIR)
-        animation_files.sort()
-        futures: list[Future] = []
-        max_workers: int = max(1, (os.cpu_count() or 2) - 1)
-        max_workers = 1
-
-        chafa_args: str = args.chafa_arguments.strip()
-        chafa_args += (
-            " --format symbols"  # Fixes https://github.com/Notenlish/anifetch/issues/1
-        )
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            for i, f in enumerate(animation_files):
-                future = executor.submit(
-                    threaded_chafa_frame_gen,
-                    i,
-                    f,
-                    VIDEO_DIR,
-                    OUTPUT_DIR,
-                    WIDTH,
-                    HEIGHT,
-                    chafa_args,
-                    args.center,
-                    len_fetch,
-                    fetch_lines,
-                )
-                futures.append(future)
-                # if wanted aspect ratio doesnt match source, chafa makes width as high as it can, and adjusts height accordingly.
-                # AKA: even if I specify 40x20, chafa might give me 40x11 or something like that.
-            for future in futures:
-                _i, _frame = future.result()
-                frames[_i] = _frame
-
-    else:
-        # just use cached
-        animation_files: list[str] = os.listdir(OUTPUT_DIR)
-        animation_files.sort()
-        for i, filename in enumerate(animation_files):
-            path = OUTPUT_DIR / filename
-            with open(path, "r", encoding="utf-8") as file:
-                frame = file.read()
-                frames[i] = frame
-            break  # first frame used for the template and the height
-
-        if args.center:
-            len_chafa = len(frame.splitlines())
-            if len_fetch < len_chafa:
-                pad = (len_chafa - len_fetch) // 2
-                remind = (len_chafa - len_fetch) % 2
-                fetch_lines = (
-                    [" " * WIDTH] * pad + fetch_lines + [" " * WIDTH] * (pad + remind)
-                )
-
-        HEIGHT = len(frames[0].splitlines())
-
-        # reloading the cached output
-        with open(CACHE_LIST_PATH, "r") as f:
-            all_saved_caches = json.load(f)
-            corresponding_cache = find_corresponding_cache(
-                cleaned_dict, all_saved_caches
+    if args.center:
+        len_chafa = HEIGHT
+        if len_fetch < len_chafa:
+            fetch_lines = center_template_to_animation(
+                WIDTH, len_chafa, len_fetch, fetch_lines
             )
 
-        if args.sound_flag_given:
-            args.sound_saved_path = corresponding_cache["sound_saved_path"]
-        else:
-            args.sound_saved_path = None
-
-    print_verbose(should_print_verbose, "-----------")
-    print_verbose(should_print_verbose, "ARGS FOR SAVING CACHES.JSON")
-
-    # save the caching arguments
-    caches_data = get_caches_json(CACHE_LIST_PATH)
-
-    added = False
-    for i, cache_dict in enumerate(caches_data):
-        if cache_dict["hash"] == cleaned_dict["hash"]:
-            caches_data[i] = cleaned_dict  # replace the cache with the new one
-            added = True
-    if not added:
-        caches_data.append(cleaned_dict)
-
-    with open(BASE_PATH / "caches.json", "w") as f:
-        json.dump(caches_data, f, indent=2)
-
     if len(fetch_lines) == 0:
         raise Exception("fetch_lines has no items in it:", fetch_lines)
 
-    template, template_actual_width = make_template_from_fetch_lines(
-        fetch_lines, PAD_LEFT, GAP, WIDTH
-    )
+    with span("template"):
+        template, template_actual_width = make_template_from_fetch_lines(
+            fetch_lines, PAD_LEFT, GAP, WIDTH
+        )
 
     # for defining the positions of the cursor, that way I can set cursor pos and only redraw a portion of the text, not the entire text.
     TOP = args.top
@@ -452,7 +351,9 @@ def run_anifetch(args):
     if args.benchmark:
         print(time.time() - st)
     else:
-        from .renderer import Renderer
+        with span("import renderer"):
+            from .renderer import Renderer
+            from .resolutions import Resolutions
 
         try:
             if not args.sound_saved_path:
@@ -462,85 +363,76 @@ def run_anifetch(args):
 
         framerate_to_use = args.playback_rate
 
-        renderer = Renderer(
-            str(BASE_PATH),
-            str(CACHE_PATH),
-            framerate_to_use,
-            TOP,
-            LEFT,
-            RIGHT,
-            HEIGHT,
-            len_fetch,
-            BOTTOM,
-            using_cached,
-            template_actual_width,
-            template,
-            frames,
-            not args.neofetch,
-            neofetch_status,
-            args.force,
-            args.center,
-            args.loop,
-            args.cleanup,
-            args.no_key_exit,
-            args.config,
-            len_chafa or None,
-            WIDTH,
-            GAP,
-            refresh_interval=args.interval,
-            sound_saved_path=args.sound_saved_path,
-        )
-
-        renderer.start_rendering()
+        stats = None
+        # the terminal writes in a --trace are recorded by the writer of the stats
+        if args.stats or args.trace:
+            from .stats import PlaybackStats
+
+            stats = PlaybackStats(framerate_to_use)
+
+        with span("renderer setup"):
+            renderer = Renderer(
+                str(BASE_PATH),
+                str(CACHE_PATH),
+                framerate_to_use,
+                TOP,
+                LEFT,
+                RIGHT,
+                HEIGHT,
+                len_fetch,
+                BOTTOM,
+                using_cached,
+                template_actual_width,
+                template,
+                frames,
+                not args.neofetch,
+                neofetch_status,
+                args.force,
+                args.center,
+                args.loop,
+                args.cleanup,
+                args.no_key_exit and not args.benchmark_playback,
+                args.config,
+                len_chafa or None,
+                WIDTH,
+                GAP,
+                refresh_interval=args.interval,
+                sound_saved_path=args.sound_saved_path,
+                fetch_lines=raw_fetch_lines,
+                resolutions=None
+                if args.fixed_width or args.benchmark_playback
+                else Resolutions(
+                    args, cleaned_dict, BASE_PATH, IS_IMAGE, IS_TRANSPARENT, frames
+                ),
+                stats=stats,
+            )
 
-        # stopped rendering
-        # sys.stdout.flush()
+        if args.benchmark_playback:
+            from .headless import benchmark_playback
 
-        if args.cleanup:
-            clear_screen_soft()
-            # clear_screen()
+            benchmark_playback(renderer, frames, raw_fetch_lines, args)
         else:
-            pass
-
-        if renderer.last_key and args.no_input_restore:
-            from pynput.keyboard import Controller, Key
-
-            KEY_MAP = {
-                # Windows sequences
-                "àH": Key.up,
-                "àP": Key.down,
-                "àK": Key.left,
-                "àM": Key.right,
-                "\x00H": Key.up,
-                "\x00P": Key.down,
-                # Unix/macOS ANSI sequences
-                "\x1b[A": Key.up,
-                "\x1b[B": Key.down,
-                "\x1b[C": Key.right,
-                "\x1b[D": Key.left,
-                "\x1b[H": Key.home,
-                "\x1b[F": Key.end,
-            }
-
-            keyboard = Controller()
-
-            # needed because if I only enter one key even though the user pressed a bunch of keys the keys will be entered disorderly(only the a single key is not automatically entered and the other keys are entered)
-            # so we store the key, go to line start, enter the first key(that the user pressed) and then go to the end of line.
-            # that way even if the user presses a bunch of keys, it will all be in order.
-
-            # start of line
-            keyboard.press(Key.home)
-            keyboard.release(Key.home)
-
-            translated_key = KEY_MAP.get(renderer.last_key, renderer.last_key)
-
-            keyboard.press(translated_key)
-
-            # end of line
-            keyboard.press(Key.end)
-            keyboard.release(Key.end)
-
-            keyboard.release(translated_key)
-
-    if pathlib.Path(VIDEO_DIR).exists():
-        shutil.rmtree(VIDEO_DIR)  # no need to keep the video frames.
+            with span("playback"):
+                renderer.start_rendering()
+
+            # stopped rendering
+            # sys.stdout.flush()
+
+            if args.cleanup:
+                clear_screen_soft()
+                # clear_screen()
+            else:
+                pass
+
+            if renderer.last_key and args.no_input_restore:
+                restore_pressed_key(renderer.last_key)
+
+        if stats is not None:
+            from .stats import write_stats
+
+            write_stats(stats, args.stats)
+
+    if args.profile:
+        write_profile(args.profile)
+    if args.trace:
+        write_trace(args.trace)
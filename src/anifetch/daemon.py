@@ -0,0 +1,375 @@
+"""
+Anifetch daemon module for `anifetch --daemon`.
+
+The daemon keeps animations and the fetch output in memory and sends clients (see client.py)
+the playback composed for their terminal size, so a new terminal doesn't have to look up the
+cache, load the frames or run fastfetch/neofetch before its first frame.
+Anything the client can't do (sound, refreshing the fetch, rendering a missing animation...)
+is left to a standalone anifetch, the client falls back to it on its own.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import pathlib
+import signal
+import socket
+import socketserver
+import sys
+import time
+from collections.abc import Mapping
+from threading import Lock, Thread
+from typing import cast
+
+from .ansi_process import expand_ansi_movement_seq
+from .cache import cache_lock, get_cache_path, load_frames, read_manifest, touch_cache
+from .cli import parser
+from .client import get_socket_path, send_blob
+from .core import GAP, PAD_LEFT
+from .utils import (
+    center_template_to_animation,
+    check_sound_flag_given,
+    detect_color_depth,
+    detect_media_type,
+    get_fetch_output,
+    get_file_fingerprint,
+    get_neofetch_status,
+    import_asset,
+    make_cache_args,
+    resolve_color_depth,
+    truncate_line,
+)
+
+# seconds, older fetch output is refreshed in the background and served meanwhile
+FETCH_MAX_AGE = 30
+# animations kept in memory
+MAX_ANIMATIONS = 8
+# composed playbacks kept in memory, one per animation, fetch output and terminal size
+MAX_PLAYBACKS = 16
+# requests whose arguments are kept worked out, one per directory, arguments and colour depth
+MAX_REQUESTS = 32
+
+# runs with these are left to a standalone anifetch
+STANDALONE_ARGS = (
+    "sound_flag_given",
+    "sound",
+    "benchmark",
+    "force_render",
+    "cache_list",
+    "clear",
+    "delete",
+    "cache_gc",
+    "prebuild",
+    "daemon",
+    "benchmark_playback",
+    "profile",
+    "stats",
+    "trace",
+)
+
+CLEAR_SCREEN = "\x1b[H\x1b[2J"
+RESET = "\x1b[0m"
+
+
+class _RequestParser(argparse.ArgumentParser):
+    """The arguments of cli.parser. Errors, --help and --version raise instead of printing and exiting the daemon."""
+
+    def error(self, message):
+        raise ValueError(message)
+
+    def exit(self, status=0, message=None):
+        raise ValueError((message or "can't serve this").strip())
+
+    def print_help(self, file=None):
+        pass
+
+    def print_usage(self, file=None):
+        pass
+
+
+request_parser = _RequestParser(
+    prog=parser.prog, parents=[parser], add_help=False, exit_on_error=False
+)
+
+
+def compose_playback(
+    frames: Mapping[int, str], fetch_lines: list[str], args, columns: int
+) -> tuple[bytes, list[bytes], bytes]:
+    """
+    Lays out the animation and the fetch output like the Renderer does, as plain escape sequences.
+    Returns the intro (clears the screen and draws the fetch output), every frame (only redraws the animation)
+    and what's printed after leaving the alternate screen.
+    """
+    WIDTH = args.width
+    HEIGHT = len(frames[0].splitlines())
+
+    len_fetch = len(fetch_lines)
+    if args.center and len_fetch < HEIGHT:
+        fetch_lines = center_template_to_animation(
+            WIDTH, HEIGHT, len_fetch, fetch_lines
+        )
+    # the Renderer centers the animation vertically when it's the shorter one
+    offset = (len(fetch_lines) - HEIGHT) // 2 if args.center else 0
+    offset = max(offset, 0)
+
+    template_col = PAD_LEFT + WIDTH + GAP
+    template_lines = [
+        truncate_line(line, columns - template_col).rstrip("\r") for line in fetch_lines
+    ]
+    too_narrow = columns < PAD_LEFT + WIDTH
+
+    def animation_lines(frame: str) -> list[str]:
+        lines = frame.splitlines()
+        if too_narrow:
+            lines = [truncate_line(line, columns - PAD_LEFT) for line in lines]
+        return lines
+
+    intro = CLEAR_SCREEN + "".join(
+        f"\x1b[{args.top + row + 1};{template_col + 1}H{line}{RESET}"
+        for row, line in enumerate(template_lines)
+    )
+    composed = [
+        "".join(
+            f"\x1b[{args.top + offset + row + 1};{PAD_LEFT + 1}H{line}{RESET}"
+            for row, line in enumerate(animation_lines(frames[i]))
+        ).encode("utf-8")
+        for i in range(len(frames))
+    ]
+
+    first = animation_lines(frames[0])
+    final_lines = []
+    for row in range(max(offset + len(first), len(template_lines))):
+        line = ""
+        if 0 <= row - offset < len(first):
+            line += f"\x1b[{PAD_LEFT + 1}G{first[row - offset]}{RESET}"
+        if row < len(template_lines):
+            line += f"\x1b[{template_col + 1}G{template_lines[row]}{RESET}"
+        final_lines.append(line)
+    final = "\n" * args.top + "\n".join(final_lines)
+
+    return intro.encode("utf-8"), composed, final.encode("utf-8")
+
+
+class AnifetchDaemon:
+    def __init__(self, BASE_PATH: pathlib.Path, ASSET_PATH: pathlib.Path):
+        self.base_path = BASE_PATH
+        self.asset_path = ASSET_PATH
+        self.lock = Lock()
+        # two requests importing the same asset would share its temporary file
+        self.import_lock = Lock()
+
+        # {hash: frames}, least recently used first
+        self.animations: dict[str, Mapping[int, str]] = {}
+        # {fetch args: (time, expanded lines)}
+        self.fetches: dict[tuple, tuple[float, list[str]]] = {}
+        self.refreshing: set[tuple] = set()
+        self.playbacks: dict[tuple, tuple[bytes, list[bytes], bytes]] = {}
+        # {(cwd, argv, colour depth): (args, hash, file, fingerprint of the file)}
+        self.requests: dict[
+            tuple, tuple[argparse.Namespace, str, pathlib.Path, tuple]
+        ] = {}
+        self.neofetch_status = None
+
+    def _remember(self, cache: dict, key, value, max_items: int):
+        cache.pop(key, None)
+        cache[key] = value
+        while len(cache) > max_items:
+            del cache[next(iter(cache))]
+
+    def get_frames(self, cache_hash: str) -> Mapping[int, str] | None:
+        """Frames of a cache entry, from memory if possible. An entry that got deleted isn't served anymore."""
+        with cache_lock(self.base_path, cache_hash, shared=True):
+            if read_manifest(self.base_path, cache_hash) is None:
+                with self.lock:
+                    self.animations.pop(cache_hash, None)
+                return None
+            with self.lock:
+                frames = self.animations.get(cache_hash)
+            if frames is None:
+                frames = load_frames(get_cache_path(self.base_path, cache_hash))
+                if not frames:
+                    return None
+        touch_cache(self.base_path, cache_hash)
+        with self.lock:
+            self._remember(self.animations, cache_hash, frames, MAX_ANIMATIONS)
+        return frames
+
+    def _run_fetch(self, key: tuple) -> list[str]:
+        use_fastfetch, force, config = key
+        if not use_fastfetch and self.neofetch_status is None:
+            self.neofetch_status = get_neofetch_status()
+        lines = expand_ansi_movement_seq(
+            get_fetch_output(
+                use_fastfetch, self.neofetch_status or "uninstalled", force, config
+            )
+        )
+        with self.lock:
+            self.fetches[key] = (time.time(), lines)
+            self.refreshing.discard(key)
+        return lines
+
+    def get_fetch(self, key: tuple) -> tuple[float, list[str]]:
+        """The fetch output for key. Output older than FETCH_MAX_AGE is still returned, but gets refreshed for the next client."""
+        with self.lock:
+            cached = self.fetches.get(key)
+            stale = cached is not None and time.time() - cached[0] > FETCH_MAX_AGE
+            if stale and key not in self.refreshing:
+                self.refreshing.add(key)
+                Thread(target=self._run_fetch, args=(key,), daemon=True).start()
+        if cached is None:
+            self._run_fetch(key)
+            with self.lock:
+                cached = self.fetches[key]
+        return cached
+
+    def prepare(self, request: dict) -> tuple[argparse.Namespace, str]:
+        """
+        Works out which animation the client's arguments ask for, like run_anifetch does. Raises if it has to run standalone.
+        A repeat request only stats the file, the arguments are worked out again once the file changed.
+        """
+        argv: list[str] = request["argv"]
+        # the colours the client's terminal supports, clients from before they were sent get the daemon's
+        environ = request.get("env", os.environ)
+        key = (request["cwd"], tuple(argv), detect_color_depth(environ))
+        with self.lock:
+            cached = self.requests.get(key)
+        if cached is not None:
+            args, cache_hash, filename, fingerprint = cached
+            try:
+                if get_file_fingerprint(filename) == fingerprint:
+                    return args, cache_hash
+            except OSError:
+                pass  # gone, so it's looked up again below
+
+        args = request_parser.parse_args(argv)
+        args.sound_flag_given = check_sound_flag_given(argv)
+        args.chroma_flag_given = args.chroma is not None
+        resolve_color_depth(args, environ)
+
+        standalone = [key for key in STANDALONE_ARGS if getattr(args, key, None)]
+        if args.interval != -1:
+            standalone.append("interval")
+        if "-s" in argv:  # a bare -s doesn't set sound_flag_given
+            standalone.append("sound")
+        if args.filename is None or standalone:
+            raise ValueError(f"can't serve {', '.join(standalone) or 'this'}")
+
+        # like resolve_filename, relative to the client's directory and without exiting
+        filename = pathlib.Path(request["cwd"]) / args.filename
+        if not filename.exists():
+            filename = self.asset_path / args.filename
+        if not filename.is_file():
+            raise ValueError(f"no such file: {args.filename}")
+        fingerprint = get_file_fingerprint(filename)
+        # the transparency of a video is only probed when it's rendered, by the standalone run
+        IS_IMAGE, IS_GIF, IS_VIDEO, _IS_TRANSPARENT = detect_media_type(
+            filename, probe=False
+        )
+        if not (IS_IMAGE or IS_GIF or IS_VIDEO):
+            raise ValueError("not a gif, image or video")
+        with self.import_lock:
+            args.filename = str(import_asset(filename, self.asset_path))
+        cache_hash = make_cache_args(args)["hash"]
+        with self.lock:
+            self._remember(
+                self.requests,
+                key,
+                (args, cache_hash, filename, fingerprint),
+                MAX_REQUESTS,
+            )
+        return args, cache_hash
+
+    def playback(self, request: dict) -> tuple[dict, bytes, list[bytes], bytes]:
+        args, cache_hash = self.prepare(request)
+
+        frames = self.get_frames(cache_hash)
+        if frames is None:
+            raise LookupError("not cached yet")  # the standalone run renders it
+        fetch_key = (not args.neofetch, args.force, args.config)
+        fetch_time, fetch_lines = self.get_fetch(fetch_key)
+
+        columns = int(request["columns"])
+        key = (cache_hash, fetch_key, fetch_time, columns, args.center, args.top)
+        with self.lock:
+            composed = self.playbacks.get(key)
+        if composed is None:
+            composed = compose_playback(frames, fetch_lines, args, columns)
+            with self.lock:
+                self._remember(self.playbacks, key, composed, MAX_PLAYBACKS)
+
+        header = {
+            "ok": True,
+            "frames": len(frames),
+            "framerate": float(args.playback_rate),
+            "loop": args.loop,
+            "cleanup": args.cleanup,
+            "key_exit": args.no_key_exit,
+            "restore_input": args.no_input_restore,
+        }
+        return (header, *composed)
+
+
+class _DaemonServer(socketserver.ThreadingUnixStreamServer):
+    anifetch: AnifetchDaemon
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        server = cast(_DaemonServer, self.server)
+        try:
+            request = json.loads(self.rfile.readline())
+            header, intro, frames, final = server.anifetch.playback(request)
+        # bad requests, files that went away and animations that aren't cached yet
+        except (argparse.ArgumentError, OSError, ValueError, LookupError) as e:
+            response = {"ok": False, "reason": str(e)}
+            self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+            return
+        try:
+            self.wfile.write(json.dumps(header).encode("utf-8") + b"\n")
+            for blob in (intro, *frames, final):
+                send_blob(self.connection, blob)
+        except OSError:
+            pass  # the client quit before getting everything
+
+
+def run_daemon(BASE_PATH: pathlib.Path, ASSET_PATH: pathlib.Path):
+    if os.name == "nt" or not hasattr(socket, "AF_UNIX"):
+        print(
+            "[ERROR] --daemon needs unix domain sockets, which aren't available on this platform."
+        )
+        sys.exit(1)
+
+    path = get_socket_path()
+    if os.path.exists(path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+        except OSError:
+            os.unlink(path)  # left over from a daemon that didn't exit cleanly
+        else:
+            print(f"[ERROR] An anifetch daemon is already running on {path}.")
+            sys.exit(1)
+        finally:
+            probe.close()
+
+    old_umask = os.umask(0o177)  # only our user may connect
+    try:
+        server = _DaemonServer(path, _RequestHandler)
+    finally:
+        os.umask(old_umask)
+    server.daemon_threads = True
+    server.anifetch = AnifetchDaemon(BASE_PATH, ASSET_PATH)
+
+    # exit through the finally below so the socket gets removed
+    signal.signal(signal.SIGTERM, lambda _signum, _frame: sys.exit(0))
+
+    print(f"Anifetch daemon listening on {path}. New terminals will use it.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(path)
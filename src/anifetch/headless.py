@@ -0,0 +1,127 @@
+"""
+Anifetch headless module for measuring what playback costs without a terminal, see --benchmark-playback.
+
+Every playback backend plays the same number of frames as fast as it can, without sleeping between
+frames, into the null device or a pseudo-terminal instead of the terminal:
+- renderer: the Renderer's draw loop, every frame drawn and rendered with rich like a standalone anifetch does.
+- client: the frames composed by compose_playback written one after the other, like the client of
+  `anifetch --daemon` plays them. Composing happens once in the daemon, it isn't counted.
+CPU time is the time of the thread playing, so the thread draining the pseudo-terminal isn't counted.
+"""
+
+import io
+import os
+import sys
+import time
+from collections.abc import Mapping
+from contextlib import contextmanager
+from threading import Thread
+
+from .stats import CountingWriter
+from .timing import span
+from .utils import get_terminal_width
+
+BACKENDS = ("renderer", "client")
+
+
+@contextmanager
+def open_sink(kind: str):
+    """A binary stream to play into. A pseudo-terminal goes through the tty driver like a real terminal, minus drawing."""
+    if kind == "null":
+        with open(os.devnull, "wb") as sink:
+            yield sink
+        return
+
+    if not hasattr(os, "openpty"):
+        print("[ERROR] --benchmark-sink pty needs a pseudo-terminal, use null here.")
+        sys.exit(1)
+    master, slave = os.openpty()
+
+    def drain():
+        while True:
+            try:
+                if not os.read(master, 1 << 16):
+                    break
+            except OSError:  # the other end was closed
+                break
+
+    thread = Thread(target=drain, daemon=True)
+    thread.start()
+    sink = os.fdopen(slave, "wb")
+    try:
+        yield sink
+    finally:
+        sink.close()
+        thread.join(timeout=1)
+        os.close(master)
+
+
+def play_renderer(renderer, sink, frame_count: int, columns: int) -> int:
+    """Returns how many bytes were written."""
+    text = io.TextIOWrapper(sink, encoding="utf-8")
+    writer = CountingWriter(text)
+    renderer.play_headless(writer, frame_count, columns)
+    text.flush()
+    text.detach()  # the sink is closed by open_sink
+    return writer.bytes
+
+
+def play_client(composed: list[bytes], sink, frame_count: int) -> int:
+    """Returns how many bytes were written."""
+    written = 0
+    for i in range(frame_count):
+        frame = composed[i % len(composed)]
+        with span("terminal write"):
+            sink.write(frame)
+            sink.flush()
+        written += len(frame)
+    return written
+
+
+def measure(play, sink, frame_count: int) -> dict:
+    cpu = time.thread_time()
+    wall = time.perf_counter()
+    bytes_written = play(sink)
+    wall = time.perf_counter() - wall
+    cpu = time.thread_time() - cpu
+    return {
+        "frames": frame_count,
+        "seconds": wall,
+        "fps": frame_count / wall,
+        "wall_ms_per_frame": wall / frame_count * 1000,
+        "cpu_ms_per_frame": cpu / frame_count * 1000,
+        "bytes_per_frame": bytes_written / frame_count,
+    }
+
+
+def benchmark_playback(
+    renderer, frames: Mapping[int, str], fetch_lines: list[str], args
+) -> dict:
+    """Plays args.benchmark_playback frames with every backend into args.benchmark_sink, prints and returns the results."""
+    from .daemon import compose_playback
+
+    frame_count = args.benchmark_playback
+    if frame_count < 1:
+        print("[ERROR] --benchmark-playback needs at least 1 frame.")
+        sys.exit(1)
+    columns = get_terminal_width()
+    _intro, composed, _final = compose_playback(frames, fetch_lines, args, columns)
+
+    players = {
+        "renderer": lambda sink: play_renderer(renderer, sink, frame_count, columns),
+        "client": lambda sink: play_client(composed, sink, frame_count),
+    }
+    results = {}
+    for backend in BACKENDS:
+        with open_sink(args.benchmark_sink) as sink:
+            results[backend] = measure(players[backend], sink, frame_count)
+
+    print(
+        f"Playback of {frame_count} frames, {columns} columns wide, into {args.benchmark_sink}:"
+    )
+    for backend, result in results.items():
+        print(
+            f"  {backend:<9} {result['fps']:9.1f} fps  {result['wall_ms_per_frame']:7.3f} ms wall  "
+            f"{result['cpu_ms_per_frame']:7.3f} ms CPU per frame  {result['bytes_per_frame']:8.0f} bytes per frame"
+        )
+    return results
@@ -71,3 +71,45 @@ class KeyReader:
             if not r:
                 return None
             return sys.stdin.read(1)
+
+
+def restore_pressed_key(key: str):
+    """Types the key that stopped anifetch back into the terminal, so it isn't lost for the shell."""
+    from pynput.keyboard import Controller, Key
+
+    KEY_MAP = {
+        # Windows sequences
+        "àH": Key.up,
+        "àP": Key.down,
+        "àK": Key.left,
+        "àM": Key.right,
+        "\x00H": Key.up,
+        "\x00P": Key.down,
+        # Unix/macOS ANSI sequences
+        "\x1b[A": Key.up,
+        "\x1b[B": Key.down,
+        "\x1b[C": Key.right,
+        "\x1b[D": Key.left,
+        "\x1b[H": Key.home,
+        "\x1b[F": Key.end,
+    }
+
+    keyboard = Controller()
+
+    # needed because if I only enter one key even though the user pressed a bunch of keys the keys will be entered disorderly(only the a single key is not automatically entered and the other keys are entered)
+    # so we store the key, go to line start, enter the first key(that the user pressed) and then go to the end of line.
+    # that way even if the user presses a bunch of keys, it will all be in order.
+
+    # start of line
+    keyboard.press(Key.home)
+    keyboard.release(Key.home)
+
+    translated_key = KEY_MAP.get(key, key)
+
+    keyboard.press(translated_key)
+
+    # end of line
+    keyboard.press(Key.end)
+    keyboard.release(Key.end)
+
+    keyboard.release(translated_key)
@@ -0,0 +1,43 @@
+"""
+Anifetch pacing module for keeping playback on schedule when the terminal can't keep up.
+
+On a slow link (SSH, a serial console...) writing a frame takes longer than the frame lasts, and
+drawing every frame one after the other makes the animation fall further and further behind.
+The FramePacer measures how long drawing a frame and writing it take and drops frames instead:
+when the slower of the two takes longer than a frame lasts, only every n-th frame is drawn, so the
+frame rate goes down evenly, and a frame that's already overdue is never drawn, so what's on screen
+stays on time. Drawing and writing happen in different threads (see writer.py), so only the slower
+one holds playback back.
+tools/throttle_check.py plays through a pseudo-terminal that's read at a limited rate to try it.
+"""
+
+import math
+
+SMOOTHING = 0.2  # weight of the newest measurement in the moving averages
+
+
+class FramePacer:
+    def __init__(self, framerate: float):
+        self.framerate = framerate
+        # seconds, moving averages
+        self.draw_time = 0.0
+        self.write_time = 0.0
+
+    def record_draw(self, seconds: float):
+        """Records how long drawing a frame took."""
+        self.draw_time += SMOOTHING * (seconds - self.draw_time)
+
+    def record_write(self, seconds: float):
+        """Records how long writing a frame to the terminal took, called from the writer's thread."""
+        self.write_time += SMOOTHING * (seconds - self.write_time)
+
+    @property
+    def stride(self) -> int:
+        """Every how many frames one can be drawn at the measured speed."""
+        output_time = max(self.draw_time, self.write_time)
+        return max(1, math.ceil(output_time * self.framerate))
+
+    def next_frame(self, index: int, elapsed: float) -> int:
+        """The frame to draw after frame index, elapsed seconds after the first frame of the loop was due."""
+        due = int(elapsed * self.framerate)  # the frame that should be on screen by now
+        return max(index + self.stride, due)
@@ -0,0 +1,188 @@
+"""
+Anifetch prebuild module for rendering many animations into the cache in one go, without playing them.
+"""
+
+import copy
+import os
+import pathlib
+import subprocess
+import sys
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from contextlib import ExitStack
+
+from .build import build_caches
+from .cache import cache_lock, evict_caches, read_manifest
+from .utils import (
+    check_is_image,
+    check_is_video,
+    detect_media_type,
+    import_asset,
+    make_cache_args,
+)
+
+
+def is_media_file(path: pathlib.Path) -> bool:
+    return path.suffix == ".gif" or check_is_video(path) or check_is_image(path)
+
+
+def collect_media_files(
+    paths: list[str], ASSET_PATH: pathlib.Path
+) -> list[pathlib.Path]:
+    """Expands the given paths into media files. Directories are searched recursively, names of saved assets work too."""
+    files: list[pathlib.Path] = []
+    for raw_path in paths:
+        path = pathlib.Path(raw_path)
+        if not path.exists() and (ASSET_PATH / path).exists():
+            path = ASSET_PATH / path
+        if path.is_dir():
+            files += [
+                p for p in sorted(path.rglob("*")) if p.is_file() and is_media_file(p)
+            ]
+        elif path.is_file():
+            files.append(path)
+        else:
+            print(
+                f"[WARNING] Skipping {raw_path}, no such file or directory.",
+                file=sys.stderr,
+            )
+    return files
+
+
+def _prebuild_file(
+    file_jobs: list[tuple],
+    BASE_PATH: pathlib.Path,
+    IS_IMAGE: bool,
+    IS_TRANSPARENT: bool | None,
+    executor: ThreadPoolExecutor,
+) -> list[str]:
+    """Renders all missing widths of one file from a single decode. Returns the status of each job."""
+    statuses: dict[str, str] = {}
+    todo: list[tuple] = []
+    locks: list[ExitStack] = []
+    try:
+        # lock in a fixed order so two prebuilds with overlapping widths can't deadlock
+        for job_args, cleaned_dict in sorted(file_jobs, key=lambda job: job[1]["hash"]):
+            lock = ExitStack()
+            lock.enter_context(cache_lock(BASE_PATH, cleaned_dict["hash"]))
+            if (
+                not job_args.force_render
+                and read_manifest(BASE_PATH, cleaned_dict["hash"]) is not None
+            ):
+                statuses[cleaned_dict["hash"]] = "already cached"
+                lock.close()
+                continue
+            locks.append(lock)
+            todo.append((job_args, cleaned_dict))
+
+        if todo:
+            # build_cache exits on ffmpeg/chafa errors, that shouldn't stop the other files.
+            try:
+                build_caches(
+                    todo,
+                    BASE_PATH,
+                    pathlib.Path(todo[0][0].filename),
+                    IS_IMAGE,
+                    IS_TRANSPARENT,
+                    todo[0][0].verbose,
+                    executor,
+                )
+                status = "cached"
+            except (OSError, subprocess.SubprocessError, SystemExit) as e:
+                status = "failed"
+                # an exit comes after build_caches printed what went wrong
+                reason = "" if isinstance(e, SystemExit) else f": {e}"
+                print(
+                    f"[ERROR] Couldn't prebuild {todo[0][0].filename}{reason}",
+                    file=sys.stderr,
+                )
+            for _job_args, cleaned_dict in todo:
+                statuses[cleaned_dict["hash"]] = status
+    finally:
+        for lock in locks:
+            lock.close()
+    return [statuses[cleaned_dict["hash"]] for _job_args, cleaned_dict in file_jobs]
+
+
+def run_prebuild(args, BASE_PATH: pathlib.Path, ASSET_PATH: pathlib.Path) -> int:
+    """
+    Renders every (file, width) combination into the cache. Returns how many of them failed.
+    Each file is decoded once for all of its widths.
+    """
+    widths: list[int] = args.widths or [args.width]
+    files = collect_media_files(args.prebuild, ASSET_PATH)
+
+    # (file_jobs, IS_IMAGE, IS_TRANSPARENT) per file, file_jobs being an (args, cleaned_dict) per width
+    jobs: list[tuple] = []
+    for file in files:
+        # already cached widths don't need the video probed, the build probes it
+        IS_IMAGE, IS_GIF, IS_VIDEO, IS_TRANSPARENT = detect_media_type(
+            file, probe=False
+        )
+        if not (IS_IMAGE or IS_GIF or IS_VIDEO):
+            print(
+                f"[WARNING] Skipping {file}, it is neither a gif, image or video.",
+                file=sys.stderr,
+            )
+            continue
+        asset = import_asset(file, ASSET_PATH)
+        file_jobs: list[tuple] = []
+        for width in widths:
+            # the same arguments an interactive `anifetch <file> -W <width> ...` run would hash, so it finds these caches.
+            job_args = copy.copy(args)
+            job_args.filename = str(asset)
+            job_args.width = width
+            file_jobs.append((job_args, make_cache_args(job_args)))
+        jobs.append((file_jobs, IS_IMAGE, IS_TRANSPARENT))
+
+    total = len(jobs) * len(widths)
+    if not total:
+        print("[ERROR] Nothing to prebuild.", file=sys.stderr)
+        return 1
+
+    workers = os.cpu_count() or 2
+    st = time.perf_counter()
+    print(
+        f"Prebuilding {total} animation(s) from {len(jobs)} file(s) using {workers} workers..."
+    )
+
+    failed = 0
+    done = 0
+    with (
+        ThreadPoolExecutor(max_workers=workers) as chafa_executor,
+        ThreadPoolExecutor(max_workers=min(len(jobs), workers)) as file_executor,
+    ):
+        started: dict[Future, list[tuple]] = {}
+        for file_jobs, IS_IMAGE, IS_TRANSPARENT in jobs:
+            future = file_executor.submit(
+                _prebuild_file,
+                file_jobs,
+                BASE_PATH,
+                IS_IMAGE,
+                IS_TRANSPARENT,
+                chafa_executor,
+            )
+            started[future] = file_jobs
+
+        for future in as_completed(started):
+            file_jobs = started[future]
+            for (job_args, _cleaned_dict), status in zip(file_jobs, future.result()):
+                done += 1
+                if status.startswith("failed"):
+                    failed += 1
+                name = pathlib.Path(job_args.filename).name
+                print(
+                    f"[{done}/{total}] {name} (width {job_args.width}): {status} ({time.perf_counter() - st:.2f}s elapsed)"
+                )
+
+    evict_caches(
+        BASE_PATH,
+        args.cache_max_size,
+        args.cache_max_entries,
+        keep=tuple(
+            cleaned_dict["hash"]
+            for file_jobs, _, _ in jobs
+            for _job_args, cleaned_dict in file_jobs
+        ),
+    )
+    return failed
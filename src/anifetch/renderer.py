@@ -1,9 +1,10 @@
-import os
 import sys
 import time
+from collections.abc import Mapping
+from contextlib import nullcontext
 from .utils import (
     show_cursor,
-    truncate_line,
+    TruncationIndex,
     get_fetch_output,
     center_template_to_animation,
     make_template_from_fetch_lines,
@@ -11,12 +12,15 @@ from .utils import (
     get_terminal_width,
 )
 from .ansi_process import expand_ansi_movement_seq
+from .pacing import FramePacer
+from .stats import PlaybackStats
+from .timing import mark, span
+from .writer import FrameWriter
 
-# from .ansi_process2 import expand_ansi_movement_seq2
 import subprocess
 from .keyreader import KeyReader
 from typing import Literal
-from threading import Thread
+from threading import Lock, Thread
 from rich.live import Live
 from rich.layout import Layout
 from rich.text import Text
@@ -65,7 +69,7 @@ class Renderer:
         using_cached: bool,
         template_width: int,
         template: list[str],
-        chafa_frames: dict[int, str],
+        chafa_frames: Mapping[int, str],
         use_fastfetch: bool,
         neofetch_status: Literal["neofetch", "uninstalled", "wrapper"],
         force_neofetch: bool,
@@ -79,6 +83,9 @@ class Renderer:
         gap: int,
         refresh_interval: float,
         sound_saved_path: str = "",
+        fetch_lines: list[str] | None = None,
+        resolutions=None,
+        stats: PlaybackStats | None = None,
     ):
         self.base_path: str = base_path
         self.cache_path: str = cache_path
@@ -93,7 +100,6 @@ class Renderer:
 
         self.template_width: int = template_width
         self.sound_saved_path: str = sound_saved_path
-        self.frame_dir: str = f"{cache_path}/output"
 
         self.refresh_interval: float = refresh_interval
         self.last_refresh_time: float = time.time()
@@ -110,17 +116,37 @@ class Renderer:
         self.len_chafa: int | None = len_chafa
         self.width: int = width
         self.gap: int = gap
+        self.len_fetch: int = len_fetch
+        self.fetch_lines: list[str] | None = fetch_lines  # not centered yet
+        self.stats = stats
+
+        # follow the terminal width by switching to narrower renders of the animation, see process_resolution
+        self.resolutions = resolutions
+        self.requested_width: int = width
+        self.wanted_width: int = width
+        self.wanted_width_since: float = 0
+        self.resize_settle_time: float = (
+            0.5  # seconds, before rendering a missing width
+        )
         self.refetched = False
         self.stop_fetch_thread = False
+        # the fetch thread and a resolution switch on the draw thread both remake the template
+        self.template_lock = Lock()
 
         self.last_terminal_width: int = get_terminal_width()
         self.original_template_buffer: list[str] = template
+        # measured once per template, so truncating it on every resize is cheap
+        self.template_index: list[TruncationIndex] = [
+            TruncationIndex(line) for line in template
+        ]
         self.template_buffer: list[str] = []
         self._make_truncated_template(self.last_terminal_width)
 
         num_lines = bottom - top
         sleep_time = 1 / framerate_to_use
         self.adjusted_sleep_time: float = sleep_time / num_lines
+        # drops frames when the terminal can't take them as fast as they are due
+        self.pacer = FramePacer(framerate_to_use)
 
         self.resize_requested: bool = False
         self.resize_in_progress: bool = False
@@ -129,6 +155,12 @@ class Renderer:
 
         self.sound_process: subprocess.Popen[bytes] | None = None
 
+        # see play_headless
+        self.paced: bool = True
+        self.live: Live | None = None
+        # the terminal is written to from its own thread during playback, see start_rendering
+        self.output: FrameWriter[str] | None = None
+
         self.key_reader = KeyReader()
         self.last_key = None
 
@@ -165,16 +197,26 @@ class Renderer:
 
             if self.stop_fetch_thread:
                 return
-            fetch_output: list[str] = get_fetch_output(
-                self.use_fastfetch,
-                self.neofetch_status,
-                self.force_neofetch,
-                self.config,
-            )
-            fetch_output = expand_ansi_movement_seq(fetch_output)
+            with span("fetch refresh"):
+                fetch_output: list[str] = get_fetch_output(
+                    self.use_fastfetch,
+                    self.neofetch_status,
+                    self.force_neofetch,
+                    self.config,
+                )
+                fetch_output = expand_ansi_movement_seq(fetch_output)
 
             if self.stop_fetch_thread:
                 return
+            self.fetch_lines = fetch_output
+            self._make_template(fetch_output)
+
+        while not self.stop_fetch_thread:
+            _()
+            time.sleep(0.05)
+
+    def _make_template(self, fetch_output: list[str]):
+        with self.template_lock:
             len_fetch = len(fetch_output)
             if self.is_centered and len_fetch < self.len_chafa:
                 fetch_lines: list[str] = center_template_to_animation(
@@ -190,14 +232,11 @@ class Renderer:
             )
             if self.stop_fetch_thread:
                 return
+            self.template_index = [TruncationIndex(line) for line in template]
             self.original_template_buffer = template
             self.template_width = template_width
             self.refetched = True
 
-        while not self.stop_fetch_thread:
-            _()
-            time.sleep(0.05)
-
     def draw_stuff(self, chafa_frame: str):
         chafa_t = Text.from_ansi(chafa_frame)
         if self.is_centered:
@@ -210,7 +249,7 @@ class Renderer:
         else:
             self.layout["main"]["chafa"].update(chafa_t)
 
-        _template_str = "".join(self.original_template_buffer)
+        _template_str = "\n".join(self.template_buffer)
 
         self.layout["main"]["template"].update(
             Text.from_ansi(
@@ -226,6 +265,7 @@ class Renderer:
         current_time = time.time()
 
         changed = self.process_template()
+        self.process_resolution()
         if not changed:
             return
 
@@ -272,13 +312,26 @@ class Renderer:
             # avoid Live container drawing the placeholder boxes with borders
             self.draw_stuff(self.chafa_frames[0])
 
-            with Live(
-                self.layout,
-                refresh_per_second=20,
-                screen=True,
-                transient=True,  # if false, keep the last frame
-            ):
-                self.draw_loop()
+            # with --stats, count what reaches the terminal
+            stream = sys.stdout if self.stats is None else self.stats.wrap(sys.stdout)
+            # a stalled terminal only holds up the writer's thread, not the draw loop
+            self.output = FrameWriter(stream, on_frame_written=self.pacer.record_write)
+            try:
+                with Live(
+                    self.layout,
+                    console=Console(file=self.output),
+                    auto_refresh=False,  # every frame is refreshed in _process_one_frame
+                    screen=True,
+                    transient=True,  # if false, keep the last frame
+                ) as live:
+                    self.live = live
+                    # starting Live drew the first frame, it's on screen once the writer got it out
+                    self.output.after_written(lambda: mark("first_frame"))
+                    self.draw_loop()
+            finally:
+                self.live = None
+                self.output.close()
+                self.output = None
             # enable_autowrap()
         except KeyboardInterrupt:
             pass
@@ -309,9 +362,10 @@ class Renderer:
             self.sound_process.kill()
 
     def _make_truncated_template(self, terminal_width: int):
+        # the colours of a cut line still carry over to the next one, like they do in the whole template
         self.template_buffer = [
-            truncate_line(line, terminal_width)
-            for line in self.original_template_buffer
+            index.truncate(terminal_width, keep_sgr=True)
+            for index in self.template_index
         ]
 
     def process_template(self) -> bool:
@@ -325,8 +379,7 @@ class Renderer:
             #     f"Window size changed / refreshed the fetch, remaking template buffer. Max size is {terminal_width}"
             # )
             self.refetched = False
-            if terminal_width < 1:
-                terminal_width = 1
+            terminal_width = max(terminal_width, 1)
 
             self._make_truncated_template(terminal_width)
 
@@ -335,41 +388,114 @@ class Renderer:
 
         return changed
 
-    def draw_loop(self):
+    def process_resolution(self):
+        """
+        Switches to the widest render of the animation that fits the terminal, up to the width that was asked for.
+        Renders that aren't loaded yet get loaded (or rendered) in the background, the current one keeps playing meanwhile.
+        """
+        if self.resolutions is None:
+            return
+        wanted = min(self.requested_width, max(self.last_terminal_width - self.left, 1))
+        if wanted == self.width:
+            return
+
+        now = time.time()
+        if wanted != self.wanted_width:
+            self.wanted_width = wanted
+            self.wanted_width_since = now
+
+        best = max((w for w in self.resolutions.widths() if w <= wanted), default=None)
+        # a narrower render is better while we overflow, a wider one is better once there's room again.
+        if best is not None and (self.width > wanted or best > self.width):
+            frames = self.resolutions.get(best)
+            if frames is None:
+                self.resolutions.prepare(best)
+            else:
+                self.switch_resolution(best, frames)
+
+        # don't render every width the terminal passes through while it's being dragged.
+        if best != wanted and now - self.wanted_width_since >= self.resize_settle_time:
+            self.resolutions.prepare(wanted)
+
+    def switch_resolution(self, width: int, frames: Mapping[int, str]):
+        self.width = width
+        self.right = width + self.left
+        self.chafa_frames = frames
+        self.height = len(frames[0].splitlines())
+        self.bottom = self.height
+        self._some_max_height = max(self.height, self.len_fetch)
+        self.layout["main"]["chafa"].size = width
+
+        if self.is_centered and self.fetch_lines:
+            self.len_chafa = self.height
+            self._make_template(self.fetch_lines)
+
+    def play_headless(self, file, frame_count: int, width: int):
+        """
+        Draws frame_count frames into file as fast as it can, for --benchmark-playback. There's no sleeping between
+        frames and every frame gets rendered, when playing normally Live only refreshes 20 times a second on its own.
+        """
+        console = Console(
+            file=file,
+            force_terminal=True,
+            color_system="truecolor",
+            width=width,
+            height=self.top + self._some_max_height,
+            legacy_windows=False,
+        )
+        self.paced = False
+        # however many times the animation has to loop to get to frame_count
+        loop, self.loop = self.loop, -1
+        self.draw_stuff(self.chafa_frames[0])
+        with Live(
+            self.layout,
+            console=console,
+            auto_refresh=False,
+            screen=True,
+            transient=True,
+        ) as live:
+            self.live = live
+            self.draw_loop(frame_count)
+        self.live = None
+        self.paced = True
+        self.loop = loop
+
+    def draw_loop(self, max_frames: int | None = None):
         loop_count = 0
-        i = 0
+        drawn = 0
         start_time = time.time()
         self.last_refresh_time = time.time()
 
-        first_reading = True if self.using_cached else False
         while loop_count < self.loop or self.loop == -1:
-            # didnt read every file so we need to iterate over the files
-            if first_reading:  # using_cached
-                for frame_name in sorted(os.listdir(self.frame_dir)):
-                    frame_path = f"{self.frame_dir}/{frame_name}"
-                    with open(frame_path, "r", encoding="utf-8") as f:
-                        chafa_frame = f.read()
-                        self.chafa_frames[i] = chafa_frame
-
-                    self._process_one_frame(i, start_time, chafa_frame)
-                    i += 1
-                first_reading = False
-                loop_count += 1
-            else:
-                start_time = time.time()
-                # in here it is guaranteed that every frame already exists in the self.chafa_frames
-                for j, _chafa_frame in self.chafa_frames.items():
-                    self._process_one_frame(j, start_time, _chafa_frame)
-                loop_count += 1
+            start_time = time.time()
+            # frames are decoded from the mapped frames pack as they are drawn. The mapping stays valid if another process deletes the cache entry while we are playing.
+            # chafa_frames can be swapped for another width between two frames, see process_resolution.
+            j = 0
+            while j < len(self.chafa_frames):
+                if drawn == max_frames:
+                    return
+                self._process_one_frame(j, start_time)
+                j = self._next_frame(j, start_time)
+                drawn += 1
+            loop_count += 1
             # time.sleep(0.0000005)
 
-    def _process_one_frame(self, index, start_time, chafa_frame):
+    def _next_frame(self, index: int, start_time: float) -> int:
+        if not self.paced:
+            return index + 1
+        next_index = self.pacer.next_frame(index, time.time() - start_time)
+        dropped = min(next_index, len(self.chafa_frames)) - index - 1
+        if dropped and self.stats is not None:
+            self.stats.drop(dropped)
+        return next_index
+
+    def _process_one_frame(self, index, start_time):
         wanted_epoch = index / self.framerate_to_use
         now = time.time()
         sleep_duration = wanted_epoch - (now - start_time)
 
         # Only sleep if ahead of schedule
-        if sleep_duration > 0:
+        if sleep_duration > 0 and self.paced:
             time.sleep(sleep_duration)
 
         # index += 1
@@ -383,6 +509,19 @@ class Renderer:
                 self.last_key = k
                 raise KeyboardInterrupt
 
-        self.process_resize_if_requested()
-        self.draw_stuff(chafa_frame)
-        sys.stdout.flush()
+        draw_start = time.time()
+        with span("resize check"):
+            self.process_resize_if_requested()
+        with span("draw frame"):
+            self.draw_stuff(self.chafa_frames[index % len(self.chafa_frames)])
+        assert self.live is not None
+        # with a writer this only hands the frame over, an older one still waiting gets dropped
+        with (
+            span("flush"),
+            self.output.frame() if self.output is not None else nullcontext(),
+        ):
+            self.live.refresh()
+        draw_duration = time.time() - draw_start
+        self.pacer.record_draw(draw_duration)
+        if self.stats is not None:
+            self.stats.frame(draw_start - start_time - wanted_epoch, draw_duration)
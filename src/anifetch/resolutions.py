@@ -0,0 +1,141 @@
+"""
+Anifetch resolutions module for switching the playing animation to another width when the terminal gets resized.
+"""
+
+import copy
+import pathlib
+import subprocess
+import time
+from collections.abc import Mapping
+from threading import Lock, Thread
+
+from .build import build_cache
+from .cache import (
+    cache_lock,
+    evict_caches,
+    find_variants,
+    get_cache_path,
+    load_frames,
+    read_manifest,
+    touch_cache,
+)
+from .utils import make_cache_args
+
+# seconds between looking for widths other anifetch runs have cached
+RESCAN_INTERVAL = 2
+
+
+class Resolutions:
+    """
+    The renders of the playing animation at different widths.
+    Widths that are cached get loaded, missing ones get rendered. Both happen in a background thread,
+    one width at a time, so the animation keeps playing meanwhile.
+    """
+
+    def __init__(
+        self,
+        args,
+        cleaned_dict: dict,
+        BASE_PATH: pathlib.Path,
+        IS_IMAGE: bool,
+        IS_TRANSPARENT: bool | None,
+        frames: Mapping[int, str],
+    ):
+        self.args = args
+        self.cache_args: dict = cleaned_dict
+        self.base_path = BASE_PATH
+        self.is_image = IS_IMAGE
+        self.is_transparent = IS_TRANSPARENT
+
+        self.loaded: dict[int, Mapping[int, str]] = {args.width: frames}
+        self.cached: dict[int, str] = {}  # {width: hash}
+        self.failed: set[int] = set()
+        self.last_scan_time: float = 0
+
+        self.lock = Lock()
+        self.worker: Thread | None = None
+        self.scanner: Thread | None = None
+
+    def widths(self) -> set[int]:
+        """
+        Widths that are loaded or cached. This runs every frame while the terminal is resized, so the cache is
+        rescanned in the background, at most every RESCAN_INTERVAL seconds. It reads every manifest.
+        """
+        with self.lock:
+            scanning = self.scanner is not None and self.scanner.is_alive()
+            if not scanning and time.time() - self.last_scan_time > RESCAN_INTERVAL:
+                self.last_scan_time = time.time()
+                self.scanner = Thread(target=self._scan, daemon=True)
+                self.scanner.start()
+            return (set(self.loaded) | set(self.cached)) - self.failed
+
+    def _scan(self):
+        try:
+            cached = find_variants(self.base_path, self.cache_args, "width")
+        except OSError:
+            return
+        with self.lock:
+            self.cached = cached
+
+    def get(self, width: int) -> Mapping[int, str] | None:
+        """Returns the frames of width if they are loaded."""
+        with self.lock:
+            return self.loaded.get(width)
+
+    def prepare(self, width: int) -> bool:
+        """Starts loading (or rendering, if it isn't cached) width in the background. Returns False if busy with another width."""
+        with self.lock:
+            if width in self.loaded or width in self.failed:
+                return True
+            if self.worker is not None and self.worker.is_alive():
+                return False
+            self.worker = Thread(target=self._prepare, args=(width,), daemon=True)
+            self.worker.start()
+        return True
+
+    def _prepare(self, width: int):
+        job_args = copy.copy(self.args)
+        job_args.width = width
+        # set after hashing by run_anifetch, build_cache sets it for the new entry.
+        vars(job_args).pop("sound_saved_path", None)
+        cleaned_dict = make_cache_args(job_args)
+        cache_hash = cleaned_dict["hash"]
+
+        frames: Mapping[int, str] = {}
+        try:
+            with cache_lock(self.base_path, cache_hash, shared=True):
+                if read_manifest(self.base_path, cache_hash) is not None:
+                    frames = load_frames(get_cache_path(self.base_path, cache_hash))
+            if frames:
+                touch_cache(self.base_path, cache_hash)
+            else:
+                with cache_lock(self.base_path, cache_hash):
+                    if read_manifest(self.base_path, cache_hash) is not None:
+                        frames = load_frames(get_cache_path(self.base_path, cache_hash))
+                    if not frames:
+                        frames = build_cache(
+                            job_args,
+                            cleaned_dict,
+                            self.base_path,
+                            pathlib.Path(job_args.filename),
+                            self.is_image,
+                            self.is_transparent,
+                            False,
+                        )
+                evict_caches(
+                    self.base_path,
+                    self.args.cache_max_size,
+                    self.args.cache_max_entries,
+                    keep=(cache_hash, self.cache_args["hash"]),
+                )
+        except (OSError, subprocess.SubprocessError, SystemExit):
+            # build_cache exits on ffmpeg/chafa errors
+            frames = {}
+
+        with self.lock:
+            if frames:
+                self.loaded[width] = frames
+                self.cached[width] = cache_hash
+            else:
+                # don't keep retrying a width that can't be rendered
+                self.failed.add(width)
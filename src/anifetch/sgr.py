@@ -0,0 +1,180 @@
+"""
+Anifetch sgr module for dropping redundant colour and style (SGR) sequences from chafa frames.
+
+chafa sets both colours of a cell again when only one of them changed, and ends every line with a
+reset that the first colour of the next line undoes. The frames are written to the terminal as
+they are stored, so those bytes are paid for on every frame. minimize_sgr keeps track of the
+colours and styles in effect and only writes what changed, right before the next character.
+
+Every line is minimized on its own and starts in an unknown state: the renderer carries the colours
+over to the next line while the daemon client resets them after every line, so nothing can be
+assumed to be in effect before it's set on the line itself. A line ends in the same state it did
+before. Escape sequences that aren't understood are kept as they are and make the state unknown.
+tools/sgr_check.py renders frames before and after to cells and compares them.
+"""
+
+import re
+from functools import lru_cache
+
+from .ansi2txt import ESCAPE_SEQUENCE
+
+# an SGR sequence with its parameters, or any other escape sequence
+_TOKEN_RE = re.compile(r"\x1b\[([0-9;]*)m|" + ESCAPE_SEQUENCE)
+
+ATTRIBUTES = (
+    "fg",
+    "bg",
+    "bold",
+    "dim",
+    "italic",
+    "underline",
+    "blink",
+    "reverse",
+    "hidden",
+    "strike",
+)
+# None is unknown, colours are their parameters ("" is the default colour), styles are on or off
+UNKNOWN = dict.fromkeys(ATTRIBUTES)
+DEFAULT = {"fg": "", "bg": "", **dict.fromkeys(ATTRIBUTES[2:], False)}
+
+_STYLE_ON = {
+    1: "bold",
+    2: "dim",
+    3: "italic",
+    4: "underline",
+    5: "blink",
+    7: "reverse",
+    8: "hidden",
+    9: "strike",
+}
+_STYLE_CODES = {name: code for code, name in _STYLE_ON.items()}
+_STYLE_OFF = {
+    22: ("bold", "dim"),
+    23: ("italic",),
+    24: ("underline",),
+    25: ("blink",),
+    27: ("reverse",),
+    28: ("hidden",),
+    29: ("strike",),
+}
+_OFF_CODES = {names[0]: code for code, names in _STYLE_OFF.items()}
+
+
+# the same colours come back all through an animation
+@lru_cache(maxsize=4096)
+def parse_sgr(params: str) -> tuple[tuple[str, str | bool], ...] | None:
+    """
+    The (attribute, value) changes the parameters of an SGR sequence make, in order. None if some aren't understood.
+    Colours are compared as they are written, 38;2;1;2;3 and 38;2;01;2;3 count as different ones.
+    """
+    codes = params.split(";")
+    changes: list[tuple[str, str | bool]] = []
+    i = 0
+    try:
+        while i < len(codes):
+            code = int(codes[i] or 0)  # an empty parameter is a 0
+            if code == 0:
+                changes.extend(DEFAULT.items())
+            elif code in _STYLE_ON:
+                changes.append((_STYLE_ON[code], True))
+            elif code in _STYLE_OFF:
+                changes.extend((name, False) for name in _STYLE_OFF[code])
+            elif 30 <= code <= 37 or 90 <= code <= 97:
+                changes.append(("fg", str(code)))
+            elif 40 <= code <= 47 or 100 <= code <= 107:
+                changes.append(("bg", str(code)))
+            elif code in (39, 49):
+                changes.append(("fg" if code == 39 else "bg", ""))
+            elif code in (38, 48):
+                # 38;5;n or 38;2;r;g;b
+                length = {"5": 3, "2": 5}[codes[i + 1]]
+                if i + length > len(codes):
+                    return None
+                value = ";".join(codes[i : i + length])
+                changes.append(("fg" if code == 38 else "bg", value))
+                i += length - 1
+            else:
+                return None
+            i += 1
+    except (ValueError, KeyError, IndexError):
+        return None
+    return tuple(changes)
+
+
+def _codes(current: dict, wanted: dict) -> list[str]:
+    """The SGR parameters that turn current into wanted, for every attribute wanted knows."""
+    codes = []
+    for name in ("fg", "bg"):
+        value = wanted[name]
+        if value is not None and value != current[name]:
+            codes.append(value or ("39" if name == "fg" else "49"))
+
+    # bold and dim are turned off together
+    if (wanted["bold"] is False and current["bold"] is not False) or (
+        wanted["dim"] is False and current["dim"] is not False
+    ):
+        codes.append("22")
+        current = {**current, "bold": False, "dim": False}
+    for name in ATTRIBUTES[2:]:
+        value = wanted[name]
+        if value is None or value == current[name]:
+            continue
+        if value:
+            codes.append(str(_STYLE_CODES[name]))
+        else:  # bold and dim are off already
+            codes.append(str(_OFF_CODES[name]))
+    return codes
+
+
+def transition(current: dict, wanted: dict) -> str:
+    """The shortest SGR sequence that turns the current state into the wanted one, "" if they are the same."""
+    if current == wanted:
+        return ""
+    codes = _codes(current, wanted)
+    # a reset can't be used while an attribute is unknown, it would change it
+    if None not in wanted.values():
+        reset = ["0", *_codes(DEFAULT, wanted)]
+        if len(";".join(reset)) < len(";".join(codes)):
+            codes = reset
+    if not codes:
+        return ""
+    return "\x1b[" + ";".join(codes) + "m"
+
+
+def minimize_line(line: str) -> str:
+    out = []
+    current = dict(UNKNOWN)  # what the sequences written so far set
+    wanted = dict(UNKNOWN)  # what the sequences of the original line set
+    pos = 0
+    for m in _TOKEN_RE.finditer(line):
+        if m.start() > pos:
+            out.append(transition(current, wanted))
+            current = dict(wanted)
+            out.append(line[pos : m.start()])
+        pos = m.end()
+
+        params = m.group(1)
+        changes = None if params is None else parse_sgr(params)
+        if changes is not None:
+            wanted.update(changes)
+            continue
+        # anything else stays where it was, with the colours in effect before it
+        out.append(transition(current, wanted))
+        out.append(m.group())
+        current = dict(UNKNOWN)
+        wanted = dict(UNKNOWN)
+
+    if pos < len(line):
+        out.append(transition(current, wanted))
+        current = dict(wanted)
+        out.append(line[pos:])
+    # the line ends in the state it ended in before
+    out.append(transition(current, wanted))
+    return "".join(out)
+
+
+def minimize_sgr(frame: str) -> str:
+    """The frame with only the colour and style sequences that change something, it looks exactly the same."""
+    if "\x1b[" not in frame:
+        return frame
+    return "\n".join(minimize_line(line) for line in frame.split("\n"))
@@ -0,0 +1,193 @@
+"""
+Anifetch stats module for measuring whether playback keeps up with the playback rate, see --stats.
+
+Per frame it records how long drawing took and how late the frame was drawn compared to when it
+was due. Both go into histograms with 5% wide buckets, so percentiles are accurate to 5% and the
+memory used stays the same however long the animation plays.
+A frame counts as skipped when the next one was drawn before anything reached the terminal, e.g.
+because the terminal is refreshed less often than frames are drawn. Dropped frames weren't drawn
+at all, because the terminal couldn't keep up (see pacing.py).
+"""
+
+import math
+import sys
+import time
+from typing import IO, cast
+
+from .timing import span
+
+GROWTH = 1.05  # the ratio between the edges of a histogram bucket
+SMALLEST = 1e-6  # seconds, anything faster lands in the first bucket
+
+PERCENTILES = (50, 90, 99)
+
+
+class Histogram:
+    """Durations in seconds, bucketed by their logarithm."""
+
+    def __init__(self):
+        self.buckets: dict[int, int] = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def add(self, value: float):
+        value = max(value, 0.0)
+        index = int(math.log(max(value, SMALLEST) / SMALLEST, GROWTH))
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def upper_edge(self, index: int) -> float:
+        return SMALLEST * GROWTH ** (index + 1)
+
+    def percentile(self, p: float) -> float:
+        """The value p percent of the values are at most, as the upper edge of its bucket."""
+        if not self.count:
+            return 0.0
+        wanted = math.ceil(self.count * p / 100)
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= wanted:
+                return min(self.upper_edge(index), self.max)
+        return self.max
+
+    def summary_ms(self) -> dict:
+        summary = {
+            "min": 0.0 if not self.count else self.min * 1000,
+            "mean": 0.0 if not self.count else self.total / self.count * 1000,
+        }
+        for p in PERCENTILES:
+            summary[f"p{p}"] = self.percentile(p) * 1000
+        summary["max"] = self.max * 1000
+        return summary
+
+    def buckets_ms(self) -> list[list[float]]:
+        """[upper edge in ms, count] of every bucket that has values."""
+        return [
+            [self.upper_edge(index) * 1000, self.buckets[index]]
+            for index in sorted(self.buckets)
+        ]
+
+
+class CountingWriter:
+    """Passes everything through to a text stream, counting what gets written."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.bytes = 0
+        self.writes = 0
+
+    def write(self, text: str) -> int:
+        self.bytes += len(text.encode("utf-8", "replace"))
+        self.writes += 1
+        with span("terminal write"):
+            return self.stream.write(text)
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+class PlaybackStats:
+    def __init__(self, framerate: float):
+        self.framerate = framerate
+        self.draw = Histogram()
+        self.lateness = Histogram()
+        self.frames = 0
+        self.late_frames = 0  # drawn more than a frame interval after they were due
+        self.skipped_frames = 0
+        self.dropped_frames = 0  # not drawn at all, to stay on schedule
+        self.writer: CountingWriter | None = None
+        self._writes_at_last_draw = -1
+        self._first_draw = 0.0
+        self._last_draw = 0.0
+
+    def wrap(self, stream: IO[str]) -> IO[str]:
+        """Returns a stream to draw to instead of stream, so the bytes reaching the terminal get counted."""
+        self.writer = CountingWriter(stream)
+        # everything but write is passed through to stream
+        return cast(IO[str], self.writer)
+
+    def frame(self, lateness: float, draw_duration: float):
+        """Records a drawn frame: how many seconds after it was due drawing started, and how long drawing took."""
+        draw_start = time.perf_counter() - draw_duration
+        if not self.frames:
+            self._first_draw = draw_start
+        self._last_draw = draw_start
+        self.frames += 1
+        self.draw.add(draw_duration)
+        self.lateness.add(lateness)
+        if lateness > 1 / self.framerate:
+            self.late_frames += 1
+
+        if self.writer is not None:
+            if self.writer.writes == self._writes_at_last_draw:
+                self.skipped_frames += 1  # the previous frame never got to the terminal
+            self._writes_at_last_draw = self.writer.writes
+
+    def drop(self, count: int):
+        """Records frames that weren't drawn because the terminal couldn't keep up, see pacing.py."""
+        self.dropped_frames += count
+
+    def report(self) -> dict:
+        # from the first frame drawn to the last one, so frames - 1 intervals
+        duration = self._last_draw - self._first_draw
+        bytes_written = 0 if self.writer is None else self.writer.bytes
+        return {
+            "frames": self.frames,
+            "duration_s": duration,
+            "playback_rate": self.framerate,
+            "achieved_fps": (self.frames - 1) / duration if duration > 0 else None,
+            "draw_ms": self.draw.summary_ms(),
+            "lateness_ms": self.lateness.summary_ms(),
+            "late_frames": self.late_frames,
+            "skipped_frames": self.skipped_frames,
+            "dropped_frames": self.dropped_frames,
+            "bytes_written": bytes_written,
+            "bytes_per_frame": bytes_written / self.frames if self.frames else 0,
+            "histograms_ms": {
+                "draw": self.draw.buckets_ms(),
+                "lateness": self.lateness.buckets_ms(),
+            },
+        }
+
+
+def format_report(report: dict) -> str:
+    def row(name: str, summary: dict) -> str:
+        values = "  ".join(f"{key} {value:7.2f}" for key, value in summary.items())
+        return f"  {name:<12} {values}"
+
+    fps = report["achieved_fps"]
+    return "\n".join(
+        [
+            f"Playback: {report['frames']} frames in {report['duration_s']:.2f}s, "
+            + (f"{fps:.1f}" if fps is not None else "-")
+            + f" fps of {report['playback_rate']:g} wanted",
+            row("draw ms", report["draw_ms"]),
+            row("late ms", report["lateness_ms"]),
+            (
+                f"  late frames {report['late_frames']}, "
+                f"dropped frames {report['dropped_frames']}, "
+                f"skipped frames {report['skipped_frames']}, "
+                f"{report['bytes_written']} bytes written "
+                f"({report['bytes_per_frame']:.0f} per frame)"
+            ),
+        ]
+    )
+
+
+def write_stats(stats: PlaybackStats, path: str):
+    """Writes the report of stats as JSON to path, or a summary of it to stderr if path is "-"."""
+    report = stats.report()
+    if path == "-":
+        # the last frame may have been left on screen without a newline after it
+        print("\n" + format_report(report), file=sys.stderr)
+        return
+    import json
+
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(json.dumps(report, indent=2) + "\n")
@@ -0,0 +1,167 @@
+"""
+Anifetch timing module for measuring how long each stage of a run takes, see --profile.
+
+Spans are always recorded, timing a stage costs two perf_counter() calls and a lock. Times are
+relative to when the anifetch package was imported, which is as close to the start of the process
+as anifetch gets. Every stage keeps its exact count and total time, but only the first MAX_SPANS
+spans are kept one by one, so an endless animation doesn't grow the list forever.
+The spans can be written as a Chrome trace (--trace), to look at in chrome://tracing or Perfetto.
+"""
+
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+START = time.perf_counter()
+MAX_SPANS = 20000
+
+_lock = threading.Lock()
+# (name, start, end, native thread id) in seconds since START, appended from any thread
+SPANS: list[tuple[str, float, float, int]] = []
+# {native thread id: thread name} of every thread that recorded a span
+THREAD_NAMES: dict[int, str] = {}
+# {name: [count, total seconds, first start]}
+STAGES: dict[str, list] = {}
+# {name: seconds since START} of moments rather than stages, e.g. when the first frame was drawn
+MARKS: dict[str, float] = {}
+
+
+def elapsed() -> float:
+    return time.perf_counter() - START
+
+
+@contextmanager
+def span(name: str):
+    """Records how long the body takes as a stage called name. Stages can nest and repeat."""
+    start = time.perf_counter() - START
+    try:
+        yield
+    finally:
+        end = elapsed()
+        thread = threading.get_native_id()
+        with _lock:
+            stage = STAGES.get(name)
+            if stage is None:
+                STAGES[name] = [1, end - start, start]
+            else:
+                stage[0] += 1
+                stage[1] += end - start
+            if len(SPANS) < MAX_SPANS:
+                SPANS.append((name, start, end, thread))
+            if thread not in THREAD_NAMES:
+                THREAD_NAMES[thread] = threading.current_thread().name
+
+
+def mark(name: str):
+    """Records when name first happened."""
+    MARKS.setdefault(name, elapsed())
+
+
+def profile_report() -> dict:
+    """Every stage with how often it ran and how long it took in total, plus the spans themselves. Times are in milliseconds."""
+    with _lock:
+        spans = sorted(SPANS, key=lambda s: s[1])
+        stages = {name: list(stage) for name, stage in STAGES.items()}
+
+    # number the threads in the order they started recording, their ids mean nothing here
+    threads: dict[int, int] = {}
+    first_frame = MARKS.get("first_frame")
+    return {
+        "total_ms": elapsed() * 1000,
+        "time_to_first_frame_ms": None if first_frame is None else first_frame * 1000,
+        "marks_ms": {name: value * 1000 for name, value in MARKS.items()},
+        "stages": {
+            name: {
+                "count": count,
+                "total_ms": total * 1000,
+                "first_start_ms": first_start * 1000,
+            }
+            for name, (count, total, first_start) in sorted(
+                stages.items(), key=lambda item: item[1][2]
+            )
+        },
+        "spans": [
+            {
+                "name": name,
+                "start_ms": start * 1000,
+                "duration_ms": (end - start) * 1000,
+                "thread": threads.setdefault(thread, len(threads)),
+            }
+            for name, start, end, thread in spans
+        ],
+        "spans_dropped": sum(stage[0] for stage in stages.values()) - len(spans),
+    }
+
+
+def trace_events() -> dict:
+    """The spans and marks in the Chrome trace event format. Times are in microseconds."""
+    pid = os.getpid()
+    main_thread = threading.main_thread().native_id
+    with _lock:
+        spans = list(SPANS)
+        thread_names = dict(THREAD_NAMES)
+        stages_count = sum(stage[0] for stage in STAGES.values())
+
+    events: list[dict[str, object]] = [
+        {"name": "process_name", "ph": "M", "pid": pid, "args": {"name": "anifetch"}}
+    ]
+    for thread, thread_name in thread_names.items():
+        events.append(
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": pid,
+                "tid": thread,
+                "args": {"name": thread_name},
+            }
+        )
+    for name, start, end, thread in spans:
+        events.append(
+            {
+                "name": name,
+                "cat": "anifetch",
+                "ph": "X",
+                "ts": start * 1e6,
+                "dur": (end - start) * 1e6,
+                "pid": pid,
+                "tid": thread,
+            }
+        )
+    for name, value in MARKS.items():
+        events.append(
+            {
+                "name": name,
+                "cat": "anifetch",
+                "ph": "i",
+                "s": "p",
+                "ts": value * 1e6,
+                "pid": pid,
+                "tid": main_thread,
+            }
+        )
+    return {
+        "traceEvents": events,
+        "displayTimeUnit": "ms",
+        "otherData": {"spans_dropped": stages_count - len(spans)},
+    }
+
+
+def write_trace(path: str):
+    import json
+
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(trace_events(), f)
+
+
+def write_profile(path: str):
+    """Writes the profile_report as JSON to path, or to stderr if path is "-"."""
+    import json
+
+    text = json.dumps(profile_report(), indent=2)
+    if path == "-":
+        print(text, file=sys.stderr)
+    else:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
@@ -11,16 +11,19 @@ import re
 import subprocess
 import os
 import sys
-from importlib.metadata import version, PackageNotFoundError
 import shutil
+from bisect import bisect_left, bisect_right
 from copy import deepcopy
 from hashlib import sha256
 from typing import Literal
 import errno
 
+from .ansi2txt import ESCAPE_SEQUENCE, ansi2txt
+from .timing import span
+from .width import char_width, text_width, visible_width
 
-from platformdirs import user_data_dir
-import wcwidth
+# platformdirs, wcwidth and importlib.metadata are imported where they are used, they add up to a noticeable
+# part of the startup time and a cache hit needs none of them before the first frame is on screen.
 
 appname = "anifetch"
 appauthor = "anifetch"
@@ -115,13 +118,19 @@ def tput_el():  # tput clear to end of the line
 
 
 def get_terminal_width():
-    """Returns terminal width(columns)"""
-    return os.get_terminal_size().columns
+    """Returns terminal width(columns). Without a terminal (e.g. --benchmark-playback into a pipe) it's $COLUMNS or 80."""
+    try:
+        return os.get_terminal_size().columns
+    except OSError:
+        return shutil.get_terminal_size().columns
 
 
 def get_terminal_height():
-    """Returns terminal height(lines)"""
-    return os.get_terminal_size().lines
+    """Returns terminal height(lines). Without a terminal it's $LINES or 24."""
+    try:
+        return os.get_terminal_size().lines
+    except OSError:
+        return shutil.get_terminal_size().lines
 
 
 def hide_cursor():
@@ -148,67 +157,137 @@ def show_cursor():
         sys.stdout.flush()
 
 
-ANSI_RE = re.compile(r"\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])")
-
-
-def clean_ansi(raw_text: str):
-    return ANSI_RE.sub("", raw_text)
-
-
-def strip_ansi(text):
-    ansi_escape = re.compile(r"\x1b\[[0-9;]*m")  # color only
-    return ansi_escape.sub("", text)
-
-
 def get_character_width(raw: str):
     """Gives the raw terminal width of a particular string by stripping ANSI codes, removing \n \t \r and using wcwidth to get the actual character width."""
-    return wcwidth.wcswidth(
-        clean_ansi(raw).replace("\n", "").replace("\r", "").replace("\t", "")
+    return text_width(
+        ansi2txt(raw).replace("\n", "").replace("\r", "").replace("\t", "")
     )
 
 
-def truncate_line(line: str, max_width: int):
-    """Does not keep the trailing \n"""
-    if max_width <= 0 or not line:
-        return ""
+# an escape sequence, a run of printable ascii (one column per character) or any other single character
+_WIDTH_CHUNK_RE = re.compile(f"({ESCAPE_SEQUENCE})|([\\x20-\\x7e]+)|(.)", re.DOTALL)
+# the parameters of a colour/style (SGR) sequence
+_SGR_PARAMS_RE = re.compile(r"\x1b\[([0-9;]*)m")
 
-    # Remove ANSI codes to get visible text length
-    visible_length = get_character_width(line)
 
-    total_output = ""
-    if visible_length <= max_width:
-        total_output = f"{line}\r"
-    else:
-        out: list[str] = []
+class TruncationIndex:
+    """
+    A line measured once so it can be truncated to any width cheaply, e.g. on every resize.
+    Truncating keeps a prefix of the line, so it's enough to know, for every visible character,
+    where it starts in the string and the width before and after it. Finding where to cut is then
+    two binary searches.
+    The SGR sequences in effect are recorded too, at every visible character and at the end of the line.
+    """
+
+    def __init__(self, line: str):
+        self.line = line
+        self.full = line.replace("\n", "").replace("\r", "")
+        self.visible_length = get_character_width(line)
+
+        # per visible (not escape sequence) character: offset, width before it, width after it, SGR state
+        self.offsets: list[int] = []
+        self.before: list[int] = []
+        self.after: list[int] = []
+        self.sgr: list[str] = []
         width = 0
-        i = 0
-
-        while i < len(line) and width < max_width:
-            # if ansi sequence starts, copy it to out
-            m = ANSI_RE.match(line, i)
-            if m:
-                out.append(m.group(0))
-                i = m.end()
+        # the SGR sequences since the last reset, joined
+        state = ""
+        for m in _WIDTH_CHUNK_RE.finditer(line):
+            escape, ascii_run, other = m.groups()
+            if escape:
+                sgr = _SGR_PARAMS_RE.fullmatch(escape)
+                if sgr is not None:
+                    params = sgr.group(1)
+                    if params in ("", "0"):
+                        state = ""
+                    elif params.startswith("0;"):
+                        state = escape
+                    else:
+                        state += escape
                 continue
-            ch = line[i]
-            i += 1
+            start = m.start()
+            if ascii_run:
+                self.offsets.extend(range(start, start + len(ascii_run)))
+                self.before.extend(range(width, width + len(ascii_run)))
+                width += len(ascii_run)
+                self.after.extend(range(width - len(ascii_run) + 1, width + 1))
+                self.sgr.extend([state] * len(ascii_run))
+            else:
+                self.offsets.append(start)
+                self.before.append(width)
+                width += max(char_width(other), 0)
+                self.after.append(width)
+                self.sgr.append(state)
+        self.end_sgr = state
+
+    def sgr_at(self, column: int) -> str:
+        """The SGR sequences in effect where the character at column (0 based) is drawn."""
+        i = bisect_right(self.before, column) - 1
+        return self.sgr[i] if i >= 0 else ""
+
+    def truncate(self, max_width: int, keep_sgr: bool = False) -> str:
+        """
+        Does not keep the trailing \\n. Lines that don't fit are cut and get a reset appended.
+        With keep_sgr, a cut line sets the SGR state the whole line ends in again after the reset,
+        so whatever is drawn after it (e.g. the next line of the template) looks the same as before cutting.
+        """
+        if max_width <= 0 or not self.line:
+            return ""
+        if self.visible_length <= max_width:
+            return self.full
+
+        # the first character that doesn't fit, and the first one that starts past max_width
+        overflow = bisect_right(self.after, max_width)
+        past = bisect_left(self.before, max_width)
+        count = len(self.offsets)
+        if past <= overflow and past < count:
+            # the line is full, escape sequences after the last character are left out
+            end = self.offsets[past - 1] + 1
+        elif overflow < count:
+            end = self.offsets[overflow]
+        elif count and self.after[-1] >= max_width:
+            end = self.offsets[-1] + 1
+        else:
+            end = len(self.line)
+        cut = self.line[:end].replace("\n", "").replace("\r", "") + "\x1b[0m"
+        return cut + self.end_sgr if keep_sgr else cut
 
-            w: int = wcwidth.wcwidth(ch)
-            if w < 0:
-                w = 0
 
+def truncate_line(line: str, max_width: int):
+    """Does not keep the trailing \\n. For truncating the same line to many widths, use TruncationIndex."""
+    if max_width <= 0 or not line:
+        return ""
+    if get_character_width(line) <= max_width:
+        return line.replace("\n", "").replace("\r", "")
+
+    # walk until the line is full, ascii runs are cut without looking at every character
+    width = 0
+    end = len(line)
+    for m in _WIDTH_CHUNK_RE.finditer(line):
+        if width >= max_width:
+            end = m.start()
+            break
+        escape, ascii_run, other = m.groups()
+        if escape:
+            continue
+        if ascii_run:
+            room = max_width - width
+            if len(ascii_run) >= room:
+                end = m.start() + room
+                break
+            width += len(ascii_run)
+        else:
+            w = max(char_width(other), 0)
             if width + w > max_width:
+                end = m.start()
                 break
-            out.append(ch)
             width += w
-        out.append("\x1b[0m")
-        total_output = "".join(out)
-    total_output = total_output.replace("\n", "")
-    total_output = total_output.replace("\r", "")
-    return total_output
+    return line[:end].replace("\n", "").replace("\r", "") + "\x1b[0m"
 
 
 def get_version_of_anifetch():
+    from importlib.metadata import PackageNotFoundError, version
+
     try:
         return version("anifetch-cli")
     except PackageNotFoundError:
@@ -232,7 +311,7 @@ def normal_print(should_print: bool, *msg):
 
 
 def get_text_length_of_formatted_text(text: str):
-    text = strip_ansi(text)
+    text = ansi2txt(text)
     return len(text)
     # return get_character_width(text)
 
@@ -298,6 +377,8 @@ def extract_audio_from_file(CACHE_PATH, file: str, extension):
 def get_data_path():
     # on linux: /home/[username]/.local/share/anifetch
     # windows: C:\\Users\\[Username]\\AppData\\Local\\anifetch\\anifetch
+    from platformdirs import user_data_dir
+
     base = pathlib.Path(user_data_dir(appname, appauthor))
     base.mkdir(parents=True, exist_ok=True)
     return base
@@ -335,6 +416,76 @@ def default_asset_presence_check(asset_dir: Path):
     _copy_tree(src_assets_dir, asset_dir, overwrite=False)
 
 
+def get_file_fingerprint(path: Path) -> tuple[int, int]:
+    """Returns (size, mtime in ns) of a file. Cheap way of telling whether a file has changed without reading it."""
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+
+FICLONE = 0x40049409  # linux/fs.h, _IOW(0x94, 9, int)
+
+
+def _reflink(src: Path, dst: Path) -> bool:
+    """Tries to make dst a copy-on-write clone of src. Returns whether it worked."""
+    if not sys.platform.startswith("linux"):
+        return False
+    import fcntl
+
+    try:
+        with open(src, "rb") as s, open(dst, "wb") as d:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+    except OSError:
+        dst.unlink(missing_ok=True)
+        return False
+    shutil.copystat(src, dst)
+    return True
+
+
+def _link_or_copy(src: Path, dst: Path):
+    """Reflink if the filesystem supports it, hardlink if src and dst are on the same filesystem, copy otherwise.
+    A plain copy keeps the mtime so the fingerprint still matches next time."""
+    if _reflink(src, dst):
+        return
+    try:
+        os.link(src, dst)
+        return
+    except OSError:
+        pass
+    shutil.copy2(src, dst)
+
+
+def import_asset(source: Path, asset_dir: Path) -> Path:
+    """
+    Makes the given media file available in asset_dir and returns its path in there.
+    If the asset is already there and its fingerprint matches the source, nothing is copied, the source is only stat'ed.
+    """
+    dest = asset_dir / source.name
+    src_stat = os.stat(source)
+    try:
+        dest_stat = os.stat(dest)
+    except FileNotFoundError:
+        dest_stat = None
+
+    if dest_stat is not None:
+        # same file (already in assets, or hardlinked by a previous run)
+        if os.path.samestat(src_stat, dest_stat):
+            return dest
+        if (dest_stat.st_size, dest_stat.st_mtime_ns) == (
+            src_stat.st_size,
+            src_stat.st_mtime_ns,
+        ):
+            return dest
+
+    # import under a temporary name and swap it in, so a half copied asset is never visible.
+    tmp = dest.with_name(f".{dest.name}.{os.getpid()}.tmp")
+    try:
+        _link_or_copy(source, tmp)
+        os.replace(tmp, dest)
+    finally:
+        tmp.unlink(missing_ok=True)
+    return dest
+
+
 def get_neofetch_status():  # will still save the rendered chafa in cache in any case
     try:
         # check the result of running neofetch with --version
@@ -460,7 +611,7 @@ def center_template_to_animation(
 def make_template_from_fetch_lines(
     fetch_lines: list[str], PAD_LEFT, GAP, WIDTH
 ) -> tuple[list[str], int]:
-    template: list[str] = "\n".join(fetch_lines)
+    template: list[str] = fetch_lines[:]  # copy
     # Only do this once instead of for every line.
     template_actual_width = get_text_length_of_formatted_text(fetch_lines[0])
     # template_actual_width = max((get_text_length_of_formatted_text(line) for line in fetch_lines), default=0)
@@ -539,31 +690,76 @@ def clean_cache_args(cache_args: dict) -> dict:
         "no_key_exit",
         "no_input_restore",
         "config",
+        "cache_max_size",
+        "cache_max_entries",
+        "cache_gc",
+        "prebuild",
+        "widths",
+        "fixed_width",
+        "daemon",
+        "benchmark_playback",
+        "benchmark_sink",
+        "profile",
+        "stats",
+        "trace",
     )
     cleaned = deepcopy(cache_args)  # need to deepcopy to not modify original dict.
     for key in args_to_remove:
         if key in cleaned:
             del cleaned[key]
+    # truecolor renders like caches made before the colour depth could be chosen, keep their hashes
+    if cleaned.get("color_depth") == "truecolor":
+        del cleaned["color_depth"]
     return cleaned
 
 
-def check_args_hash_same(args1: dict, args2: dict):
-    for a in (args1, args2):
-        if a.get("hash", None) is None:
-            raise KeyError(f"{args1} doesn't have a hash!")
-    if args1["hash"] == args2["hash"]:
-        return True
-    return False
+# --color-depth: the colour mode chafa is asked for. truecolor passes nothing and keeps chafa's own choice,
+# which is what caches made before the colour depth could be chosen were rendered with
+CHAFA_COLORS = {"256": "256", "16": "16"}
+
+
+def detect_color_depth(environ) -> str:
+    """The colour depth a terminal supports, going by its COLORTERM and TERM like most programs do."""
+    colorterm = environ.get("COLORTERM", "").lower()
+    term = environ.get("TERM", "").lower()
+    if colorterm in ("truecolor", "24bit") or term.endswith("-direct"):
+        return "truecolor"
+    if "256color" in term:
+        return "256"
+    if not term or environ.get("WT_SESSION"):
+        # nothing to go by (e.g. Windows), keep the colours chafa gives
+        return "truecolor"
+    return "16"
+
+
+def resolve_color_depth(args, environ=None):
+    """Replaces --color-depth auto with the depth of the terminal. It decides the cache entry, so this runs before the cache key is made."""
+    if args.color_depth == "auto":
+        args.color_depth = detect_color_depth(
+            os.environ if environ is None else environ
+        )
 
 
-def find_corresponding_cache(args: dict, all_saved_caches_list: list[dict]):
-    corresponding = None
-    for saved_cache_dict in all_saved_caches_list:
-        if check_args_hash_same(args, saved_cache_dict):
-            corresponding = saved_cache_dict
-    if corresponding is None:
-        raise LookupError("Couldn't find corresponding dict in all saved caches.")
-    return corresponding
+def make_cache_args(args) -> dict:
+    """Returns the arguments that decide the cache entry, with their hash under the "hash" key."""
+    args_dict = {key: value for key, value in args._get_kwargs()}
+    cleaned_dict = clean_cache_args(args_dict)
+    cleaned_dict["hash"] = hash_of_cache_args(cleaned_dict)
+    return cleaned_dict
+
+
+def make_decode_args(args, IS_TRANSPARENT: bool) -> dict:
+    """Returns what decides the decoded frames of the media, with their hash under the "hash" key. Chafa settings aren't part of it."""
+    decode_dict = {
+        "filename": args.filename,
+        "source": list(get_file_fingerprint(args.filename)),
+        "framerate": args.framerate,
+        "quality": args.quality,
+        "chroma": args.chroma,
+        "transparent": IS_TRANSPARENT,
+    }
+    decode_dict["hash"] = hash_of_cache_args(decode_dict)
+    return decode_dict
 
 
 def hash_dict(d: dict):
@@ -582,17 +778,25 @@ def hash_of_cache_args(args: dict):
     return hash
 
 
-def get_caches_json(CACHE_LIST_PATH):
-    if (CACHE_LIST_PATH).exists():
-        with open(CACHE_LIST_PATH, "r") as f:
-            caches_data: list[dict] = json.load(f)
-        return caches_data
-    return []
+SIZE_UNITS = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+
 
+def parse_size(text: str) -> int:
+    """Parses sizes like '500M', '2G', '1.5g' or '1048576' into bytes."""
+    m = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMGTkmgt]?)i?[Bb]?\s*", text)
+    if m is None:
+        raise ValueError(f"Invalid size: {text}")
+    number, unit = m.groups()
+    return int(float(number) * SIZE_UNITS[unit.upper()])
 
-def save_caches_json(CACHE_LIST_PATH, data):
-    with open(CACHE_LIST_PATH, "w") as f:
-        json.dump(data, f, indent=2)
+
+def format_size(size: int) -> str:
+    value = float(size)
+    for unit in ("B", "KB", "MB", "GB"):
+        if value < 1024:
+            return f"{value:.0f} {unit}" if unit == "B" else f"{value:.1f} {unit}"
+        value /= 1024
+    return f"{value:.1f} TB"
 
 
 def args_checker(allowed_alternatives, args):
@@ -612,20 +816,25 @@ def threaded_chafa_frame_gen(
     WIDTH: int,
     HEIGHT: int,
     chafa_args: str,
-    centered: bool,
-    len_fetch: int,
-    fetch_output: list[str],
-) -> tuple[int, str]:
+) -> tuple[int, str, int]:
+    """Renders a frame with chafa. Returns its index, the frame and how many characters chafa printed for it."""
+    from .sgr import minimize_sgr
+
     # f = 00001.png
     path = VIDEO_DIR / f
-    frame = render_frame(path, WIDTH, HEIGHT, chafa_args)
+    with span("chafa"):
+        frame = render_frame(path, WIDTH, HEIGHT, chafa_args)
 
     chafa_lines = frame.splitlines()
     out = "\n".join(chafa_lines)
+    chafa_size = len(out)
+    # the frame is written to the terminal as stored, every time it's played
+    with span("minimize sgr"):
+        out = minimize_sgr(out)
 
     with open((OUTPUT_DIR / f).with_suffix(".txt"), "w", encoding="utf-8") as file:
         file.write(out)
-    return i, out
+    return i, out, chafa_size
 
 
 def check_is_image(filename: pathlib.Path):
@@ -693,7 +902,45 @@ def check_video_transparency(filename: pathlib.Path):
     return "a" in pix_fmt
 
 
-def split_to_frames(args, CACHE_PATH, IS_TRANSPARENT, stdout, stderr):
+def detect_media_type(
+    filename: pathlib.Path, probe: bool = True
+) -> tuple[bool, bool, bool, bool | None]:
+    """
+    Returns (is_image, is_gif, is_video, is_transparent) of the file.
+    Whether a video is transparent takes running ffprobe. Without probe it's None for videos,
+    the build probes it when the video has to be decoded (see probe_transparency), so a cache hit doesn't.
+    """
+    IS_IMAGE = False
+    IS_GIF = False
+    IS_VIDEO = False
+    IS_TRANSPARENT: bool | None = False
+    if filename.suffix == ".gif":
+        IS_GIF = True
+        IS_TRANSPARENT = True
+    else:
+        IS_VIDEO = check_is_video(filename)
+        if IS_VIDEO:
+            IS_TRANSPARENT = check_video_transparency(filename) if probe else None
+    if not IS_GIF and not IS_VIDEO:
+        IS_IMAGE = check_is_image(filename)
+        IS_TRANSPARENT = check_image_transparency(filename)
+    return IS_IMAGE, IS_GIF, IS_VIDEO, IS_TRANSPARENT
+
+
+def probe_transparency(filename: pathlib.Path, IS_TRANSPARENT: bool | None) -> bool:
+    """IS_TRANSPARENT as returned by detect_media_type, probing the video if it wasn't probed yet."""
+    if IS_TRANSPARENT is None:
+        with span("probe transparency"):
+            return check_video_transparency(filename)
+    return IS_TRANSPARENT
+
+
+def parse_int_list(text: str) -> list[int]:
+    """Parses a comma separated list like '30,40,60'."""
+    return [int(value) for value in text.split(",") if value.strip()]
+
+
+def split_to_frames(args, VIDEO_DIR, IS_TRANSPARENT, stdout, stderr):
     return subprocess.run(
         [
             "ffmpeg",
@@ -703,9 +950,9 @@ def split_to_frames(args, CACHE_PATH, IS_TRANSPARENT, stdout, stderr):
             f"fps={args.framerate},format=rgba",
             "-q:v",
             str(min(max(args.quality or 6, 2), 10)),  # 2-5 high quality, 6-10 lower
-            str(CACHE_PATH / "video/%05d.png")
+            str(VIDEO_DIR / "%05d.png")
             if IS_TRANSPARENT
-            else str(CACHE_PATH / "video/%05d.jpg"),
+            else str(VIDEO_DIR / "%05d.jpg"),
         ],
         stdout=stdout,
         stderr=stderr,
@@ -715,11 +962,7 @@ def split_to_frames(args, CACHE_PATH, IS_TRANSPARENT, stdout, stderr):
 
 def printable_len(raw: str):
     """Returns printable length of the string."""
-    cleaned = clean_ansi(raw)
-    w = wcwidth.wcswidth(cleaned)
-
-    # it can return -1, so if it does return -1 do per character
-    return w if w >= 0 else sum(max(wcwidth.wcwidth(c), 0) for c in cleaned)
+    return visible_width(ansi2txt(raw))
 
 
 def debug_write_str(t: str):
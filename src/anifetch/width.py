@@ -0,0 +1,55 @@
+"""
+Anifetch width module for measuring how many terminal columns text takes.
+
+Everything here gives the same results as wcwidth, it just avoids calling it. chafa's default
+`--symbols ascii` output and most fetch output is plain ascii, which is one column per character,
+and the glyphs chafa and fetch configs use besides ascii (box drawing, blocks, braille, sextants)
+are one column wide too. Only other text is measured by wcwidth, which is imported when first needed.
+"""
+
+import re
+
+# code points wcwidth measures as exactly one column, checked by tools/width_bench.py
+NARROW_RANGES = (
+    (0x20, 0x7E),  # printable ascii
+    (0xA0, 0x17F),  # latin-1 supplement, latin extended-a
+    (0x2190, 0x21FF),  # arrows
+    (0x2500, 0x259F),  # box drawing, block elements
+    (0x25A0, 0x25FC),  # geometric shapes, U+25FD and U+25FE are wide emoji
+    (0x25FF, 0x25FF),
+    (0x2800, 0x28FF),  # braille patterns
+    (0x1FB00, 0x1FBFF),  # symbols for legacy computing (sextants, wedges)
+)
+
+_NARROW_RE = re.compile(
+    "[" + "".join(f"{chr(start)}-{chr(end)}" for start, end in NARROW_RANGES) + "]*"
+)
+_NARROW_CHARS = frozenset(
+    chr(code) for start, end in NARROW_RANGES for code in range(start, end + 1)
+)
+
+
+def char_width(char: str) -> int:
+    """wcwidth of a single character: -1 for control characters, 0 for combining ones, 1 or 2 otherwise."""
+    if char in _NARROW_CHARS:
+        return 1
+    from wcwidth import wcwidth
+
+    return wcwidth(char)
+
+
+def text_width(text: str) -> int:
+    """wcswidth of text: its width in columns, or -1 if it contains a control character."""
+    if text.isascii() and text.isprintable():
+        return len(text)
+    if _NARROW_RE.fullmatch(text):
+        return len(text)
+    from wcwidth import wcswidth
+
+    return wcswidth(text)
+
+
+def visible_width(text: str) -> int:
+    """Like text_width, but control characters count as zero columns instead of making it -1."""
+    width = text_width(text)
+    return width if width >= 0 else sum(max(char_width(c), 0) for c in text)
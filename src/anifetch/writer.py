@@ -0,0 +1,128 @@
+"""
+Anifetch writer module for getting frames to the terminal without blocking the draw loop.
+
+Writing to a stalled terminal (a paused tmux pane, a slow link, a terminal scrolled back...) blocks
+until the terminal takes the output again, and with it key polling and the fetch refresh. The
+FrameWriter does the writing in its own thread instead. At most one frame waits to be written:
+a newer frame replaces it, so once the terminal takes output again it gets the newest frame and not
+everything that was drawn in the meantime. Everything that isn't a frame (entering the alternate
+screen, the fetch output...) is written in order and never dropped.
+"""
+
+import time
+from collections import deque
+from collections.abc import Callable
+from contextlib import contextmanager
+from threading import Condition, Thread
+from typing import IO, AnyStr
+
+
+class FrameWriter(IO[AnyStr]):
+    """Writes to stream from a thread. Like stream, takes str or bytes, whichever stream takes."""
+
+    def __init__(self, stream, on_frame_written: Callable[[float], None] | None = None):
+        self.stream = stream
+        # called with how many seconds writing a frame took, e.g. FramePacer.record_write
+        self.on_frame_written = on_frame_written
+        self.dropped_frames = 0  # replaced by a newer frame before they got written
+        # the terminal went away, nothing gets written after it
+        self.error: OSError | None = None
+
+        # (pieces, is a frame, called once the pieces are written)
+        self._queue: deque[tuple[list, bool, Callable[[], None] | None]] = deque()
+        self._condition = Condition()
+        self._closing = False
+        self._frame_pieces: list | None = None  # collected by frame()
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def write(self, data: AnyStr) -> int:
+        """Queues data to be written after everything before it. Inside frame(), it's part of the frame instead."""
+        if self._frame_pieces is not None:
+            self._frame_pieces.append(data)
+        else:
+            self._put([data], is_frame=False)
+        return len(data)
+
+    def write_frame(self, data: AnyStr):
+        """Queues a complete frame, replacing a frame that is still waiting to be written."""
+        self._put([data], is_frame=True)
+
+    def after_written(self, callback: Callable[[], None]):
+        """Calls callback from the writer's thread once everything queued so far has been written."""
+        self._put([], is_frame=False, callback=callback)
+
+    @contextmanager
+    def frame(self):
+        """Whatever gets written in here is written as one frame, see write_frame."""
+        self._frame_pieces = []
+        try:
+            yield
+            pieces = self._frame_pieces
+        finally:
+            self._frame_pieces = None
+        if pieces:
+            self._put(pieces, is_frame=True)
+
+    def flush(self):
+        pass  # the thread flushes after every write, see close for waiting until everything is written
+
+    def writable(self) -> bool:
+        return True
+
+    def isatty(self) -> bool:
+        return self.stream.isatty()
+
+    def fileno(self) -> int:
+        return self.stream.fileno()
+
+    @property
+    def encoding(self) -> str:
+        # rich's Console picks the characters it draws with by this
+        return getattr(self.stream, "encoding", None) or "utf-8"
+
+    def close(self):
+        """Waits until everything queued is written, then stops the thread."""
+        with self._condition:
+            self._closing = True
+            self._condition.notify()
+        self._thread.join()
+
+    def _put(
+        self,
+        pieces: list,
+        is_frame: bool,
+        callback: Callable[[], None] | None = None,
+    ):
+        with self._condition:
+            if self.error is not None or self._closing:
+                return
+            if is_frame and self._queue and self._queue[-1][1]:
+                self._queue.pop()
+                self.dropped_frames += 1
+            self._queue.append((pieces, is_frame, callback))
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._queue and not self._closing:
+                    self._condition.wait()
+                if not self._queue:
+                    return
+                pieces, is_frame, callback = self._queue.popleft()
+
+            start = time.perf_counter()
+            try:
+                for piece in pieces:
+                    self.stream.write(piece)
+                self.stream.flush()
+            except OSError as e:
+                with self._condition:
+                    self.error = e
+                    self._queue.clear()
+                return
+            if is_frame and self.on_frame_written is not None:
+                self.on_frame_written(time.perf_counter() - start)
+            if callback is not None:
+                callback()
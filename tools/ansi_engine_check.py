@@ -0,0 +1,135 @@
+# tools/ansi_engine_check.py
+
+"""
+Differential check of the cursor movement expansion engines in ansi_process.py.
+The cell engine has to produce byte-identical output to the reference engine, this runs both on
+the fetch output corpus in tools/fixtures/fetch/ and on randomly generated lines, and times them.
+
+Usage: python tools/ansi_engine_check.py [--fuzz 20000] [--seed 0] [fetch output files...]
+"""
+
+import argparse
+import pathlib
+import random
+import sys
+import time
+
+from anifetch.ansi_process import expand_ansi_movement_seq
+
+FIXTURES = pathlib.Path(__file__).parent / "fixtures" / "fetch"
+
+# pieces the random lines are made of, weighted towards what fetch outputs contain
+TEXT = ["a", "bc", "OS", ": ", " ", "═══", "║", "█", "用户", "💻", "é", "\t", "-" * 12]
+SGR = ["\x1b[0m", "\x1b[1;34m", "\x1b[32m", "\x1b[m", "\x1b[38;5;208m", "\x1b[1m"]
+OTHER = ["\x1b[?25l", "\x1b[?7h", "\u200d", "\ufe0f", "\x9b31m", "\x1b[2A", "\x1b[H"]
+
+
+def random_line(rng: random.Random) -> str:
+    pieces = []
+    for _ in range(rng.randint(0, 14)):
+        kind = rng.random()
+        if kind < 0.4:
+            pieces.append(rng.choice(TEXT))
+        elif kind < 0.55:
+            pieces.append(rng.choice(SGR))
+        elif kind < 0.65:
+            pieces.append(f"\x1b[{rng.choice(['', '0', '1', '3', '12'])}C")
+        elif kind < 0.75:
+            pieces.append(f"\x1b[{rng.choice(['', '1', '2', '5', '20'])}D")
+        elif kind < 0.82:
+            pieces.append(f"\x1b[{rng.choice(['', '0', '1', '4', '9'])}G")
+        elif kind < 0.86:
+            pieces.append("\r")
+        elif kind < 0.9:
+            pieces.append(rng.choice(["\x1b[s", "\x1b[u"]))
+        elif kind < 0.95:
+            pieces.append(f"\x1b[{rng.choice(['', '0', '1', '2'])}K")
+        else:
+            pieces.append(rng.choice(OTHER))
+    return "".join(pieces)
+
+
+def compare(lines: list[str], label: str) -> int:
+    """Returns how many lines differ between the two engines, printing the first few."""
+    cells = expand_ansi_movement_seq(lines)
+    reference = expand_ansi_movement_seq(lines, reference=True)
+    mismatches = [
+        (line, got, want)
+        for line, got, want in zip(lines, cells, reference)
+        if got != want
+    ]
+    for line, got, want in mismatches[:5]:
+        print(f"  {label}: {line!r}\n    cells:     {got!r}\n    reference: {want!r}")
+    return len(mismatches)
+
+
+def best_time(function, repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        st = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - st)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("files", nargs="*", type=pathlib.Path)
+    parser.add_argument(
+        "--fuzz", type=int, default=20000, help="random lines to compare"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    files = args.files or sorted(FIXTURES.glob("*.txt"))
+    failed = False
+    for file in files:
+        lines = file.read_text(encoding="utf-8").splitlines()
+        mismatches = compare(lines, file.name)
+        cells_time = best_time(lambda lines=lines: expand_ansi_movement_seq(lines))
+        reference_time = best_time(
+            lambda lines=lines: expand_ansi_movement_seq(lines, reference=True)
+        )
+        status = "ok  " if not mismatches else "FAIL"
+        print(
+            f"{status} {file.name}: {len(lines)} lines, {mismatches} differ, cells {cells_time * 1000:.2f} ms, reference {reference_time * 1000:.2f} ms"
+        )
+        failed = failed or mismatches > 0
+
+    rng = random.Random(args.seed)
+    fuzz_lines = [random_line(rng) for _ in range(args.fuzz)]
+    mismatches = compare(fuzz_lines, "random")
+    status = "ok  " if not mismatches else "FAIL"
+    print(f"{status} {args.fuzz} random lines, {mismatches} differ")
+    failed = failed or mismatches > 0
+
+    # a long line with many moves, which is quadratic for the reference engine. No colours: both engines
+    # repeat every earlier SGR sequence after each overwrite, which makes such a line grow exponentially.
+    long_line = "".join(
+        f"key{i}\x1b[3C value 值{i}\x1b[9D║\x1b[{12 * i + 1}G" for i in range(300)
+    )
+    mismatches = compare([long_line], "long line")
+    cells_time = best_time(lambda: expand_ansi_movement_seq([long_line]), 3)
+    reference_time = best_time(
+        lambda: expand_ansi_movement_seq([long_line], reference=True), 1
+    )
+    status = "ok  " if not mismatches else "FAIL"
+    print(
+        f"{status} long line ({len(long_line)} chars, 900 moves): cells {cells_time * 1000:.1f} ms, reference {reference_time * 1000:.1f} ms"
+    )
+    failed = failed or mismatches > 0
+
+    # every token should cost about as much as the text it writes, so 4 times the moves take about 4 times as long
+    longer_line = "".join(
+        f"key{i}\x1b[3C value 值{i}\x1b[9D║\x1b[{12 * i + 1}G" for i in range(1200)
+    )
+    longer_time = best_time(lambda: expand_ansi_movement_seq([longer_line]), 3)
+    print(
+        f"     longer line (3600 moves): cells {longer_time * 1000:.1f} ms, {longer_time / cells_time:.1f}x the 900 moves"
+    )
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
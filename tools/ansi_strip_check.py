@@ -0,0 +1,181 @@
+# tools/ansi_strip_check.py
+
+# SPDX-License-Identifier: MIT AND AGPL-3.0-only
+
+"""
+Differential check and benchmark of the escape sequence stripping in ansi2txt.py.
+The regex has to give exactly what the original character at a time ansi2txt scanner gives,
+on chafa frames, on the fetch outputs in tools/fixtures/fetch/ and on random text, and has to be
+at least --min-speedup times faster on the frames (truecolor chafa-like ones without --cache).
+
+Usage: python tools/ansi_strip_check.py [--cache <cache dir> ...] [--fuzz 50000] [--min-speedup 10]
+"""
+
+import argparse
+import pathlib
+import random
+import sys
+import time
+
+from anifetch.ansi2txt import ansi2txt
+from anifetch.cache import load_frames
+
+FIXTURES = pathlib.Path(__file__).parent / "fixtures" / "fetch"
+
+# pieces the random text is made of, every branch of the scanner gets hit often
+PIECES = [
+    "\x1b", "\x1b[", "\x1b]", "\x1b%", "[", "]", "%", "0", "8", "38;2;1;2;3", ";",
+    "?", "m", "K", "(B", "\x07", "\r", "\n", "\r\n", "a", "text ", "█", "é", "\t",
+]  # fmt: skip
+
+
+# Original code from https://github.com/mmlb/ansi2txt, the engine ansi2txt.py used before
+def reference_ansi2txt(text: str) -> str:
+    EOF = ""
+    pos = 0
+    output = []
+
+    def getchar():
+        nonlocal pos
+        if pos >= len(text):
+            return EOF
+        ch = text[pos]
+        pos += 1
+        return ch
+
+    ch = None
+
+    while ch != EOF:
+        ch = getchar()
+
+        while ch == "\r":
+            ch = getchar()
+            if ch != "\n":
+                output.append("\r")
+
+        if ch == "\x1b":
+            ch = getchar()
+
+            if ch == "[":
+                ch = getchar()
+                while ch == ";" or ("0" <= ch <= "9") or ch == "?":
+                    ch = getchar()
+
+            elif ch == "]":
+                ch = getchar()
+                if ch != EOF and "0" <= ch <= "9":
+                    while True:
+                        ch = getchar()
+                        if ch == EOF or ord(ch) == 7:
+                            break
+                        elif ch == "\x1b":
+                            ch = getchar()
+                            break
+
+            elif ch == "%":
+                ch = getchar()
+
+        elif ch != EOF:
+            output.append(ch)
+
+    return "".join(output)
+
+
+def chafa_like_frame(rng: random.Random, width: int, height: int) -> str:
+    symbols = " .:-=+*#%@▀▄█▌▐"
+    lines = []
+    for _ in range(height):
+        cells = [
+            f"\x1b[38;2;{rng.randrange(256)};{rng.randrange(256)};{rng.randrange(256)}m{rng.choice(symbols)}"
+            for _ in range(width)
+        ]
+        lines.append("".join(cells) + "\x1b[0m")
+    return "\x1b[?25l" + "\n".join(lines) + "\x1b[?25h"
+
+
+def compare(texts: list[str], label: str) -> int:
+    """Returns how many texts are stripped differently, printing the first few."""
+    mismatches = [
+        (text, got, want)
+        for text in texts
+        if (got := ansi2txt(text)) != (want := reference_ansi2txt(text))
+    ]
+    for text, got, want in mismatches[:5]:
+        print(f"  {label}: {text!r}\n    regex:     {got!r}\n    reference: {want!r}")
+    return len(mismatches)
+
+
+def best_time(function, texts: list[str], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        st = time.perf_counter()
+        for text in texts:
+            function(text)
+        best = min(best, time.perf_counter() - st)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--cache",
+        nargs="*",
+        type=pathlib.Path,
+        default=[],
+        help="anifetch cache entries to take the frames from, e.g. ~/.local/share/anifetch/<hash>",
+    )
+    parser.add_argument(
+        "--fuzz", type=int, default=50000, help="random texts to compare"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--min-speedup", type=float, default=10)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    frame_corpora: dict[str, list[str]] = {}
+    for cache_dir in args.cache:
+        frames = load_frames(cache_dir)
+        if not frames:
+            print(f"[ERROR] No frames in {cache_dir}.")
+            sys.exit(1)
+        frame_corpora[f"cache {cache_dir.name[:8]}"] = list(frames.values())
+    if not frame_corpora:
+        frame_corpora["frames 80x40"] = [
+            chafa_like_frame(rng, 80, 40) for _ in range(10)
+        ]
+
+    fetch_outputs = [
+        file.read_text(encoding="utf-8") for file in sorted(FIXTURES.glob("*.txt"))
+    ]
+    fuzz_texts = [
+        "".join(rng.choice(PIECES) for _ in range(rng.randint(0, 16)))
+        for _ in range(args.fuzz)
+    ]
+
+    failed = False
+    corpora = {**frame_corpora, "fetch fixtures": fetch_outputs, "random": fuzz_texts}
+    for name, texts in corpora.items():
+        mismatches = compare(texts, name)
+        status = "ok  " if not mismatches else "FAIL"
+        print(f"{status} {name}: {len(texts)} texts, {mismatches} stripped differently")
+        failed = failed or mismatches > 0
+
+    for name, texts in {**frame_corpora, "fetch fixtures": fetch_outputs}.items():
+        size = sum(len(text) for text in texts) / len(texts) / 1024
+        new_time = best_time(ansi2txt, texts, args.repeat)
+        old_time = best_time(reference_ansi2txt, texts, args.repeat)
+        speedup = old_time / new_time
+        # the fetch outputs are too short to say much, only the frames have to reach the speedup
+        slow = name != "fetch fixtures" and speedup < args.min_speedup
+        status = "FAIL" if slow else "ok  "
+        print(
+            f"{status} {name} ({size:.1f} kB each): reference {old_time * 1000:8.2f} ms  regex {new_time * 1000:6.2f} ms  {speedup:6.1f}x"
+        )
+        failed = failed or slow
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
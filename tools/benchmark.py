@@ -49,18 +49,22 @@ def run_all():
         ("Fastfetch", "fastfetch", True),
         (
             "Anifetch (no cache, Neofetch)",
-            f"{py_name} -m anifetch {common_args} --force-render",
+            f"{py_name} -m anifetch {common_args} -nf --force-render",
             False,
         ),
-        ("Anifetch (cached, Neofetch)", f"{py_name} -m anifetch {common_args}", True),
+        (
+            "Anifetch (cached, Neofetch)",
+            f"{py_name} -m anifetch {common_args} -nf",
+            True,
+        ),
         (
             "Anifetch (no cache, Fastfetch)",
-            f"{py_name} -m anifetch {common_args} -ff --force-render",
+            f"{py_name} -m anifetch {common_args} --force-render",
             False,
         ),
         (
             "Anifetch (cached, Fastfetch)",
-            f"{py_name} -m anifetch {common_args} -ff",
+            f"{py_name} -m anifetch {common_args}",
             True,
         ),
     ]
@@ -0,0 +1,283 @@
+# tools/microbench.py
+
+"""
+Microbenchmarks of the code anifetch runs on every start and every frame.
+Runs offline: the stand-ins in tools/stubs/ replace chafa, ffmpeg, ffprobe and fastfetch, the fetch
+output corpus is tools/fixtures/fetch/ and the animation is rendered by the stub chafa into a
+temporary cache, so every run measures the same input.
+
+Results are written as JSON (to .benchmarks/ by default) so runs can be compared over time,
+--compare prints the change against an earlier results file.
+
+Usage: python tools/microbench.py [--only <name prefix> ...] [--output results.json] [--compare old.json]
+"""
+
+import argparse
+import datetime
+import io
+import itertools
+import json
+import os
+import pathlib
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import timeit
+from collections.abc import Callable
+
+TOOLS = pathlib.Path(__file__).resolve().parent
+ROOT = TOOLS.parent
+FIXTURES = TOOLS / "fixtures" / "fetch"
+RESULTS_DIR = ROOT / ".benchmarks"
+
+# the animation every run renders with the stub chafa: 60 columns, so 16 lines at 16:9
+ANIMATION_ARGS = ["-W", "60", "-r", "24", "--fixed-width", "--color-depth", "truecolor"]
+TERMINAL_WIDTH = 120
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT,
+            text=True,
+            stderr=subprocess.DEVNULL,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def measure(function, repeat: int) -> dict:
+    """Times function like timeit does: enough calls per sample to take ~0.2s, best and median of the samples per call."""
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    samples = [t / number for t in timer.repeat(repeat=repeat, number=number)]
+    return {
+        "median_us": statistics.median(samples) * 1e6,
+        "best_us": min(samples) * 1e6,
+        "calls": number,
+        "samples": repeat,
+    }
+
+
+def build_animation(work_dir: pathlib.Path):
+    """Renders the benchmark animation into a fresh cache in work_dir with the stubs. Returns (args, BASE_PATH, CACHE_PATH)."""
+    from anifetch.build import build_cache
+    from anifetch.cache import cache_lock, get_cache_path
+    from anifetch.cli import parse_args
+    from anifetch.utils import detect_media_type, import_asset, make_cache_args
+
+    BASE_PATH = work_dir / "data"
+    ASSET_PATH = BASE_PATH / "assets"
+    ASSET_PATH.mkdir(parents=True)
+    source = work_dir / "clip.mp4"
+    # the stub chafa draws the frames from the bytes of the file
+    source.write_bytes(b"anifetch microbench clip\n")
+
+    args = parse_args([str(source), *ANIMATION_ARGS])
+    args.sound_flag_given = False
+    args.chroma_flag_given = False
+    IS_IMAGE, _IS_GIF, _IS_VIDEO, IS_TRANSPARENT = detect_media_type(source)
+    args.filename = str(import_asset(source, ASSET_PATH))
+    cleaned_dict = make_cache_args(args)
+    with cache_lock(BASE_PATH, cleaned_dict["hash"]):
+        build_cache(
+            args, cleaned_dict, BASE_PATH, source, IS_IMAGE, IS_TRANSPARENT, False
+        )
+    return args, BASE_PATH, get_cache_path(BASE_PATH, cleaned_dict["hash"])
+
+
+def collect_benchmarks(work_dir: pathlib.Path) -> dict:
+    """{name: function} of everything to time, set up on the fixture corpus."""
+    from anifetch.ansi_process import expand_ansi_movement_seq
+    from anifetch.cache import cache_lock, load_frames, read_manifest, touch_cache
+    from anifetch.utils import (
+        get_fetch_output,
+        make_cache_args,
+        make_template_from_fetch_lines,
+        truncate_line,
+    )
+
+    args, BASE_PATH, CACHE_PATH = build_animation(work_dir)
+    frames = load_frames(CACHE_PATH)
+    frame_lines = [line for frame in frames.values() for line in frame.splitlines()]
+
+    fetch_outputs = {
+        file.stem: file.read_text(encoding="utf-8").splitlines()
+        for file in sorted(FIXTURES.glob("*.txt"))
+    }
+    expanded = {
+        name: expand_ansi_movement_seq(lines) for name, lines in fetch_outputs.items()
+    }
+    all_expanded = [line for lines in expanded.values() for line in lines]
+
+    benchmarks: dict[str, Callable[[], object]] = {}
+    for name, lines in fetch_outputs.items():
+        benchmarks[f"expand_ansi_movement_seq/{name}"] = lambda lines=lines: (
+            expand_ansi_movement_seq(lines)
+        )
+    for name, lines in expanded.items():
+        benchmarks[f"make_template_from_fetch_lines/{name}"] = lambda lines=lines: (
+            make_template_from_fetch_lines(lines, 4, 2, 60)
+        )
+    benchmarks["truncate_line/frame_lines"] = lambda: [
+        truncate_line(line, 40) for line in frame_lines
+    ]
+    benchmarks["truncate_line/fetch_lines"] = lambda: [
+        truncate_line(line, 30) for line in all_expanded
+    ]
+
+    def lookup():
+        # what run_anifetch does on a cache hit before it can play
+        cache_hash = make_cache_args(args)["hash"]
+        with cache_lock(BASE_PATH, cache_hash, shared=True):
+            if read_manifest(BASE_PATH, cache_hash) is not None:
+                load_frames(CACHE_PATH)
+        touch_cache(BASE_PATH, cache_hash)
+
+    benchmarks["cache/lookup"] = lookup
+    benchmarks["cache/load_frames"] = lambda: load_frames(CACHE_PATH)
+    benchmarks["cache/load_frames_read_all"] = lambda: [
+        len(frame) for frame in load_frames(CACHE_PATH).values()
+    ]
+    # the stub fastfetch replays fastfetch_default.txt, this is the process startup plus parsing
+    benchmarks["fetch/get_fetch_output"] = lambda: get_fetch_output(
+        True, "uninstalled", False, ""
+    )
+
+    benchmarks.update(renderer_benchmarks(frames, expanded["fastfetch_default"]))
+    return benchmarks
+
+
+def renderer_benchmarks(frames, fetch_lines: list[str]) -> dict:
+    from rich.console import Console
+
+    from anifetch import renderer as renderer_module
+    from anifetch.utils import make_template_from_fetch_lines
+
+    # the Renderer asks the terminal for its width, there is none while benchmarking
+    renderer_module.get_terminal_width = lambda: TERMINAL_WIDTH
+
+    height = len(frames[0].splitlines())
+    template, template_width = make_template_from_fetch_lines(fetch_lines, 4, 2, 60)
+    renderer = renderer_module.Renderer(
+        "",
+        "",
+        24,
+        0,
+        4,
+        64,
+        height,
+        len(fetch_lines),
+        height,
+        True,
+        template_width,
+        template,
+        frames,
+        True,
+        "uninstalled",
+        False,
+        False,
+        1,
+        False,
+        False,
+        None,
+        None,
+        60,
+        2,
+        refresh_interval=-1,
+        fetch_lines=fetch_lines,
+    )
+    # what rich's Live does on every refresh, minus the terminal
+    console = Console(
+        file=io.StringIO(),
+        force_terminal=True,
+        color_system="truecolor",
+        width=TERMINAL_WIDTH,
+        height=max(height, len(fetch_lines)),
+        legacy_windows=False,
+    )
+    playing = itertools.cycle(frames.values())
+
+    def draw():
+        renderer.draw_stuff(next(playing))
+
+    def draw_and_render():
+        renderer.draw_stuff(next(playing))
+        console.file.seek(0)
+        console.file.truncate()
+        console.print(renderer.layout, end="")
+
+    return {
+        "renderer/draw_stuff": draw,
+        "renderer/draw_stuff_and_render": draw_and_render,
+    }
+
+
+def compare(results: dict, old_path: pathlib.Path):
+    old = json.loads(old_path.read_text(encoding="utf-8"))
+    print(
+        f"\nCompared to {old_path} (commit {old.get('commit')}, {old.get('created')}):"
+    )
+    for name, result in results.items():
+        previous = old["results"].get(name)
+        if previous is None:
+            print(f"  {name:<48} new")
+            continue
+        change = result["median_us"] / previous["median_us"]
+        print(
+            f"  {name:<48} {previous['median_us']:10.1f} us -> {result['median_us']:10.1f} us  {change:5.2f}x"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--only", nargs="*", default=[], help="only run benchmarks starting with these"
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", type=pathlib.Path)
+    parser.add_argument("--compare", type=pathlib.Path)
+    args = parser.parse_args()
+
+    if os.name == "nt":
+        print(
+            "[ERROR] The stubs in tools/stubs/ are scripts with a shebang, this needs Linux or macOS."
+        )
+        sys.exit(1)
+    os.environ["PATH"] = f"{TOOLS / 'stubs'}{os.pathsep}{os.environ['PATH']}"
+
+    with tempfile.TemporaryDirectory(prefix="anifetch-microbench-") as work_dir:
+        benchmarks = collect_benchmarks(pathlib.Path(work_dir))
+        results = {}
+        for name, function in benchmarks.items():
+            if args.only and not any(name.startswith(prefix) for prefix in args.only):
+                continue
+            results[name] = measure(function, args.repeat)
+            print(
+                f"{name:<48} {results[name]['median_us']:10.1f} us  (best {results[name]['best_us']:.1f} us, {results[name]['calls']} calls x {args.repeat})"
+            )
+
+    report = {
+        "created": datetime.datetime.now(datetime.UTC).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    output = args.output
+    if output is None:
+        stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        output = RESULTS_DIR / f"microbench-{stamp}-{report['commit'] or 'nogit'}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
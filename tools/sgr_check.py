@@ -0,0 +1,162 @@
+# tools/sgr_check.py
+
+"""
+Differential check and size report of the SGR minimisation in sgr.py.
+Every frame is rendered to a grid of cells (character, colours and styles) with rich, before and
+after minimize_sgr, and the grids have to be identical. Frames are rendered twice: as a whole,
+where the colours carry over to the next line like in the renderer, and line by line from a reset
+like the daemon client draws them. Random lines of colour and style sequences are checked too.
+
+The generated frames (without --cache) are truecolor half blocks with both colours set whenever
+one changes and a reset at the end of every line, like chafa prints them.
+
+Usage: python tools/sgr_check.py [--cache <cache dir> ...] [--fuzz 20000]
+"""
+
+import argparse
+import math
+import pathlib
+import random
+import sys
+import time
+
+from rich.console import Console
+from rich.style import Style
+from rich.text import Text
+
+from anifetch.cache import load_frames
+from anifetch.sgr import minimize_sgr
+
+# pieces the random lines are made of
+SGR_PIECES = [
+    "0", "", "1", "2", "3", "4", "5", "7", "8", "9", "22", "23", "24", "25", "27", "28", "29",
+    "31", "32", "39", "41", "42", "49", "91", "101", "38;5;196", "48;5;21", "38;2;10;20;30",
+    "48;2;10;20;30", "38;2;200;100;0", "48;2;0;0;0", "58;2;1;2;3", "38;5", "38;2;1",
+]  # fmt: skip
+TEXT_PIECES = ["a", " ", "▀", "▄", "█", "é", "\x1b[?25l", "\x1b[K", "\x1b(B"]
+STYLES = ("bold", "dim", "italic", "underline", "blink", "reverse", "conceal", "strike")
+
+console = Console(
+    force_terminal=True, color_system="truecolor", width=400, legacy_windows=False
+)
+
+
+def cells(text: str) -> list[list[tuple]]:
+    """The cells rich draws text as, row by row: (character, colour, background, styles)."""
+
+    def color(c):
+        return None if c is None or c.is_default else c.triplet or c.number
+
+    grid = []
+    for line in console.render_lines(Text.from_ansi(text), pad=False, new_lines=False):
+        row = []
+        for segment in line:
+            style = segment.style or Style()
+            key = (
+                color(style.color),
+                color(style.bgcolor),
+                *(bool(getattr(style, name)) for name in STYLES),
+            )
+            row.extend((char, key) for char in segment.text)
+        grid.append(row)
+    return grid
+
+
+def same_cells(original: str, minimized: str) -> bool:
+    if cells(original) != cells(minimized):
+        return False
+    # the daemon client resets the colours after every line
+    return all(
+        cells(a) == cells(b)
+        for a, b in zip(original.split("\n"), minimized.split("\n"), strict=True)
+    )
+
+
+def chafa_like_frame(rng: random.Random, width: int, height: int) -> str:
+    """Half blocks of a smooth image with few colours, printed the way chafa prints them."""
+    levels = [0, 51, 102, 153, 204, 255]
+
+    def pixel(x: int, y: int) -> tuple[int, int, int]:
+        r, g, b = (
+            levels[int((math.sin(x / 7 + y / 5 + phase) + 1) * 2.99)]
+            for phase in (0, 2, 4)
+        )
+        return r, g, b
+
+    lines = []
+    offset = rng.randrange(10)
+    for row in range(height):
+        parts = []
+        previous = None
+        for x in range(width):
+            fg = pixel(x + offset, row * 2)
+            bg = pixel(x + offset, row * 2 + 1)
+            if (fg, bg) != previous:
+                parts.append("\x1b[38;2;{};{};{};48;2;{};{};{}m".format(*fg, *bg))
+                previous = (fg, bg)
+            parts.append("▀")
+        lines.append("".join(parts) + "\x1b[0m")
+    return "\x1b[?25l" + "\n".join(lines) + "\x1b[?25h"
+
+
+def fuzz_line(rng: random.Random) -> str:
+    parts = []
+    for _ in range(rng.randint(0, 20)):
+        if rng.random() < 0.5:
+            params = ";".join(rng.choice(SGR_PIECES) for _ in range(rng.randint(1, 3)))
+            parts.append(f"\x1b[{params}m")
+        else:
+            parts.append(rng.choice(TEXT_PIECES))
+    return "".join(parts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--cache",
+        nargs="*",
+        type=pathlib.Path,
+        default=[],
+        help="anifetch cache entries to take the frames from, e.g. ~/.local/share/anifetch/<hash>",
+    )
+    parser.add_argument("--fuzz", type=int, default=20000, help="random lines to check")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    corpora: dict[str, list[str]] = {}
+    for cache_dir in args.cache:
+        frames = load_frames(cache_dir)
+        if not frames:
+            print(f"[ERROR] No frames in {cache_dir}.")
+            sys.exit(1)
+        corpora[f"cache {cache_dir.name[:8]}"] = list(frames.values())
+    if not corpora:
+        corpora["chafa-like 80x40"] = [chafa_like_frame(rng, 80, 40) for _ in range(20)]
+    corpora["random lines"] = [fuzz_line(rng) for _ in range(args.fuzz)]
+
+    failed = False
+    for name, texts in corpora.items():
+        st = time.perf_counter()
+        minimized = [minimize_sgr(text) for text in texts]
+        took = time.perf_counter() - st
+
+        mismatches = [(a, b) for a, b in zip(texts, minimized) if not same_cells(a, b)]
+        for a, b in mismatches[:5]:
+            print(f"  {name}:\n    original:  {a!r}\n    minimized: {b!r}")
+        failed = failed or bool(mismatches)
+
+        before = sum(len(text.encode()) for text in texts)
+        after = sum(len(text.encode()) for text in minimized)
+        status = "ok  " if not mismatches else "FAIL"
+        print(
+            f"{status} {name}: {len(texts)} texts, {len(mismatches)} drawn differently, "
+            f"{before} -> {after} bytes ({(1 - after / before) * 100 if before else 0:.1f}% smaller), "
+            f"{took / len(texts) * 1000:.3f} ms each"
+        )
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+# tools/startup_budget.py
+
+"""
+Startup budget check for Anifetch.
+A cache hit should get to the first frame without importing anything heavy, this fails if
+a heavy module gets imported at startup again or if importing anifetch takes longer than the budget.
+It also times whole cache hits of a video rendered with the stand-ins in tools/stubs/ and fails if
+one starts ffprobe, ffmpeg or chafa: whether a hit can be played is decided by the cache manifest alone.
+
+Usage: python tools/startup_budget.py [--budget-ms 60] [--runs 7]
+"""
+
+import argparse
+import os
+import pathlib
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+TOOLS = pathlib.Path(__file__).resolve().parent
+ROOT = TOOLS.parent
+
+# modules only needed for rendering, playback or rarely used flags. They have to be imported lazily.
+HEAVY_MODULES = (
+    "rich",
+    "wcwidth",
+    "platformdirs",
+    "pynput",
+    "importlib.metadata",
+    "concurrent.futures",
+    "anifetch.build",
+    "anifetch.renderer",
+)
+
+# what a launch imports before deciding whether the cache has the animation, when no daemon serves it
+STARTUP_CODE = (
+    "import anifetch.client, anifetch.core; from anifetch.cli import parse_args"
+)
+
+
+def import_times(code: str) -> tuple[dict[str, int], int]:
+    """
+    Runs code in a fresh interpreter with -X importtime.
+    Returns {module: cumulative microseconds} and the time spent importing anifetch's modules and what they import.
+    """
+    env = dict(os.environ)
+    # measure with bytecode caching, like an installed anifetch
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        env=env,
+        check=True,
+    )
+    times: dict[str, int] = {}
+    total = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _self, cumulative, name = line[len("import time:") :].split("|")
+        times[name.strip()] = int(cumulative)
+        # nested imports are indented, top level ones already include them
+        is_top_level = not name[1:].startswith(" ")
+        if is_top_level and name.strip().split(".")[0] == "anifetch":
+            total += int(cumulative)
+    return times, total
+
+
+# processes only a cache miss may start, the stubs log when they are started
+MISS_ONLY_PROCESSES = ("ffprobe", "ffmpeg", "chafa")
+
+
+def cache_hit_times(runs: int) -> tuple[list[float], list[str]]:
+    """
+    Renders a clip with the stubs, then runs `anifetch clip --benchmark` (a cache hit that stops before playback) runs times.
+    Returns the wall time of each hit in seconds and the stubbed processes the hits started.
+    """
+    with tempfile.TemporaryDirectory(prefix="anifetch-startup-") as work_dir:
+        work_dir = pathlib.Path(work_dir)
+        env = {
+            **os.environ,
+            "PATH": f"{TOOLS / 'stubs'}{os.pathsep}{os.environ['PATH']}",
+            "PYTHONPATH": os.pathsep.join(
+                filter(None, [str(ROOT / "src"), os.environ.get("PYTHONPATH")])
+            ),
+            "XDG_DATA_HOME": str(work_dir / "data"),
+            "XDG_RUNTIME_DIR": str(work_dir),  # no daemon to ask
+        }
+        env.pop("PYTHONDONTWRITEBYTECODE", None)
+        clip = work_dir / "clip.mp4"
+        # the stub chafa draws the frames from the bytes of the file
+        clip.write_bytes(b"anifetch startup clip\n")
+        anifetch = [
+            sys.executable,
+            "-m",
+            "anifetch",
+            str(clip),
+            "-W",
+            "40",
+            "--fixed-width",
+            "--benchmark",
+        ]
+        subprocess.run(anifetch, env=env, check=True, stdout=subprocess.DEVNULL)
+
+        log = work_dir / "started.log"
+        env["STUB_LOG"] = str(log)
+        times = []
+        for _ in range(runs):
+            st = time.perf_counter()
+            subprocess.run(anifetch, env=env, check=True, stdout=subprocess.DEVNULL)
+            times.append(time.perf_counter() - st)
+        started = log.read_text(encoding="utf-8").split() if log.exists() else []
+    return times, started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--budget-ms", type=float, default=60)
+    parser.add_argument("--runs", type=int, default=7)
+    args = parser.parse_args()
+
+    import_times(STARTUP_CODE)  # warm up the bytecode cache
+    runs, totals = zip(*(import_times(STARTUP_CODE) for _ in range(args.runs)))
+
+    failed = False
+    imported = sorted(
+        {
+            name
+            for name in runs[0]
+            for heavy in HEAVY_MODULES
+            if name == heavy or name.startswith(heavy + ".")
+        }
+    )
+    if imported:
+        print(f"FAIL heavy modules imported at startup: {', '.join(imported)}")
+        failed = True
+    else:
+        print("ok   no heavy modules imported at startup")
+
+    total_ms = statistics.median(totals) / 1000
+    status = "ok  " if total_ms <= args.budget_ms else "FAIL"
+    print(
+        f"{status} importing anifetch took {total_ms:.1f} ms (median of {args.runs}), budget is {args.budget_ms:.0f} ms"
+    )
+    failed = failed or total_ms > args.budget_ms
+
+    if os.name == "nt":
+        print("skip cache hit, the stubs in tools/stubs/ need Linux or macOS")
+    else:
+        times, started = cache_hit_times(args.runs)
+        hit_ms = statistics.median(times) * 1000
+        spawned = sorted({name for name in started if name in MISS_ONLY_PROCESSES})
+        status = "FAIL" if spawned else "ok  "
+        print(
+            f"{status} a cache hit took {hit_ms:.1f} ms (median of {args.runs}, the stub fastfetch included)"
+            + (f" and started {', '.join(spawned)}" if spawned else "")
+        )
+        failed = failed or bool(spawned)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
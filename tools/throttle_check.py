@@ -0,0 +1,191 @@
+# tools/throttle_check.py
+
+"""
+Plays an animation through a slow link and checks that it stays on schedule.
+The link is a pseudo-terminal whose other end is read at --rate bytes per second, a local stand-in
+for a slow SSH or serial connection: once its buffer is full, writes to it block like writes to the
+link do. Both ways of playing are checked: the rich renderer of a standalone anifetch and the
+client of `anifetch --daemon`.
+
+The animation is played once. Playing it may take at most --max-slowdown times as long as it lasts,
+that includes starting, the fetch output and the last screen going through the link too.
+
+Usage: python tools/throttle_check.py [--rate 30000] [--frames 60] [--backend renderer client] [-- <more anifetch args>]
+"""
+
+import argparse
+import fcntl
+import json
+import os
+import pathlib
+import pty
+import select
+import struct
+import subprocess
+import sys
+import tempfile
+import termios
+import time
+
+TOOLS = pathlib.Path(__file__).resolve().parent
+ROOT = TOOLS.parent
+
+COLUMNS, LINES = 120, 30
+PLAYBACK_RATE = 10
+ANIMATION_ARGS = [
+    "-W",
+    "60",
+    "--fixed-width",
+    "--no-input-restore",
+    "-l",
+    "1",
+    "-pr",
+    str(PLAYBACK_RATE),
+]
+TIMEOUT = 120  # seconds
+
+
+def play_throttled(command: list[str], env: dict, rate: int) -> int:
+    """Runs command in a pseudo-terminal that's read at rate bytes per second until it exits. Returns the bytes read."""
+    master, slave = pty.openpty()
+    fcntl.ioctl(master, termios.TIOCSWINSZ, struct.pack("HHHH", LINES, COLUMNS, 0, 0))
+    process = subprocess.Popen(
+        command,
+        stdin=slave,
+        stdout=slave,
+        stderr=slave,
+        env=env,
+        start_new_session=True,
+    )
+    os.close(slave)
+
+    start = time.perf_counter()
+    received = 0
+    while True:
+        now = time.perf_counter() - start
+        if now > TIMEOUT:
+            process.kill()
+            print(f"[ERROR] anifetch was still playing after {TIMEOUT}s.")
+            sys.exit(1)
+
+        # read no more than the link would have carried by now
+        allowance = int(rate * now) - received
+        if allowance <= 0:
+            time.sleep(0.005)
+            continue
+        ready, _, _ = select.select([master], [], [], 0.05)
+        if not ready:
+            if process.poll() is not None:
+                break
+            continue
+        try:
+            data = os.read(master, min(allowance, 1 << 16))
+        except OSError:  # anifetch exited and closed the terminal
+            break
+        if not data:
+            break
+        received += len(data)
+    process.wait()
+    os.close(master)
+    return received
+
+
+def start_daemon(anifetch: list[str], env: dict) -> subprocess.Popen:
+    daemon = subprocess.Popen(
+        [*anifetch[:3], "--daemon"],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    socket_path = pathlib.Path(env["XDG_RUNTIME_DIR"]) / "anifetch.sock"
+    for _ in range(100):
+        if socket_path.exists():
+            return daemon
+        time.sleep(0.05)
+    daemon.kill()
+    print("[ERROR] The anifetch daemon didn't start.")
+    sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--rate", type=int, default=30000, help="bytes per second the link carries"
+    )
+    parser.add_argument(
+        "--frames", type=int, default=60, help="frames of the animation, played once"
+    )
+    parser.add_argument(
+        "--backend",
+        nargs="*",
+        default=["renderer", "client"],
+        choices=["renderer", "client"],
+    )
+    parser.add_argument("--max-slowdown", type=float, default=1.5)
+    parser.add_argument("anifetch_args", nargs="*")
+    args = parser.parse_args()
+
+    if os.name == "nt":
+        print(
+            "[ERROR] This needs a pseudo-terminal and the stubs in tools/stubs/, so Linux or macOS."
+        )
+        sys.exit(1)
+
+    failed = False
+    with tempfile.TemporaryDirectory(prefix="anifetch-throttle-") as work_dir:
+        work_dir = pathlib.Path(work_dir)
+        env = {
+            **os.environ,
+            "PATH": f"{TOOLS / 'stubs'}{os.pathsep}{os.environ['PATH']}",
+            "PYTHONPATH": os.pathsep.join(
+                filter(None, [str(ROOT / "src"), os.environ.get("PYTHONPATH")])
+            ),
+            "XDG_DATA_HOME": str(work_dir / "data"),
+            "XDG_RUNTIME_DIR": str(work_dir),  # where the daemon's socket goes
+            "STUB_FRAMES": str(args.frames),
+            "COLORTERM": "truecolor",
+        }
+        clip = work_dir / "clip.mp4"
+        # the stub chafa draws the frames from the bytes of the file
+        clip.write_bytes(b"anifetch throttle clip\n")
+        anifetch = [sys.executable, "-m", "anifetch", str(clip), *ANIMATION_ARGS]
+        anifetch += args.anifetch_args
+
+        # render it first, so only the playback goes through the link
+        subprocess.run(
+            [*anifetch, "--benchmark"], env=env, check=True, stdout=subprocess.DEVNULL
+        )
+        wanted = args.frames / PLAYBACK_RATE
+        print(
+            f"{args.frames} frames at {PLAYBACK_RATE} fps ({wanted:g}s), through a link of {args.rate} bytes/s:"
+        )
+        for backend in args.backend:
+            stats_path = work_dir / "stats.json"
+            command = anifetch
+            daemon = None
+            if backend == "renderer":
+                command = [*anifetch, "--stats", str(stats_path)]
+            else:
+                daemon = start_daemon(anifetch, env)
+            try:
+                start = time.perf_counter()
+                received = play_throttled(command, env, args.rate)
+                took = time.perf_counter() - start
+            finally:
+                if daemon is not None:
+                    daemon.terminate()
+                    daemon.wait()
+
+            slow = took > wanted * args.max_slowdown
+            failed = failed or slow
+            line = f"{'FAIL' if slow else 'ok  '} {backend:<9} played in {took:5.1f}s, {received} bytes went through"
+            if backend == "renderer":
+                stats = json.loads(stats_path.read_text(encoding="utf-8"))
+                line += f", {stats['dropped_frames']} frames dropped, {stats['skipped_frames']} never reached the terminal"
+            print(line)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+# tools/width_bench.py
+
+"""
+Checks and benchmarks the width measurement in width.py against calling wcwidth directly.
+The narrow glyph table has to agree with wcwidth, and measuring has to give the same widths,
+on animation frames and on the fetch outputs in tools/fixtures/fetch/. Without --cache, the
+frames are chafa-like ones for the ascii, block and braille symbol sets.
+
+Usage: python tools/width_bench.py [--cache <cache dir> ...] [--repeat 5]
+"""
+
+import argparse
+import pathlib
+import random
+import re
+import sys
+import time
+
+from wcwidth import wcswidth, wcwidth
+
+from anifetch.ansi2txt import ESCAPE_SEQUENCE, ansi2txt
+from anifetch.cache import load_frames
+from anifetch.utils import (
+    TruncationIndex,
+    get_character_width,
+    printable_len,
+    truncate_line,
+)
+from anifetch.width import NARROW_RANGES, text_width
+
+ESCAPE_RE = re.compile(ESCAPE_SEQUENCE)
+
+FIXTURES = pathlib.Path(__file__).parent / "fixtures" / "fetch"
+
+SYMBOLS = {
+    "ascii": " .:-=+*#%@",
+    "block": " ▁▂▃▄▅▆▇█▌▐▀▖▗▘▝▚▞",
+    "braille": "".join(chr(0x2800 + i) for i in range(0, 256, 7)),
+}
+
+
+def old_get_character_width(raw: str) -> int:
+    return wcswidth(ansi2txt(raw).replace("\n", "").replace("\r", "").replace("\t", ""))
+
+
+def old_printable_len(raw: str) -> int:
+    cleaned = ansi2txt(raw)
+    w = wcswidth(cleaned)
+    return w if w >= 0 else sum(max(wcwidth(c), 0) for c in cleaned)
+
+
+def old_truncate_line(line: str, max_width: int) -> str:
+    if max_width <= 0 or not line:
+        return ""
+    if old_get_character_width(line) <= max_width:
+        return line.replace("\n", "").replace("\r", "")
+    out: list[str] = []
+    width = 0
+    i = 0
+    while i < len(line) and width < max_width:
+        m = ESCAPE_RE.match(line, i)
+        if m:
+            out.append(m.group(0))
+            i = m.end()
+            continue
+        ch = line[i]
+        i += 1
+        w = max(wcwidth(ch), 0)
+        if width + w > max_width:
+            break
+        out.append(ch)
+        width += w
+    out.append("\x1b[0m")
+    return "".join(out).replace("\n", "").replace("\r", "")
+
+
+def chafa_like_frame(rng: random.Random, symbols: str, width: int, height: int) -> str:
+    lines = []
+    for _ in range(height):
+        cells = [
+            f"\x1b[38;2;{rng.randrange(256)};{rng.randrange(256)};{rng.randrange(256)}m{rng.choice(symbols)}"
+            for _ in range(width)
+        ]
+        lines.append("".join(cells) + "\x1b[0m")
+    return "\n".join(lines)
+
+
+def check_table() -> bool:
+    wrong = [
+        hex(code)
+        for start, end in NARROW_RANGES
+        for code in range(start, end + 1)
+        if wcwidth(chr(code)) != 1
+    ]
+    if wrong:
+        print(
+            f"FAIL narrow table has code points wcwidth doesn't measure as 1: {', '.join(wrong[:10])}"
+        )
+        return False
+    print("ok   narrow table agrees with wcwidth")
+    return True
+
+
+def check_same(name: str, lines: list[str]) -> bool:
+    widths = range(1, 90, 7)
+    for line in lines:
+        index = TruncationIndex(line)
+        same = (
+            get_character_width(line) == old_get_character_width(line)
+            and printable_len(line) == old_printable_len(line)
+            and all(
+                truncate_line(line, w)
+                == old_truncate_line(line, w)
+                == index.truncate(w)
+                for w in widths
+            )
+        )
+        if not same:
+            print(f"FAIL {name}: widths differ from wcwidth for {line!r}")
+            return False
+    return True
+
+
+def best_time(function, lines: list[str], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        st = time.perf_counter()
+        for line in lines:
+            function(line)
+        best = min(best, time.perf_counter() - st)
+    return best
+
+
+def bench(name: str, lines: list[str], repeat: int):
+    pairs = (
+        # the measuring alone, on text that has its escape sequences stripped already
+        (
+            "text_width",
+            lambda line: text_width(ansi2txt(line)),
+            lambda line: wcswidth(ansi2txt(line)),
+        ),
+        ("get_character_width", get_character_width, old_get_character_width),
+        ("printable_len", printable_len, old_printable_len),
+        (
+            "truncate_line",
+            lambda line: truncate_line(line, 40),
+            lambda line: old_truncate_line(line, 40),
+        ),
+    )
+    for label, new, old in pairs:
+        new_time = best_time(new, lines, repeat)
+        old_time = best_time(old, lines, repeat)
+        print(
+            f"     {name:<22} {label:<20} wcwidth {old_time * 1000:8.2f} ms  width.py {new_time * 1000:8.2f} ms  {old_time / new_time:5.1f}x"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--cache",
+        nargs="*",
+        type=pathlib.Path,
+        default=[],
+        help="anifetch cache entries to take the frames from, e.g. ~/.local/share/anifetch/<hash>",
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    corpora: dict[str, list[str]] = {}
+    for cache_dir in args.cache:
+        frames = load_frames(cache_dir)
+        if not frames:
+            print(f"[ERROR] No frames in {cache_dir}.")
+            sys.exit(1)
+        corpora[f"cache {cache_dir.name[:8]}"] = [
+            line for frame in frames.values() for line in frame.splitlines()
+        ]
+    if not corpora:
+        rng = random.Random(0)
+        for name, symbols in SYMBOLS.items():
+            frames = [chafa_like_frame(rng, symbols, 40, 20) for _ in range(20)]
+            corpora[f"frames {name}"] = [
+                line for frame in frames for line in frame.splitlines()
+            ]
+    corpora["fetch fixtures"] = [
+        line
+        for file in sorted(FIXTURES.glob("*.txt"))
+        for line in file.read_text(encoding="utf-8").splitlines()
+    ]
+
+    failed = not check_table()
+    for name, lines in corpora.items():
+        if check_same(name, lines):
+            print(f"ok   {name}: {len(lines)} lines measure the same as with wcwidth")
+        else:
+            failed = True
+    for name, lines in corpora.items():
+        bench(name, lines, args.repeat)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()